@@ -0,0 +1,103 @@
+import numpy as np
+
+from config import *
+
+
+def covered_seconds(starts, ends):
+    """
+    Total time covered by intervals sorted by start, counting overlaps once
+    """
+    if not len(starts):
+        return 0.0
+    # Each interval only adds what lies past the furthest end seen before it
+    reached = np.maximum.accumulate(np.concatenate([[starts[0]], ends[:-1]]))
+    return float(np.clip(ends - np.maximum(starts, reached), 0, None).sum())
+
+
+def speech_gaps(starts, ends):
+    """
+    Silent gaps between intervals sorted by start
+    """
+    if len(starts) < 2:
+        return np.zeros(0)
+    reached = np.maximum.accumulate(ends)[:-1]
+    return np.clip(starts[1:] - reached, 0, None)
+
+
+def conversation_analytics(conversation, duration=None, dead_air_seconds=DEAD_AIR_SECONDS):
+    """
+    Per-call talk figures from merged conversation turns, in one numpy pass
+
+    Talk time counts each speaker's overlapping turns once; `duration`
+    (the audio length, else the last turn's end) bounds silence. Dead air
+    is each silent gap of at least `dead_air_seconds`. An interruption is
+    a turn starting while another speaker is still talking, credited to
+    the speaker who cut in. A monologue is consecutive turns by the same
+    speaker.
+    """
+    if not conversation:
+        silence = duration or 0.0
+        dead_air = round(silence, 2) if silence >= dead_air_seconds else 0.0
+        return {
+            'talk_seconds': {},
+            'talk_ratio': {},
+            'words_per_minute': {},
+            'interruptions': {},
+            'speech_seconds': 0.0,
+            'silence_seconds': round(silence, 2),
+            'overlap_seconds': 0.0,
+            'dead_air': {'count': int(dead_air > 0), 'seconds': dead_air, 'longest_seconds': dead_air},
+            'longest_monologue': None,
+            'words': 0
+        }
+
+    starts = np.array([turn['start'] for turn in conversation], dtype=np.float64)
+    ends = np.array([turn['end'] for turn in conversation], dtype=np.float64)
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    speakers, codes = np.unique([conversation[i]['speaker'] for i in order], return_inverse=True)
+    words = np.array([len(conversation[i]['text'].split()) for i in order])
+
+    talk = np.array([covered_seconds(starts[codes == k], ends[codes == k]) for k in range(len(speakers))])
+    speech = covered_seconds(starts, ends)
+    duration = max(duration or 0.0, float(ends.max()))
+
+    gaps = np.concatenate([[starts[0]], speech_gaps(starts, ends), [duration - ends.max()]])
+    dead_air = gaps[gaps >= dead_air_seconds]
+
+    # Latest end of each speaker's turns before each turn; a later start by someone else is an interruption
+    latest = np.full((len(speakers), len(starts)), -np.inf)
+    latest[codes, np.arange(len(starts))] = ends
+    latest = np.maximum.accumulate(latest, axis=1)
+    before = np.concatenate([np.full((len(speakers), 1), -np.inf), latest[:, :-1]], axis=1)
+    before[codes, np.arange(len(starts))] = -np.inf  # A speaker can't interrupt themselves
+    interrupting = before.max(axis=0) > starts
+    interruptions = np.bincount(codes[interrupting], minlength=len(speakers))
+
+    run_starts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+    run_lengths = np.maximum.reduceat(ends, run_starts) - starts[run_starts]
+    longest = int(np.argmax(run_lengths))
+
+    spoken = np.bincount(codes, weights=words, minlength=len(speakers))
+    wpm = np.divide(spoken, talk / 60, out=np.zeros(len(speakers)), where=talk > 0)
+    names = [str(s) for s in speakers]
+    return {
+        'talk_seconds': {name: round(float(t), 2) for name, t in zip(names, talk)},
+        'talk_ratio': {name: round(float(t / talk.sum()), 3) if talk.sum() else 0.0 for name, t in zip(names, talk)},
+        'words_per_minute': {name: round(float(w), 1) for name, w in zip(names, wpm)},
+        'interruptions': {name: int(n) for name, n in zip(names, interruptions)},
+        'speech_seconds': round(speech, 2),
+        'silence_seconds': round(duration - speech, 2),
+        'overlap_seconds': round(float(talk.sum()) - speech, 2),
+        'dead_air': {
+            'count': int(len(dead_air)),
+            'seconds': round(float(dead_air.sum()), 2),
+            'longest_seconds': round(float(dead_air.max()), 2) if len(dead_air) else 0.0
+        },
+        'longest_monologue': {
+            'speaker': names[codes[run_starts[longest]]],
+            'start': round(float(starts[run_starts[longest]]), 2),
+            'seconds': round(float(run_lengths[longest]), 2)
+        },
+        'words': int(spoken.sum())
+    }
@@ -0,0 +1,241 @@
+import os
+
+import numpy as np
+
+from config import *
+
+DIARIZATION_RUNTIMES = ('torch', 'onnx', 'openvino')
+
+
+def split_cpu_threads(cpu_threads, parallel_stages=PARALLEL_STAGES):
+    """
+    (whisper, diarization) threads out of one replica's CPU budget
+
+    With parallel stages Whisper and Pyannote compute at the same time, so
+    they share the budget instead of each taking all of it.
+    """
+    if not parallel_stages or cpu_threads < 2:
+        return cpu_threads, cpu_threads
+    diarization = cpu_threads // 2
+    return cpu_threads - diarization, diarization
+
+
+class OnnxForward:
+    """
+    Stand-in for a torch module's `forward` that runs its exported ONNX graph
+    """
+    def __init__(self, session):
+        self.session = session
+        self.input_names = [i.name for i in session.get_inputs()]
+
+    def __call__(self, *inputs):
+        import torch
+
+        feeds = {
+            name: value.detach().cpu().numpy()
+            for name, value in zip(self.input_names, inputs)
+        }
+        outputs = [torch.from_numpy(o) for o in self.session.run(None, feeds)]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+
+class InferenceBackend:
+    """
+    Where and how both models run
+
+    Covers Whisper's device, compute type (e.g. int8 on CPU) and thread
+    budget, torch's intra/inter-op threads, and whether Pyannote's neural
+    networks (segmentation and speaker embedding) run in PyTorch or are
+    exported to ONNX Runtime ('onnx', or 'openvino' to prefer ONNX
+    Runtime's OpenVINO provider). Pyannote's clustering stays in Python.
+    """
+    def __init__(self, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE,
+                 whisper_cpu_threads=WHISPER_CPU_THREADS, whisper_num_workers=WHISPER_NUM_WORKERS,
+                 torch_threads=DIARIZATION_CPU_THREADS, torch_interop_threads=TORCH_INTEROP_THREADS,
+                 diarization_runtime=DIARIZATION_RUNTIME):
+        if diarization_runtime not in DIARIZATION_RUNTIMES:
+            raise ValueError(f"Unknown diarization runtime: {diarization_runtime}")
+        self.device = device
+        self.compute_type = compute_type
+        self.whisper_cpu_threads = whisper_cpu_threads
+        self.whisper_num_workers = whisper_num_workers
+        self.torch_threads = torch_threads
+        self.torch_interop_threads = torch_interop_threads
+        self.diarization_runtime = diarization_runtime
+        # What Pyannote actually ended up on (ONNX falls back to torch on failure)
+        self.active_diarization_runtime = None
+
+    def describe(self):
+        return {
+            'device': self.resolve_device(),
+            'compute_type': self.compute_type,
+            'whisper_cpu_threads': self.whisper_cpu_threads,
+            'whisper_num_workers': self.whisper_num_workers,
+            'torch_threads': self.torch_threads,
+            'torch_threads_applied': self.applied_torch_threads(),
+            'torch_interop_threads': self.torch_interop_threads,
+            'diarization_runtime': self.active_diarization_runtime or self.diarization_runtime
+        }
+
+    def resolve_device(self):
+        if self.device != 'auto':
+            return self.device
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    def applied_torch_threads(self):
+        """
+        Torch's intra-op thread count as actually set, None before torch is loaded
+        """
+        import sys
+        torch = sys.modules.get('torch')
+        return torch.get_num_threads() if torch else None
+
+    def configure_torch(self):
+        """
+        Pin torch's thread pools (Whisper's CTranslate2 pool is separate)
+
+        These are process-wide: every replica in a ModelPool shares them,
+        so replicas must all be built with the same `torch_threads`.
+        """
+        import torch
+
+        if self.torch_threads:
+            torch.set_num_threads(self.torch_threads)
+        if self.torch_interop_threads:
+            try:
+                torch.set_num_interop_threads(self.torch_interop_threads)
+            except RuntimeError:
+                # Only allowed once per process, before any parallel work
+                print("⚠️  Torch inter-op threads already set, keeping the current value")
+
+    def load_whisper(self, model_name, num_workers=None):
+        from faster_whisper import WhisperModel
+
+        return WhisperModel(
+            model_name,
+            device=self.resolve_device(),
+            compute_type=self.compute_type,
+            cpu_threads=self.whisper_cpu_threads,
+            num_workers=num_workers or self.whisper_num_workers
+        )
+
+    def load_diarization(self, hf_token):
+        import torch
+        from pyannote.audio import Pipeline
+
+        pipeline = Pipeline.from_pretrained(
+            DIARIZATION_MODEL,
+            use_auth_token=hf_token or HF_TOKEN
+        )
+
+        device = self.resolve_device()
+        if device == "cuda":
+            pipeline.to(torch.device("cuda"))
+            self.active_diarization_runtime = 'torch'
+        elif self.diarization_runtime != 'torch':
+            try:
+                self._use_onnx(pipeline)
+                self.active_diarization_runtime = self.diarization_runtime
+            except Exception as e:
+                print(f"⚠️  ONNX Runtime unavailable for Pyannote, using PyTorch: {e}")
+                self.active_diarization_runtime = 'torch'
+        else:
+            self.active_diarization_runtime = 'torch'
+        return pipeline
+
+    def _session(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.torch_threads:
+            options.intra_op_num_threads = self.torch_threads
+        options.inter_op_num_threads = 1
+
+        providers = ['CPUExecutionProvider']
+        if self.diarization_runtime == 'openvino':
+            if 'OpenVINOExecutionProvider' not in ort.get_available_providers():
+                raise RuntimeError("onnxruntime-openvino is not installed")
+            providers.insert(0, 'OpenVINOExecutionProvider')
+        return ort.InferenceSession(path, options, providers=providers)
+
+    def _export(self, module, name, inputs, input_names, dynamic_axes):
+        """
+        Export `module` to ONNX once and reuse the file afterwards
+        """
+        import torch
+
+        model_id = ''.join(c if c.isalnum() else '_' for c in DIARIZATION_MODEL)
+        path = os.path.join(ONNX_DIR, f"{model_id}_{name}.onnx")
+        if not os.path.exists(path):
+            print(f"📦 Exporting Pyannote {name} model to ONNX...")
+            os.makedirs(ONNX_DIR, exist_ok=True)
+            with torch.no_grad():
+                torch.onnx.export(
+                    module, inputs, path,
+                    input_names=input_names,
+                    dynamic_axes=dynamic_axes,
+                    opset_version=17
+                )
+        return path
+
+    def _onnx_forward(self, module, name, inputs, input_names, dynamic_axes):
+        """
+        ONNX Runtime replacement for `module.forward`, checked against PyTorch's output
+        """
+        import torch
+
+        path = self._export(module, name, inputs, input_names, dynamic_axes)
+        forward = OnnxForward(self._session(path))
+
+        with torch.no_grad():
+            expected = module(*inputs)
+        actual = forward(*inputs)
+        expected = expected if isinstance(expected, tuple) else (expected,)
+        actual = actual if isinstance(actual, tuple) else (actual,)
+        if len(expected) != len(actual) or not all(
+            np.allclose(e.numpy(), a.numpy(), atol=1e-3) for e, a in zip(expected, actual)
+        ):
+            raise RuntimeError(f"ONNX {name} output differs from PyTorch")
+        return forward
+
+    def _use_onnx(self, pipeline):
+        import torch
+
+        # Segmentation: a waveform chunk in, frame-wise speaker activations out
+        segmentation = pipeline._segmentation.model
+        segmentation.eval()
+        samples = int(pipeline._segmentation.duration * SAMPLE_RATE)
+        segmentation_forward = self._onnx_forward(
+            segmentation, 'segmentation',
+            (torch.randn(1, 1, samples),),
+            ['waveforms'],
+            {'waveforms': {0: 'batch', 2: 'samples'}}
+        )
+
+        # Embedding: the ResNet after the (torch) filterbank features, so
+        # the feature extraction never has to be exported
+        embedding = pipeline._embedding.model_
+        embedding.eval()
+        resnet = getattr(embedding, 'resnet', None)
+        if resnet is None:
+            raise RuntimeError(f"{type(embedding).__name__} embedding model is not supported")
+        with torch.no_grad():
+            fbank = embedding.compute_fbank(torch.randn(1, 1, samples))
+        resnet_forward = self._onnx_forward(
+            resnet, 'embedding',
+            (fbank, torch.ones(1, fbank.shape[1])),
+            ['fbank', 'weights'],
+            {'fbank': {0: 'batch', 1: 'frames'}, 'weights': {0: 'batch', 1: 'mask_frames'}}
+        )
+
+        def embedding_forward(fbank, weights=None):
+            if weights is None:
+                weights = torch.ones(fbank.shape[0], fbank.shape[1])
+            return resnet_forward(fbank, weights)
+
+        # Only swap once both networks exported and matched
+        segmentation.forward = segmentation_forward
+        resnet.forward = embedding_forward
+        print(f"✅ Pyannote networks running in ONNX Runtime ({self.diarization_runtime})")
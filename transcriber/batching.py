@@ -0,0 +1,184 @@
+import bisect
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from config import *
+
+
+class _Request:
+    def __init__(self, audio, chunks, language):
+        self.audio = audio
+        self.chunks = chunks
+        self.language = language
+        self.future = Future()
+
+
+class WhisperBatcher:
+    """
+    Packs speech chunks from several recordings into shared encoder batches
+
+    Callers block in `transcribe(audio)` while a background thread gathers
+    pending recordings until it has `batch_size` chunks or `max_wait`
+    seconds pass, runs them through one BatchedInferencePipeline call and
+    routes the segments back to their recordings. Unless WHISPER_LANGUAGE
+    is set, each recording's language is detected before it joins a
+    batch, and recordings in different languages are decoded separately.
+    """
+    def __init__(self, whisper_model, batch_size=WHISPER_BATCH_SIZE,
+                 max_wait=WHISPER_BATCH_MAX_WAIT, max_recordings=WHISPER_BATCH_MAX_RECORDINGS,
+                 chunk_seconds=30):
+        self.whisper_model = whisper_model
+        self.pipeline = BatchedInferencePipeline(model=whisper_model)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_recordings = max_recordings
+        # Cap speech regions at Whisper's 30 s window so each is one encoder input
+        self.vad_options = VadOptions(max_speech_duration_s=chunk_seconds)
+        self.chunk_samples = chunk_seconds * SAMPLE_RATE
+        self.batches = 0
+        self.recordings = 0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='whisper-batcher', daemon=True)
+        self._thread.start()
+
+    def speech_chunks(self, audio, regions=None):
+        """
+        Speech regions merged into chunks of at most 30 s (in samples)
+
+        `regions` are (start, end) samples from an earlier VAD pass;
+        without them VAD runs here.
+        """
+        if regions is None:
+            regions = [
+                (r['start'], r['end'])
+                for r in get_speech_timestamps(audio, self.vad_options, sampling_rate=SAMPLE_RATE)
+            ]
+        chunks = []
+        for start, end in regions:
+            if chunks and end - chunks[-1]['start'] <= self.chunk_samples:
+                chunks[-1]['end'] = end
+            else:
+                chunks.append({'start': start, 'end': end})
+        return chunks
+
+    def transcribe(self, audio, regions=None):
+        """
+        Transcribe a 16 kHz mono float32 array as part of the next batch
+        """
+        # VAD and language detection run on the caller's thread so they overlap with other batches
+        chunks = self.speech_chunks(audio, regions)
+        request = _Request(audio, chunks, self.detect_language(audio, chunks))
+        self._queue.put(request)
+        return request.future.result()
+
+    def detect_language(self, audio, chunks):
+        """
+        WHISPER_LANGUAGE, else the language of the recording's first 30 s of speech
+        """
+        if WHISPER_LANGUAGE or not chunks:
+            return WHISPER_LANGUAGE
+        pieces, length = [], 0
+        for chunk in chunks:
+            pieces.append(audio[chunk['start']:chunk['end']])
+            length += len(pieces[-1])
+            if length >= self.chunk_samples:
+                break
+        speech = np.concatenate(pieces)[:self.chunk_samples]
+        language, _, _ = self.whisper_model.detect_language(audio=speech)
+        return language
+
+    def close(self):
+        self._queue.put(None)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            chunks = len(first.chunks)
+            deadline = time.monotonic() + self.max_wait
+
+            # Keep collecting until the encoder batch is full or we've waited long enough
+            while chunks < self.batch_size and len(batch) < self.max_recordings:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)
+                    break
+                batch.append(request)
+                chunks += len(request.chunks)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        try:
+            # Recordings in different languages can't share a decode, so
+            # each language in the batch gets its own pipeline call
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.language, []).append(request)
+            for language, group in groups.items():
+                self._run_group(group, language)
+
+            self.batches += 1
+            self.recordings += len(batch)
+            print(f"📦 Whisper batch: {len(batch)} recordings, {sum(len(r.chunks) for r in batch)} chunks, "
+                  f"{len(groups)} language(s)")
+
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def _run_group(self, group, language):
+        offsets = []
+        clips = []
+        position = 0
+        for request in group:
+            offsets.append(position)
+            clips.extend(
+                {'start': position + c['start'], 'end': position + c['end']}
+                for c in request.chunks
+            )
+            position += len(request.audio)
+
+        results = [[] for _ in group]
+        if clips:
+            # Clips never cross recording boundaries, so every segment
+            # belongs to exactly one recording
+            segments, info = self.pipeline.transcribe(
+                np.concatenate([r.audio for r in group]),
+                batch_size=self.batch_size,
+                vad_filter=False,
+                clip_timestamps=clips,
+                language=language
+            )
+            language = info.language
+            offset_seconds = [o / SAMPLE_RATE for o in offsets]
+            for s in segments:
+                index = bisect.bisect_right(offset_seconds, s.start) - 1
+                results[index].append({
+                    'start': s.start - offset_seconds[index],
+                    'end': s.end - offset_seconds[index],
+                    'text': s.text,
+                    'avg_logprob': s.avg_logprob,
+                    'no_speech_prob': s.no_speech_prob,
+                    'compression_ratio': s.compression_ratio
+                })
+
+        for request, segments in zip(group, results):
+            request.future.set_result({'segments': segments, 'language': language or 'en'})
@@ -0,0 +1,947 @@
+"""
+Offline, reproducible benchmarks of the transcription pipeline
+
+Each subcommand measures one part of the service:
+
+    pipeline   the whole pipeline (or the API) over a synthetic corpus
+    stages     sequential vs parallel transcribe/diarize on real recordings
+    backends   inference backends' speed and accuracy over a folder of WAVs
+    batching   Whisper throughput with and without cross-recording batches
+    memory     peak memory of windowed decoding on a multi-hour call
+    merge      sweep-line speaker assignment vs the per-segment scan
+    analytics  conversation_analytics vs a plain-Python reference
+    formats    size, encode and load time of the transcript formats
+    search     query latency of the search index at scale
+
+`pipeline` generates (once) a fixed corpus of synthetic two-speaker
+calls, runs it through `process_recording` or the FastAPI endpoints at a
+given concurrency and writes a JSON report: per-stage latency
+percentiles, real-time factor, throughput, peak RSS and CPU utilization.
+By default the models are stubs plugged in through a StubBackend: they
+find speech and speakers from the synthetic signal and sleep for a fixed
+share of the audio length, so runs need no network, GPU or model
+downloads and measure everything around the models. `--models real`
+uses the configured (already downloaded) models instead. With
+`--baseline old.json`, metrics are compared against an earlier report
+and the exit code is 1 if any got worse by more than `--tolerance`.
+
+The checking subcommands (memory, merge, analytics, search) also exit
+with 1 when a result is wrong or over its limit. Synthetic data and stub
+models come from synthetic.py, which the tests share.
+
+Usage:
+    python benchmark_suite.py pipeline --lengths 30,120,600 --concurrency 4 --json report.json
+    python benchmark_suite.py pipeline --target api --baseline report.json
+    python benchmark_suite.py memory --hours 3 --ceiling-mb 150
+    python benchmark_suite.py search --calls 100000 --index /tmp/search-bench.sqlite3
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from config import *
+from synthetic import (StubBackend, StubTranscriber, random_conversation, random_intervals,
+                       reference_analytics, scan_speakers, synth_call, synthetic_transcript,
+                       synthetic_transcripts, write_long_wav, write_wav)
+from transcriber import AudioTranscriber
+from utils import decode_audio, find_speakers_for_segments
+from writers import WRITERS, dumps, find_transcript, load_metadata, load_transcript, orjson, to_columns, write_transcript
+
+CORPUS_VERSION = 1
+PERCENTILES = (50, 90, 95, 99)
+
+# (metric path, True if higher is better) compared in baseline mode
+COMPARED = [
+    (('throughput', 'audio_seconds_per_second'), True),
+    (('latency', 'total', 'p50'), False),
+    (('latency', 'total', 'p95'), False),
+    (('real_time_factor', 'p50'), False),
+    (('peak_rss_mb',), False)
+]
+
+
+def save_report(report, path):
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Saved report: {path}")
+
+
+def fail_on(failures, success):
+    """
+    Print the failures and exit with 1, or print `success`
+    """
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        raise SystemExit(1)
+    print(f"✅ {success}")
+
+
+# --- Corpus ------------------------------------------------------------
+
+def load_corpus(corpus_dir, lengths, seed):
+    """
+    The corpus manifest, generating any calls that are missing
+
+    File names and contents depend only on length and seed, so every
+    machine benchmarks the same audio.
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    manifest_path = os.path.join(corpus_dir, 'manifest.json')
+    manifest = {'version': CORPUS_VERSION, 'calls': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != CORPUS_VERSION:
+            manifest = {'version': CORPUS_VERSION, 'calls': {}}
+
+    for index, seconds in enumerate(lengths):
+        name = f"call_{int(seconds)}s_seed{seed + index}.wav"
+        path = os.path.join(corpus_dir, name)
+        if name not in manifest['calls'] or not os.path.exists(path):
+            print(f"🎛️  Generating {name}...")
+            audio, turns = synth_call(seconds, seed + index)
+            write_wav(path, audio)
+            manifest['calls'][name] = {'seconds': seconds, 'seed': seed + index, 'turns': turns}
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return [
+        (os.path.join(corpus_dir, f"call_{int(s)}s_seed{seed + i}.wav"), s)
+        for i, s in enumerate(lengths)
+    ]
+
+
+# --- Pipeline --------------------------------------------------------
+
+def make_transcriber(args):
+    if args.models == 'real':
+        return AudioTranscriber(whisper_model=WHISPER_MODEL, hf_token=HF_TOKEN, use_cache=False)
+    # Silero VAD finds little "speech" in synthetic tones, so it is opt-in here
+    return AudioTranscriber(
+        whisper_model='stub',
+        use_cache=False,
+        shared_vad=args.shared_vad,
+        cascade_model=None,
+        backend=StubBackend(args.stub_whisper_rtf, args.stub_diarization_rtf)
+    )
+
+
+# --- Measurement -------------------------------------------------------
+
+class ResourceMonitor:
+    """
+    Peak resident memory and CPU time of this process (and its ffmpeg children)
+    """
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+
+    def _rss(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            # ru_maxrss is in KB on Linux (peak since process start)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self._rss())
+
+    def __enter__(self):
+        self.peak_rss = self._rss()
+        self._times = os.times()
+        self._wall = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self._rss())
+        times = os.times()
+        self.wall_seconds = time.perf_counter() - self._wall
+        self.cpu_seconds = sum(
+            getattr(times, name) - getattr(self._times, name)
+            for name in ('user', 'system', 'children_user', 'children_system')
+        )
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    summary = {
+        f"p{p}": round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 4)
+        for p in PERCENTILES
+    }
+    summary['mean'] = round(statistics.mean(ordered), 4)
+    summary['max'] = round(ordered[-1], 4)
+    return summary
+
+
+# --- Targets -----------------------------------------------------------
+
+def run_pipeline(args, work):
+    """
+    process_recording on every (path, seconds) item with `concurrency` threads
+    """
+    transcriber = make_transcriber(args)
+    output_dir = tempfile.mkdtemp(prefix='benchmark_output_')
+    transcriber.process_recording(work[0][0], output_dir=os.path.join(output_dir, 'warm-up'))
+
+    def one(task):
+        index, (path, seconds) = task
+        # One folder per task so concurrent runs of the same call don't collide
+        task_dir = os.path.join(output_dir, str(index))
+        started = time.perf_counter()
+        conversation = transcriber.process_recording(path, output_dir=task_dir)
+        latency = time.perf_counter() - started
+        if conversation is None:
+            return {'error': 'decode failed', 'seconds': seconds}
+        base_name = os.path.basename(path).rsplit('.', 1)[0]
+        saved = find_transcript(os.path.join(task_dir, f"{base_name}_transcript.txt"))
+        timings = load_metadata(saved)['timings']
+        return {'latency': latency, 'timings': timings, 'seconds': seconds}
+
+    with ResourceMonitor() as monitor:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(one, enumerate(work)))
+    return results, monitor
+
+
+def run_api(args, work):
+    """
+    POST /transcribe (upload) or /transcribe-from-path in-process, `concurrency` at a time
+    """
+    import httpx
+    import transcriber_api
+
+    pool = transcriber_api.model_pool
+    pool.factory = lambda index, cpu_threads, cache: make_transcriber(args)
+    pool.cache = None
+    pool.replica_count = args.replicas
+    pool.max_in_flight = max(1, -(-args.concurrency // args.replicas))
+    pool.load()
+
+    async def main():
+        transport = httpx.ASGITransport(app=transcriber_api.app)
+        limit = asyncio.Semaphore(args.concurrency)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+            async def one(item):
+                path, seconds = item
+                async with limit:
+                    started = time.perf_counter()
+                    if args.endpoint == 'upload':
+                        with open(path, 'rb') as f:
+                            files = {'file': (os.path.basename(path), f.read(), 'audio/wav')}
+                        response = await client.post('/transcribe', files=files)
+                    else:
+                        response = await client.post('/transcribe-from-path', json={'file_path': path})
+                    latency = time.perf_counter() - started
+                if response.status_code != 200:
+                    return {'error': f"HTTP {response.status_code}", 'seconds': seconds}
+                return {'latency': latency, 'timings': response.json()['metadata']['timings'], 'seconds': seconds}
+
+            await one(work[0])  # warm-up
+            with ResourceMonitor() as monitor:
+                results = await asyncio.gather(*(one(item) for item in work))
+            return results, monitor
+
+    return asyncio.run(main())
+
+
+# --- Report ------------------------------------------------------------
+
+def build_report(args, corpus, results, monitor):
+    ok = [r for r in results if 'error' not in r]
+    audio_seconds = sum(r['seconds'] for r in ok)
+    stages = sorted({name for r in ok for name in r['timings']})
+
+    latency = {'total': percentiles([r['latency'] for r in ok])}
+    for stage in stages:
+        if stage != 'total':
+            latency[stage] = percentiles([r['timings'][stage] for r in ok if stage in r['timings']])
+
+    return {
+        'config': {
+            'target': args.target,
+            'endpoint': args.endpoint if args.target == 'api' else None,
+            'models': args.models,
+            'concurrency': args.concurrency,
+            'repeat': args.repeat,
+            'corpus': [os.path.basename(path) for path, _ in corpus],
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count()
+        },
+        'requests': len(results),
+        'errors': len(results) - len(ok),
+        'audio_seconds': round(audio_seconds, 1),
+        'wall_seconds': round(monitor.wall_seconds, 3),
+        'throughput': {
+            'audio_seconds_per_second': round(audio_seconds / monitor.wall_seconds, 3),
+            'requests_per_second': round(len(ok) / monitor.wall_seconds, 3)
+        },
+        'latency': latency,
+        'real_time_factor': percentiles([r['latency'] / r['seconds'] for r in ok]),
+        'peak_rss_mb': round(monitor.peak_rss / 1024 / 1024, 1),
+        'cpu_seconds': round(monitor.cpu_seconds, 3),
+        'cpu_utilization': round(monitor.cpu_seconds / monitor.wall_seconds / (os.cpu_count() or 1), 3)
+    }
+
+
+def metric(report, path):
+    for key in path:
+        report = (report or {}).get(key)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Print current vs baseline and return the metrics that regressed
+    """
+    regressions = []
+    print(f"\n{'metric':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    print(f"{'-'*72}")
+    for path, higher_is_better in COMPARED:
+        old, new = metric(baseline, path), metric(report, path)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = '❌' if worse > tolerance else '  '
+        name = '.'.join(path)
+        print(f"{name:<40} {old:>10.3f} {new:>10.3f} {change:>+7.1%} {flag}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def pipeline_command(args):
+    lengths = [float(s) for s in args.lengths.split(',')]
+    corpus = load_corpus(os.path.abspath(args.corpus), lengths, args.seed)
+    work = corpus * args.repeat
+
+    run = run_pipeline if args.target == 'pipeline' else run_api
+    results, monitor = run(args, work)
+    report = build_report(args, corpus, results, monitor)
+
+    print(f"\n📊 {report['requests']} requests ({report['errors']} errors), "
+          f"{report['audio_seconds']:.0f}s of audio in {report['wall_seconds']:.1f}s")
+    print(f"   Throughput: {report['throughput']['audio_seconds_per_second']:.1f} audio-s/s, "
+          f"RTF p50 {report['real_time_factor']['p50']:.3f}")
+    for stage, summary in report['latency'].items():
+        print(f"   {stage:<12} p50 {summary['p50']:>8.3f}s   p95 {summary['p95']:>8.3f}s   max {summary['max']:>8.3f}s")
+    print(f"   Peak RSS {report['peak_rss_mb']:.0f}MB, CPU {report['cpu_utilization']:.0%} of {os.cpu_count()} cores")
+    save_report(report, args.json)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            raise SystemExit(1)
+        print("\n✅ No regressions against the baseline")
+
+
+# --- Stages ------------------------------------------------------------
+
+STAGES = ['decode', 'vad', 'transcribe', 'diarize', 'merge', 'total']
+
+
+def stage_timings(transcriber, audio_files, parallel, runs):
+    """
+    Run every file `runs` times and summarize per-stage timings
+    """
+    transcriber.parallel_stages = parallel
+    samples = {stage: [] for stage in STAGES}
+
+    for audio_file in audio_files:
+        for _ in range(runs):
+            result = transcriber.transcribe_file(audio_file)
+            if result is None:
+                raise RuntimeError(f"Failed to decode {audio_file}")
+            for stage in STAGES:
+                samples[stage].append(result['metadata']['timings'].get(stage, 0))
+
+    return {
+        stage: {
+            'mean': round(statistics.mean(values), 3),
+            'min': round(min(values), 3),
+            'max': round(max(values), 3)
+        }
+        for stage, values in samples.items()
+    }
+
+
+def stages_command(args):
+    transcriber = AudioTranscriber(whisper_model=WHISPER_MODEL, hf_token=HF_TOKEN, use_cache=False)
+
+    # Warm up both models so the first timed run doesn't pay load costs
+    transcriber.transcribe_file(args.files[0])
+
+    report = {
+        'files': args.files,
+        'runs': args.runs,
+        'sequential': stage_timings(transcriber, args.files, parallel=False, runs=args.runs),
+        'parallel': stage_timings(transcriber, args.files, parallel=True, runs=args.runs)
+    }
+    report['speedup'] = round(report['sequential']['total']['mean'] / report['parallel']['total']['mean'], 2)
+
+    for name in ('sequential', 'parallel'):
+        print(f"\n{name.capitalize()} stages")
+        print(f"{'-'*50}")
+        for stage in STAGES:
+            timing = report[name][stage]
+            print(f"{stage:<12} mean {timing['mean']:>8.3f}s   min {timing['min']:>8.3f}s   max {timing['max']:>8.3f}s")
+    print(f"\n🚀 End-to-end speedup: {report['speedup']}x")
+    save_report(report, args.json)
+
+
+# --- Backends ----------------------------------------------------------
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word-level Levenshtein distance divided by the reference length
+    """
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            ))
+        previous = current
+    return previous[-1] / max(1, len(ref))
+
+
+def speaker_at(conversation, seconds):
+    for turn in conversation:
+        if turn['start'] <= seconds < turn['end']:
+            return turn['speaker']
+    return None
+
+
+def speaker_agreement(reference, candidate):
+    """
+    Share of reference turns whose speaker matches the candidate's at the turn midpoint
+    """
+    if not reference:
+        return None
+    matches = sum(
+        speaker_at(candidate, (turn['start'] + turn['end']) / 2) == turn['speaker']
+        for turn in reference
+    )
+    return matches / len(reference)
+
+
+def text_of(conversation):
+    return ' '.join(turn['text'] for turn in conversation)
+
+
+def run_backend(spec, files, threads):
+    from backends import InferenceBackend
+
+    compute_type, runtime = spec.split(':')
+    backend = InferenceBackend(
+        compute_type=compute_type,
+        diarization_runtime=runtime,
+        whisper_cpu_threads=threads,
+        torch_threads=threads
+    )
+
+    load_started = time.perf_counter()
+    transcriber = AudioTranscriber(whisper_model=WHISPER_MODEL, hf_token=HF_TOKEN,
+                                   use_cache=False, backend=backend)
+    load_seconds = time.perf_counter() - load_started
+    transcriber.warm_up()
+
+    results = {}
+    for audio_file in files:
+        audio = decode_audio(audio_file, SAMPLE_RATE)
+        result = transcriber.transcribe_file(audio_file, audio=audio)
+        results[audio_file] = {
+            'conversation': result['conversation'],
+            'timings': result['metadata']['timings'],
+            'audio_seconds': len(audio) / SAMPLE_RATE
+        }
+    return backend.describe(), load_seconds, results
+
+
+def backends_command(args):
+    files = sorted(glob.glob(os.path.join(args.corpus, '*.wav')))
+    if not files:
+        raise SystemExit(f"❌ No .wav files in {args.corpus}")
+    references = {}
+    for audio_file in files:
+        text_file = audio_file.rsplit('.', 1)[0] + '.txt'
+        if os.path.exists(text_file):
+            with open(text_file, encoding='utf-8') as f:
+                references[audio_file] = f.read()
+
+    report = {'files': files, 'backends': []}
+    baseline = None
+    for spec in args.backends.split(','):
+        print(f"\n{'='*60}\n⚙️  Backend {spec}\n{'='*60}")
+        described, load_seconds, results = run_backend(spec, files, args.threads)
+        baseline = baseline or results
+
+        audio_seconds = sum(r['audio_seconds'] for r in results.values())
+        total_seconds = sum(r['timings']['total'] for r in results.values())
+        wers = [
+            word_error_rate(references.get(f) or text_of(baseline[f]['conversation']), text_of(r['conversation']))
+            for f, r in results.items()
+        ]
+        agreements = [
+            speaker_agreement(baseline[f]['conversation'], r['conversation'])
+            for f, r in results.items()
+        ]
+        agreements = [a for a in agreements if a is not None]
+
+        report['backends'].append({
+            'spec': spec,
+            'backend': described,
+            'load_seconds': round(load_seconds, 2),
+            'real_time_factor': round(total_seconds / audio_seconds, 4),
+            'transcribe_seconds': round(sum(r['timings'].get('transcribe', 0) for r in results.values()), 2),
+            'diarize_seconds': round(sum(r['timings'].get('diarize', 0) for r in results.values()), 2),
+            'wer': round(sum(wers) / len(wers), 4),
+            'speaker_agreement': round(sum(agreements) / len(agreements), 4) if agreements else None
+        })
+
+    reference_name = 'reference transcripts' if references else f"'{report['backends'][0]['spec']}'"
+    print(f"\n{'backend':<20} {'RTF':>8} {'transcribe':>11} {'diarize':>9} {'WER':>7} {'speakers':>9}")
+    print(f"{'-'*68}")
+    for row in report['backends']:
+        agreement = f"{row['speaker_agreement']:.1%}" if row['speaker_agreement'] is not None else '-'
+        print(f"{row['spec']:<20} {row['real_time_factor']:>8.3f} {row['transcribe_seconds']:>10.1f}s "
+              f"{row['diarize_seconds']:>8.1f}s {row['wer']:>7.1%} {agreement:>9}")
+    print(f"\nWER against {reference_name}; speaker agreement against '{report['backends'][0]['spec']}'")
+    save_report(report, args.json)
+
+
+# --- Batching ----------------------------------------------------------
+
+def batching_command(args):
+    import torch
+    from faster_whisper import WhisperModel
+    from batching import WhisperBatcher
+
+    recordings = []
+    for audio_file in args.files:
+        audio = decode_audio(audio_file, SAMPLE_RATE)
+        if audio is None:
+            raise SystemExit(f"❌ Could not decode {audio_file}")
+        recordings.extend([audio] * args.copies)
+    audio_seconds = sum(len(a) for a in recordings) / SAMPLE_RATE
+
+    model = WhisperModel(
+        WHISPER_MODEL,
+        device="cuda" if torch.cuda.is_available() else "cpu",
+        cpu_threads=WHISPER_CPU_THREADS
+    )
+    batcher = WhisperBatcher(model, batch_size=args.batch_size, max_wait=args.max_wait,
+                             max_recordings=len(recordings))
+
+    def sequential():
+        for audio in recordings:
+            segments, _ = model.transcribe(audio, vad_filter=True)
+            list(segments)
+
+    def batched():
+        # Submit everything at once, like a burst of finished calls
+        with ThreadPoolExecutor(max_workers=len(recordings)) as pool:
+            list(pool.map(batcher.transcribe, recordings))
+
+    def throughput(name, func):
+        started = time.perf_counter()
+        func()
+        wall = time.perf_counter() - started
+        print(f"{name:<12} {wall:8.2f}s wall   {audio_seconds / wall:8.2f} audio-s/s")
+        return audio_seconds / wall
+
+    # Warm up so neither path pays first-call allocation costs
+    segments, _ = model.transcribe(recordings[0], vad_filter=True)
+    list(segments)
+
+    print(f"{len(recordings)} recordings, {audio_seconds:.1f}s of audio\n")
+    sequential_rate = throughput('sequential', sequential)
+    batched_rate = throughput('batched', batched)
+    print(f"\n🚀 Throughput gain: {batched_rate / sequential_rate:.2f}x ({batcher.batches} batches)")
+    batcher.close()
+
+
+# --- Memory ------------------------------------------------------------
+
+def memory_command(args):
+    from chunked import transcribe_in_windows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_long_wav(os.path.join(tmp, 'long_call.wav'), args.hours)
+        print(f"📁 {args.hours}h synthetic call: {os.path.getsize(path) / 1024 / 1024:.0f}MB on disk")
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        # Noisy embeddings, like real ones, so stitching has to tolerate some drift
+        transcription, diarization, _, audio_seconds = transcribe_in_windows(
+            StubTranscriber(noise=0.1), path, args.window, args.overlap
+        )
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    peak_mb = peak / 1024 / 1024
+    full_decode_mb = audio_seconds * SAMPLE_RATE * 4 / 1024 / 1024
+    speakers = {turn['speaker'] for turn in diarization}
+
+    print(f"⏱️  {time.perf_counter() - started:.1f}s for {audio_seconds / 3600:.2f}h of audio")
+    print(f"📈 Peak memory: {peak_mb:.0f}MB (full decode would hold {full_decode_mb:.0f}MB of samples)")
+    print(f"🗣️  {len(transcription['segments'])} segments, speakers across windows: {sorted(speakers)}")
+
+    failures = []
+    if peak_mb > args.ceiling_mb:
+        failures.append(f"peak memory {peak_mb:.0f}MB exceeds {args.ceiling_mb:.0f}MB")
+    if len(speakers) != 2:
+        failures.append(f"expected 2 stitched speakers, got {len(speakers)}")
+    starts = [s['start'] for s in transcription['segments']]
+    if starts != sorted(starts) or len(starts) != len(set(starts)):
+        failures.append("segments are duplicated or out of order at window seams")
+    fail_on(failures, "Memory stays bounded")
+
+
+# --- Merge -------------------------------------------------------------
+
+def merge_command(args):
+    rng = random.Random(args.seed)
+    segments = random_intervals(args.segments, args.duration, ['-'], rng)
+    diarization = random_intervals(args.turns, args.duration, ['SPEAKER_00', 'SPEAKER_01', 'SPEAKER_02'], rng)
+
+    started = time.perf_counter()
+    fast = find_speakers_for_segments(segments, diarization)
+    sweep_time = time.perf_counter() - started
+
+    sample = segments[:args.check]
+    started = time.perf_counter()
+    expected = scan_speakers(sample, diarization)
+    scan_time = time.perf_counter() - started
+
+    mismatches = sum(1 for a, b in zip(fast, expected) if a != b)
+    scan_estimate = scan_time * len(segments) / max(len(sample), 1)
+
+    print(f"Segments: {len(segments)}   Turns: {len(diarization)}")
+    print(f"Sweep-line:  {sweep_time:.3f}s for all segments")
+    print(f"Naive scan:  {scan_time:.3f}s for {len(sample)} segments (~{scan_estimate:.1f}s for all)")
+    print(f"Speedup:     ~{scan_estimate / sweep_time:.0f}x")
+    fail_on([f"{mismatches}/{len(sample)} speaker choices differ"] if mismatches else [],
+            f"Identical speaker choices on {len(sample)} segments")
+
+
+# --- Analytics ---------------------------------------------------------
+
+ANALYTICS_EDGE_CASES = {
+    'empty': ([], 30),
+    'single turn': ([{'start': 2, 'end': 5, 'speaker': 'Agent', 'text': 'hello there'}], None),
+    'turn inside another': ([
+        {'start': 0, 'end': 10, 'speaker': 'Agent', 'text': 'a long explanation'},
+        {'start': 3, 'end': 4, 'speaker': 'Customer', 'text': 'okay'}
+    ], 10),
+    'same speaker overlapping': ([
+        {'start': 0, 'end': 4, 'speaker': 'Agent', 'text': 'one'},
+        {'start': 3, 'end': 6, 'speaker': 'Agent', 'text': 'two'},
+        {'start': 12, 'end': 13, 'speaker': 'Customer', 'text': 'three'}
+    ], 20),
+    'unsorted turns': ([
+        {'start': 9, 'end': 11, 'speaker': 'Customer', 'text': 'b'},
+        {'start': 1, 'end': 8, 'speaker': 'Agent', 'text': 'a a a'}
+    ], 12)
+}
+
+
+def analytics_differences(result, expected):
+    """
+    Names of the figures where conversation_analytics disagrees with the reference
+    """
+    got = {key: result[key] for key in expected if key in result}
+    got['longest_monologue_seconds'] = result['longest_monologue']['seconds'] if result['longest_monologue'] else None
+    wrong = []
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            other = got[key]
+            if value.keys() != other.keys() or any(abs(value[k] - other[k]) > 0.011 for k in value):
+                wrong.append(key)
+        elif (value is None) != (got[key] is None) or (value is not None and abs(value - got[key]) > 0.011):
+            wrong.append(key)
+    return wrong
+
+
+def analytics_command(args):
+    from analytics import conversation_analytics
+
+    speakers = ['Agent', 'Customer', 'Supervisor']
+    cases = dict(ANALYTICS_EDGE_CASES)
+    for i in range(args.calls):
+        rng = random.Random(args.seed + i)
+        conversation = random_conversation(rng, args.turns, speakers if i % 4 == 0 else speakers[:2])
+        cases[f"random #{i}"] = (conversation, conversation[-1]['end'] + (i % 3) * 4)
+
+    failures = []
+    vectorized_time = reference_time = 0.0
+    for name, (conversation, duration) in cases.items():
+        started = time.perf_counter()
+        result = conversation_analytics(conversation, duration, dead_air_seconds=args.dead_air)
+        vectorized_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        expected = reference_analytics(conversation, duration, args.dead_air)
+        reference_time += time.perf_counter() - started
+
+        wrong = analytics_differences(result, expected)
+        if wrong:
+            failures.append(f"{name}: {', '.join(wrong)}")
+
+    print(f"Conversations: {len(cases)} ({args.turns} turns each when random)")
+    print(f"Vectorized:  {vectorized_time * 1000 / len(cases):.2f}ms per call")
+    print(f"Reference:   {reference_time * 1000 / len(cases):.2f}ms per call")
+    fail_on(failures[:20], f"Identical figures on {len(cases)} conversations")
+
+
+# --- Formats -----------------------------------------------------------
+
+def median_time(function, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        value = function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), value
+
+
+def compare_formats(conversation, metadata, runs):
+    """
+    Bytes, encode and load time of every format, plus API response sizes
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        output_file = os.path.join(folder, 'call_transcript.txt')
+        for fmt in WRITERS:
+            encode_seconds, path = median_time(lambda: write_transcript(output_file, conversation, metadata, fmt), runs)
+            load_seconds, loaded = median_time(lambda: load_transcript(path), runs)
+            if loaded['conversation'] != conversation:
+                raise RuntimeError(f"{fmt} did not round-trip")
+            rows.append({
+                'format': fmt,
+                'bytes': os.path.getsize(path),
+                'encode_ms': round(encode_seconds * 1000, 2),
+                'load_ms': round(load_seconds * 1000, 2)
+            })
+            os.remove(path)
+
+    result = {'status': 'success', 'metadata': metadata}
+    responses = {
+        'turns': dumps({**result, 'conversation': conversation}),
+        'columns': dumps({**result, **to_columns(conversation)})
+    }
+    response_sizes = {
+        layout: {'bytes': len(body), 'gzip_bytes': len(gzip.compress(body, 6))}
+        for layout, body in responses.items()
+    }
+    return rows, response_sizes
+
+
+def formats_command(args):
+    if args.files:
+        transcripts = [(os.path.basename(f), load_transcript(f)) for f in args.files]
+        transcripts = [(name, (t['conversation'], t['metadata'])) for name, t in transcripts]
+    else:
+        transcripts = [(f"synthetic ({args.turns} turns)", synthetic_transcript(args.turns))]
+
+    print(f"orjson: {'installed' if orjson else 'not installed (json module fallback)'}")
+    report = []
+    for name, (conversation, metadata) in transcripts:
+        rows, response_sizes = compare_formats(conversation, metadata, args.runs)
+        baseline = rows[0]
+
+        print(f"\n{name}")
+        print(f"{'format':<12} {'size':>10} {'vs json':>8} {'encode':>10} {'load':>10}")
+        print(f"{'-'*54}")
+        for row in rows:
+            print(f"{row['format']:<12} {row['bytes'] / 1024:>8.1f}KB {row['bytes'] / baseline['bytes']:>7.0%} "
+                  f"{row['encode_ms']:>8.2f}ms {row['load_ms']:>8.2f}ms")
+        for layout, sizes in response_sizes.items():
+            print(f"API response ({layout}): {sizes['bytes'] / 1024:.1f}KB, gzip {sizes['gzip_bytes'] / 1024:.1f}KB")
+
+        report.append({'transcript': name, 'turns': len(conversation), 'formats': rows, 'responses': response_sizes})
+    save_report(report, args.json)
+
+
+# --- Search ------------------------------------------------------------
+
+SEARCH_QUERIES = [
+    ('rare word', dict(query='chargeback')),
+    ('common word', dict(query='account')),
+    ('two words', dict(query='payment card')),
+    ('phrase', dict(query='thank you', phrase=True)),
+    ('prefix', dict(query='cancel*')),
+    ('speaker filter', dict(query='refund', speaker='Customer')),
+    ('relevance', dict(query='payment card', sort='relevance')),
+]
+
+
+def indexed_calls(path):
+    with sqlite3.connect(path) as db:
+        try:
+            return db.execute("SELECT COUNT(*) FROM calls").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+
+
+def search_command(args):
+    from search import TranscriptIndex
+
+    path = args.index or os.path.join(tempfile.mkdtemp(), 'search.sqlite3')
+    index = TranscriptIndex(path)
+    existing = indexed_calls(path)
+    if existing < args.calls:
+        print(f"📚 Indexing {args.calls - existing} synthetic calls ({args.turns} turns each)...")
+        started = time.perf_counter()
+        transcripts = synthetic_transcripts(args.calls, args.turns, args.seed)
+        for _ in range(existing):
+            next(transcripts)
+        while index.add_many(t for _, t in zip(range(5000), transcripts)):
+            pass
+        index.optimize()
+        print(f"   {time.perf_counter() - started:.1f}s, {os.path.getsize(path) / 1024 / 1024:.0f}MB on disk")
+    print(f"Calls indexed: {indexed_calls(path)}")
+
+    failures = []
+    print(f"\n{'query':<16} {'hits':>5} {'p50':>9} {'p95':>9} {'page 50':>9}")
+    print('-' * 52)
+    for name, query in SEARCH_QUERIES:
+        samples = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            hits, cursor = index.search(limit=20, **query)
+            samples.append((time.perf_counter() - started) * 1000)
+
+        # Follow the cursor 50 pages in, then time that page
+        for _ in range(49):
+            if cursor is None:
+                break
+            _, cursor = index.search(limit=20, cursor=cursor, **query)
+        page_ms = None
+        if cursor is not None:
+            started = time.perf_counter()
+            index.search(limit=20, cursor=cursor, **query)
+            page_ms = (time.perf_counter() - started) * 1000
+
+        p95 = statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else samples[0]
+        page_text = f"{page_ms:>7.2f}ms" if page_ms is not None else f"{'-':>9}"
+        print(f"{name:<16} {len(hits):>5} {statistics.median(samples):>7.2f}ms {p95:>7.2f}ms {page_text}")
+        if p95 > args.max_p95_ms:
+            failures.append(f"{name}: p95 {p95:.1f}ms over {args.max_p95_ms:.0f}ms")
+    fail_on(failures, f"Every query's p95 is under {args.max_p95_ms:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pipeline = commands.add_parser('pipeline', help='Whole pipeline or API over the synthetic corpus')
+    pipeline.add_argument('--corpus', default='./benchmark_corpus', help='Where the synthetic calls are kept')
+    pipeline.add_argument('--lengths', default='30,120,600', help='Call lengths in seconds')
+    pipeline.add_argument('--seed', type=int, default=7)
+    pipeline.add_argument('--repeat', type=int, default=2, help='Times each call is processed')
+    pipeline.add_argument('--target', choices=['pipeline', 'api'], default='pipeline')
+    pipeline.add_argument('--endpoint', choices=['upload', 'path'], default='upload', help='API endpoint to call')
+    pipeline.add_argument('--concurrency', type=int, default=2)
+    pipeline.add_argument('--replicas', type=int, default=1, help='Model replicas (API target)')
+    pipeline.add_argument('--models', choices=['stub', 'real'], default='stub')
+    pipeline.add_argument('--stub-whisper-rtf', type=float, default=0.05)
+    pipeline.add_argument('--stub-diarization-rtf', type=float, default=0.08)
+    pipeline.add_argument('--shared-vad', action='store_true', help='Run the shared VAD pass with stub models')
+    pipeline.add_argument('--json', help='Write the report to this JSON file')
+    pipeline.add_argument('--baseline', help='Earlier report to compare against')
+    pipeline.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression')
+    pipeline.set_defaults(run=pipeline_command)
+
+    stages = commands.add_parser('stages', help='Sequential vs parallel stages on real recordings')
+    stages.add_argument('files', nargs='+', help='Audio files to process')
+    stages.add_argument('--runs', type=int, default=3, help='Runs per file and mode')
+    stages.add_argument('--json', help='Write the report to this JSON file')
+    stages.set_defaults(run=stages_command)
+
+    backends = commands.add_parser('backends', help='Speed and accuracy of inference backends')
+    backends.add_argument('corpus', help='Folder of .wav files (with optional .txt references)')
+    backends.add_argument('--backends', default='default:torch,int8:torch,int8:onnx',
+                          help='Comma-separated compute_type:diarization_runtime pairs')
+    backends.add_argument('--threads', type=int, default=0, help='CPU threads per model (0 = library default)')
+    backends.add_argument('--json', help='Write the report to this JSON file')
+    backends.set_defaults(run=backends_command)
+
+    batching = commands.add_parser('batching', help='Whisper throughput with and without batching')
+    batching.add_argument('files', nargs='+', help='Audio files to transcribe')
+    batching.add_argument('--copies', type=int, default=1, help='Times each file is queued')
+    batching.add_argument('--batch-size', type=int, default=WHISPER_BATCH_SIZE)
+    batching.add_argument('--max-wait', type=float, default=WHISPER_BATCH_MAX_WAIT)
+    batching.set_defaults(run=batching_command)
+
+    memory = commands.add_parser('memory', help='Peak memory of windowed decoding')
+    memory.add_argument('--hours', type=float, default=2)
+    memory.add_argument('--ceiling-mb', type=float, default=150)
+    memory.add_argument('--window', type=float, default=CHUNK_SECONDS)
+    memory.add_argument('--overlap', type=float, default=CHUNK_OVERLAP_SECONDS)
+    memory.set_defaults(run=memory_command)
+
+    merge = commands.add_parser('merge', help='Sweep-line speaker assignment vs the per-segment scan')
+    merge.add_argument('--segments', type=int, default=10000)
+    merge.add_argument('--turns', type=int, default=10000)
+    merge.add_argument('--duration', type=float, default=3600, help='Call length in seconds')
+    merge.add_argument('--check', type=int, default=1000, help='Segments compared against the scan (it is slow)')
+    merge.add_argument('--seed', type=int, default=0)
+    merge.set_defaults(run=merge_command)
+
+    analytics = commands.add_parser('analytics', help='conversation_analytics vs the reference')
+    analytics.add_argument('--calls', type=int, default=200, help='Random conversations to check')
+    analytics.add_argument('--turns', type=int, default=400, help='Turns per random conversation')
+    analytics.add_argument('--dead-air', type=float, default=5.0)
+    analytics.add_argument('--seed', type=int, default=0)
+    analytics.set_defaults(run=analytics_command)
+
+    formats = commands.add_parser('formats', help='Size, encode and load time of transcript formats')
+    formats.add_argument('files', nargs='*', help='Saved transcripts to use instead of a synthetic one')
+    formats.add_argument('--turns', type=int, default=2000, help='Turns in the synthetic transcript')
+    formats.add_argument('--runs', type=int, default=5)
+    formats.add_argument('--json', help='Write the report to this JSON file')
+    formats.set_defaults(run=formats_command)
+
+    search = commands.add_parser('search', help='Search index query latency at scale')
+    search.add_argument('--calls', type=int, default=100000)
+    search.add_argument('--turns', type=int, default=40, help='Turns per synthetic call')
+    search.add_argument('--index', help='Index file to fill or reuse (default: a temporary file)')
+    search.add_argument('--runs', type=int, default=20, help='Timed runs per query')
+    search.add_argument('--max-p95-ms', type=float, default=50)
+    search.add_argument('--seed', type=int, default=0)
+    search.set_defaults(run=search_command)
+
+    args = parser.parse_args()
+    args.run(args)
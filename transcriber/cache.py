@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import *
+
+# Bump when the shape of cached results changes
+CACHE_VERSION = 1
+
+
+def hash_audio(source, chunk_size=1 << 20):
+    """
+    SHA-256 of an audio file path, raw file bytes or a binary file object
+
+    A list of sources (e.g. per-speaker tracks) gets one combined hash.
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, list):
+        for item in source:
+            digest.update(hash_audio(item, chunk_size).encode('ascii'))
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    elif hasattr(source, 'read'):
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            digest.update(chunk)
+        source.seek(0)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_fingerprint(**settings):
+    """
+    Short hash of everything besides the audio that changes the output
+    """
+    settings = {
+        'version': CACHE_VERSION,
+        'diarization_model': DIARIZATION_MODEL,
+        'speaker_labels': SPEAKER_LABELS,
+        **settings
+    }
+    encoded = json.dumps(settings, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class TranscriptCache:
+    """
+    Persistent SQLite cache of transcription results
+
+    Entries are keyed by audio hash + config fingerprint and evicted when
+    older than `max_age` seconds, or least-recently-used first once the
+    cache holds more than `max_entries` results or `max_bytes` of JSON.
+    """
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES,
+                 max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # VAD speech maps share the table but are counted apart from transcripts
+        self.vad_hits = 0
+        self.vad_misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON transcripts (accessed_at)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(audio_hash, fingerprint):
+        return f"{audio_hash}:{fingerprint}"
+
+    def get(self, key, kind='transcript'):
+        """
+        Cached result for `key`, or None
+
+        `kind` is 'transcript' or 'vad', for the hit/miss counters.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result FROM transcripts WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                if kind == 'vad':
+                    self.vad_misses += 1
+                else:
+                    self.misses += 1
+                return None
+
+            self._db.execute("UPDATE transcripts SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            if kind == 'vad':
+                self.vad_hits += 1
+            else:
+                self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        """
+        Store a result and evict old entries if over the limits
+        """
+        encoded = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM transcripts WHERE created_at < ?", (now - self.max_age,))
+
+        count, total = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk from least recently used until both limits are met
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM transcripts ORDER BY accessed_at"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+        self._db.executemany("DELETE FROM transcripts WHERE key = ?", evicted)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        vad_lookups = self.vad_hits + self.vad_misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+            'vad': {
+                'hits': self.vad_hits,
+                'misses': self.vad_misses,
+                'hit_rate': round(self.vad_hits / vad_lookups, 3) if vad_lookups else 0
+            },
+            'entries': count,
+            'bytes': total
+        }
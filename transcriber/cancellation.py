@@ -0,0 +1,65 @@
+import threading
+import time
+
+import metrics
+
+
+class Cancelled(Exception):
+    """Raised inside a transcription once its token is cancelled or past its deadline"""
+
+    def __init__(self, reason):
+        super().__init__(f"Transcription cancelled ({reason})")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Shared flag telling a transcription to stop early
+
+    Set by whoever is waiting for the result (a disconnected client, a
+    cancelled job) or by its deadline passing. The pipeline calls `check()`
+    between stages, between Whisper segments and, through `hook`, between
+    Pyannote steps and embedding batches, so work stops within about one
+    segment or batch and the replica is freed.
+    """
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason = None
+        self.stage = None  # Stage that was running when the work stopped
+        self._event = threading.Event()
+
+    def cancel(self, reason='cancelled'):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel('deadline')
+        return self._event.is_set()
+
+    def remaining(self):
+        """
+        Seconds left before the deadline, None without one
+        """
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def hook(self, *args, **kwargs):
+        """
+        Pyannote pipeline hook: raising here aborts diarization mid-way
+        """
+        self.check()
+
+
+def record_cancelled(error, stage, seconds):
+    """
+    Count work stopped by `error` (a Cancelled) during `stage`
+    """
+    metrics.CANCELLED.inc(reason=error.reason, stage=stage or 'queued')
+    metrics.CANCELLED_SECONDS.inc(seconds)
+    print(f"🛑 Stopped during {stage or 'queue'} after {seconds:.1f}s ({error.reason})")
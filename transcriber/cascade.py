@@ -0,0 +1,117 @@
+import time
+
+from config import *
+import metrics
+
+
+def combine_stats(stats):
+    """
+    Add up cascade stats from several transcriptions (channels or windows)
+    """
+    stats = [s for s in stats if s]
+    if not stats:
+        return None
+    return {key: sum(s[key] for s in stats) for key in stats[0]}
+
+
+class CascadeDecoder:
+    """
+    Re-decodes only the weak parts of a fast model's transcript with a larger model
+
+    A segment is weak when Whisper itself is unsure of it: low average
+    log-probability, a high chance the audio is not speech, or repetitive
+    text (high compression ratio, a sign of hallucination). Runs of
+    neighbouring weak segments are cut from the audio, transcribed again
+    by the larger model and spliced back in place of the originals.
+    """
+    def __init__(self, model, min_avg_logprob=CASCADE_MIN_AVG_LOGPROB,
+                 max_no_speech_prob=CASCADE_MAX_NO_SPEECH_PROB,
+                 max_compression_ratio=CASCADE_MAX_COMPRESSION_RATIO,
+                 max_gap=CASCADE_MAX_GAP_SECONDS, beam_size=CASCADE_BEAM_SIZE):
+        self.model = model
+        self.min_avg_logprob = min_avg_logprob
+        self.max_no_speech_prob = max_no_speech_prob
+        self.max_compression_ratio = max_compression_ratio
+        self.max_gap = max_gap
+        self.beam_size = beam_size
+
+    def is_weak(self, segment):
+        return (
+            segment.get('avg_logprob', 0) < self.min_avg_logprob
+            or segment.get('no_speech_prob', 0) > self.max_no_speech_prob
+            or segment.get('compression_ratio', 0) > self.max_compression_ratio
+        )
+
+    def weak_runs(self, segments):
+        """
+        (first, last) indexes of consecutive weak segments, split at long pauses
+        """
+        runs = []
+        for i, segment in enumerate(segments):
+            if not self.is_weak(segment):
+                continue
+            if runs and runs[-1][1] == i - 1 and segment['start'] - segments[i - 1]['end'] <= self.max_gap:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+        return runs
+
+    def refine(self, audio, transcription):
+        """
+        Transcription of `audio` (16 kHz mono) with its weak segments re-decoded
+
+        The result carries a `cascade` dict of escalation stats.
+        """
+        segments = transcription['segments']
+        stats = {
+            'segments': len(segments),
+            'escalated_segments': 0,
+            'audio_seconds': len(audio) / SAMPLE_RATE,
+            'escalated_seconds': 0.0,
+            'seconds': 0.0
+        }
+        runs = self.weak_runs(segments)
+        if not runs:
+            return {**transcription, 'cascade': stats}
+
+        started = time.perf_counter()
+        refined = []
+        position = 0
+        for first, last in runs:
+            refined.extend(segments[position:first])
+            start, end = segments[first]['start'], segments[last]['end']
+            refined.extend(self._decode(audio, start, end, transcription.get('language')))
+            stats['escalated_segments'] += last - first + 1
+            stats['escalated_seconds'] += end - start
+            position = last + 1
+        refined.extend(segments[position:])
+        stats['seconds'] = time.perf_counter() - started
+
+        metrics.CASCADE_ESCALATED_SECONDS.inc(stats['escalated_seconds'])
+        print(f"🪜 Re-decoded {stats['escalated_segments']}/{len(segments)} segments "
+              f"({stats['escalated_seconds']:.1f}s of audio) with the larger model")
+        return {**transcription, 'segments': refined, 'cascade': stats}
+
+    def _decode(self, audio, start, end, language):
+        clip = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+        if not len(clip):
+            return []
+        segments, _ = self.model.transcribe(
+            clip,
+            language=language,
+            beam_size=self.beam_size,
+            vad_filter=False,
+            condition_on_previous_text=False
+        )
+        # Nothing back means the weak segment was a hallucination on noise
+        return [
+            {
+                'start': start + s.start,
+                'end': min(end, start + s.end),
+                'text': s.text,
+                'avg_logprob': s.avg_logprob,
+                'no_speech_prob': s.no_speech_prob,
+                'compression_ratio': s.compression_ratio
+            }
+            for s in segments
+        ]
@@ -0,0 +1,161 @@
+import math
+import time
+
+import numpy as np
+
+from cascade import combine_stats
+from config import *
+from utils import iter_audio_windows
+from voiceprints import label_clusters
+
+
+class SpeakerStitcher:
+    """
+    Maps per-window Pyannote speakers onto call-wide speakers
+
+    Pyannote labels speakers independently in every window, so SPEAKER_00
+    in one window may be SPEAKER_01 in the next. Each window's speaker
+    embeddings are matched to running call-wide centroids by cosine
+    similarity; speakers below `threshold` become new call-wide speakers.
+    """
+    def __init__(self, threshold=CHUNK_SPEAKER_THRESHOLD):
+        self.threshold = threshold
+        self.centroids = []
+        self.counts = []
+
+    def assign(self, embeddings):
+        """
+        `embeddings` maps window-local labels to vectors; returns local → global labels
+        """
+        labels = [label for label, vector in embeddings.items() if np.all(np.isfinite(vector))]
+        mapping = {}
+
+        if labels and self.centroids:
+            local = np.stack([embeddings[label] for label in labels])
+            local = local / np.linalg.norm(local, axis=1, keepdims=True)
+            known = np.stack(self.centroids)
+            known = known / np.linalg.norm(known, axis=1, keepdims=True)
+            similarity = local @ known.T
+
+            # Greedily pair the most similar local/global speakers first
+            taken = set()
+            for flat in np.argsort(-similarity, axis=None):
+                i, j = divmod(int(flat), similarity.shape[1])
+                if similarity[i, j] < self.threshold:
+                    break
+                if labels[i] in mapping or j in taken:
+                    continue
+                mapping[labels[i]] = j
+                taken.add(j)
+
+        for label in labels:
+            vector = embeddings[label]
+            if label in mapping:
+                j = mapping[label]
+                self.counts[j] += 1
+                self.centroids[j] = self.centroids[j] + (vector - self.centroids[j]) / self.counts[j]
+            else:
+                self.centroids.append(np.array(vector, dtype=np.float64))
+                self.counts.append(1)
+                mapping[label] = len(self.centroids) - 1
+
+        # Speakers with too little speech get NaN embeddings: give them the
+        # busiest known speaker rather than inventing a new one
+        for label in embeddings:
+            if label not in mapping:
+                mapping[label] = int(np.argmax(self.counts)) if self.counts else 0
+
+        return {label: f"SPEAKER_{j:02d}" for label, j in mapping.items()}
+
+
+def transcribe_in_windows(transcriber, source, window_seconds=CHUNK_SECONDS,
+                          overlap_seconds=CHUNK_OVERLAP_SECONDS, on_segment=None, cancel=None,
+                          voiceprint=None):
+    """
+    Transcribe and diarize a long recording in overlapping windows
+
+    Whisper timestamps are shifted by each window's offset, and speakers
+    are stitched across windows with SpeakerStitcher. Segments and turns
+    are kept by the window that owns their midpoint (the overlap is split
+    down the middle), so nothing is duplicated or dropped at the seams.
+
+    `transcriber` needs `run_stages(audio, return_embeddings=True)`.
+    `on_segment` gets each kept segment once its window is done, and
+    `cancel` is passed on to run_stages. With an agent's `voiceprint`, the
+    stitched call-wide speaker closest to it is named the agent (see
+    label_clusters) and the transcription reports it in `speaker_source`.
+    Returns (transcription, diarization, timings, audio_seconds).
+    """
+    stitcher = SpeakerStitcher()
+    segments = []
+    turns = []
+    language = None
+    timings = {'decode': 0.0, 'transcribe': 0.0, 'diarize': 0.0}
+    audio_seconds = 0.0
+    speech_seconds = None
+    cascade = []
+
+    windows = iter_audio_windows(source, window_seconds, overlap_seconds, SAMPLE_RATE)
+    while True:
+        waited = time.perf_counter()
+        window = next(windows, None)
+        timings['decode'] += time.perf_counter() - waited
+        if window is None:
+            break
+
+        start_sample, audio, is_last = window
+        offset = start_sample / SAMPLE_RATE
+        audio_seconds = offset + len(audio) / SAMPLE_RATE
+        if len(audio) == 0:
+            continue
+
+        own_start = offset + overlap_seconds / 2 if start_sample else 0
+        own_end = math.inf if is_last else offset + window_seconds - overlap_seconds / 2
+
+        def owned(item):
+            midpoint = (item['start'] + item['end']) / 2
+            return own_start <= midpoint < own_end
+
+        transcription, (window_turns, embeddings), stage_timings = transcriber.run_stages(
+            audio, return_embeddings=True, cancel=cancel
+        )
+        for name, seconds in stage_timings.items():
+            timings[name] = timings.get(name, 0) + seconds
+        language = language or transcription.get('language')
+        if 'speech_seconds' in transcription:
+            speech_seconds = (speech_seconds or 0) + transcription['speech_seconds']
+        cascade.append(transcription.get('cascade'))
+
+        for s in transcription['segments']:
+            shifted = {**s, 'start': s['start'] + offset, 'end': s['end'] + offset}
+            if owned(shifted):
+                segments.append(shifted)
+                if on_segment:
+                    on_segment(shifted)
+
+        speakers = stitcher.assign(embeddings)
+        for turn in window_turns:
+            shifted = {
+                'start': turn['start'] + offset,
+                'end': turn['end'] + offset,
+                'speaker': speakers.get(turn['speaker'], turn['speaker'])
+            }
+            if owned(shifted):
+                turns.append(shifted)
+
+        print(f"🧩 Window at {offset:.0f}s: {len(transcription['segments'])} segments, "
+              f"{len(set(speakers.values()))} speakers")
+
+    transcription = {'segments': segments, 'language': language or 'en'}
+    if voiceprint is not None:
+        centroids = {f"SPEAKER_{j:02d}": centroid for j, centroid in enumerate(stitcher.centroids)}
+        names = label_clusters(centroids, voiceprint)
+        for turn in turns:
+            turn['speaker'] = names.get(turn['speaker'], turn['speaker'])
+        transcription['speaker_source'] = 'diarization+voiceprint' if names else 'diarization'
+    if speech_seconds is not None:
+        transcription['speech_seconds'] = speech_seconds
+    cascade = combine_stats(cascade)
+    if cascade:
+        transcription['cascade'] = cascade
+    return transcription, turns, timings, audio_seconds
@@ -24,9 +24,149 @@ SPEAKER_LABELS = {
     'SPEAKER_01': 'Customer'
 }
 
+# Enrolled agent voiceprints: calls with a known agent are attributed by
+# embedding similarity instead of clustering
+VOICEPRINT_DIR = os.getenv('VOICEPRINT_DIR', './voiceprints')
+VOICEPRINT_LABELS = ['Agent', 'Customer']  # Enrolled agent, everyone else
+VOICEPRINT_THRESHOLD = float(os.getenv('VOICEPRINT_THRESHOLD', '0.5'))  # Cosine similarity that counts as the agent
+VOICEPRINT_WINDOW_SECONDS = 2.0
+VOICEPRINT_STEP_SECONDS = 1.0
+VOICEPRINT_MIN_SHARE = 0.1  # Fall back to clustering unless the agent speaks in this share of windows...
+VOICEPRINT_MAX_SHARE = 0.9  # ...and the other side in the rest
+VOICEPRINT_BATCH_SIZE = 32
+
+# Speaker of each channel (or track) in dual-channel recordings, which skip diarization
+CHANNEL_LABELS = ['Agent', 'Customer']
+
 # FastAPI settings
 FASTAPI_HOST = '0.0.0.0'
 FASTAPI_PORT = 8000
 
-# Max file size (50MB)
-MAX_FILE_SIZE = 50 * 1024 * 1024
\ No newline at end of file
+# Max upload size in MB (checked while the upload streams in)
+MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE_MB', '50')) * 1024 * 1024
+
+# Deadlines: requests may send a shorter one as X-Request-Timeout (seconds)
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', '600'))  # Synchronous endpoints, 0 for none
+DISCONNECT_POLL_SECONDS = 1.0  # How often a waiting request checks the client is still there
+
+# Base directory that relative recording paths from the Node server resolve against
+SERVER_BASE_DIR = os.getenv(
+    'SERVER_BASE_DIR',
+    '/home/ritik-maurya/Documents/Node/MCP_Call_Connect/webrtc-call-server'
+)
+
+# Background job queue
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))  # Jobs processed concurrently
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '100'))  # Max jobs waiting before 429
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', '3600'))  # Seconds finished jobs are kept
+JOB_CALLBACK_RETRIES = 3
+JOB_CALLBACK_WORKERS = 4  # Threads delivering callbacks, apart from the job workers
+
+# Job scheduling: priority class first, then shortest expected recording first
+JOB_PRIORITIES = ['high', 'normal', 'low']
+JOB_SHORTEST_FIRST = os.getenv('JOB_SHORTEST_FIRST', 'true').lower() == 'true'
+JOB_PRIORITY_STEP = float(os.getenv('JOB_PRIORITY_STEP', '7200'))  # Audio seconds one priority class outweighs
+JOB_AGING_RATE = float(os.getenv('JOB_AGING_RATE', '4'))  # Audio seconds of head start gained per second queued
+JOB_UNKNOWN_SECONDS = 300  # Assumed duration when the header can't be probed
+JOB_TIMEOUT_SECONDS = float(os.getenv('JOB_TIMEOUT_SECONDS', '0'))  # Cancel jobs unfinished this long after submission, 0 for none
+PROBE_FALLBACK_KBPS = 32  # Bit rate assumed for headers without duration or bit rate
+
+# Run Whisper and Pyannote on the same file concurrently
+PARALLEL_STAGES = os.getenv('PARALLEL_STAGES', 'true').lower() == 'true'
+WHISPER_CPU_THREADS = int(os.getenv('WHISPER_CPU_THREADS', '0'))  # 0 = CTranslate2 default
+DIARIZATION_CPU_THREADS = int(os.getenv('DIARIZATION_CPU_THREADS', '0'))  # 0 = torch default
+
+# Decode audio once into memory (ffmpeg pipe) instead of writing a WAV file
+IN_MEMORY_DECODE = os.getenv('IN_MEMORY_DECODE', 'true').lower() == 'true'
+SAMPLE_RATE = 16000
+
+# Pyannote diarization pipeline
+DIARIZATION_MODEL = 'pyannote/speaker-diarization-3.1'
+
+# Transcription result cache (keyed by audio content + model settings)
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_PATH = os.getenv('CACHE_PATH', './cache/transcripts.sqlite3')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '5000'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(500 * 1024 * 1024)))  # 500MB
+CACHE_MAX_AGE = int(os.getenv('CACHE_MAX_AGE', str(30 * 24 * 3600)))  # 30 days
+
+# Saved transcripts: any of json (pretty, via orjson when installed), ndjson.gz, columnar
+TRANSCRIPT_FORMATS = [f.strip() for f in os.getenv('TRANSCRIPT_FORMATS', 'json').split(',') if f.strip()]
+TRANSCRIPT_TEXT = os.getenv('TRANSCRIPT_TEXT', 'true').lower() == 'true'  # Also write the readable .txt
+TRANSCRIPT_GZIP_LEVEL = 6
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv('RESPONSE_GZIP_MIN_BYTES', '1024'))  # Gzip larger API responses when accepted
+
+# Full-text search over saved transcripts (search.py)
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', 'true').lower() == 'true'  # Index transcripts as they are saved
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', './cache/search.sqlite3')
+SEARCH_MAX_LIMIT = 100  # Most results one /search page returns
+
+# Conversation analytics in the metadata
+DEAD_AIR_SECONDS = float(os.getenv('DEAD_AIR_SECONDS', '5'))  # Silent gaps at least this long count as dead air
+
+# Batch processing (process_recordings.py)
+BATCH_MANIFEST = os.path.join(OUTPUT_DIR, 'manifest.json')
+BATCH_SUMMARY = os.path.join(OUTPUT_DIR, 'batch_summary.json')
+BATCH_PREFETCH = 2  # Files decoded ahead of the one being transcribed
+
+# Recordings watcher daemon (watcher.py)
+WATCH_SETTLE_SECONDS = float(os.getenv('WATCH_SETTLE_SECONDS', '3'))  # Unchanged this long = fully written
+WATCH_RESCAN_SECONDS = float(os.getenv('WATCH_RESCAN_SECONDS', '30'))  # Full rescan (the only check when polling)
+WATCH_QUEUE_SIZE = int(os.getenv('WATCH_QUEUE_SIZE', '4'))  # Recordings queued before the watcher holds back
+WATCH_CALLBACK_URL = os.getenv('WATCH_CALLBACK_URL')  # POSTed each finished recording, like /jobs callbacks
+
+# Model replicas for multi-core hosts (each loads its own Whisper + Pyannote)
+MODEL_REPLICAS = int(os.getenv('MODEL_REPLICAS', '1'))
+MODEL_CPU_THREADS = int(os.getenv('MODEL_CPU_THREADS', '0'))  # Per replica, 0 = cores / replicas
+WHISPER_NUM_WORKERS = int(os.getenv('WHISPER_NUM_WORKERS', '1'))  # Concurrent decodes per Whisper model
+MODEL_MAX_INFLIGHT = int(os.getenv('MODEL_MAX_INFLIGHT', '2'))  # Requests per replica before 429
+MODEL_RETRY_AFTER = int(os.getenv('MODEL_RETRY_AFTER', '30'))  # Seconds, until a call duration is measured
+
+# Live streaming transcription (WebSocket)
+STREAM_STEP_SECONDS = 1.0  # New audio needed before the window is decoded again
+STREAM_MAX_WINDOW_SECONDS = 20.0  # Force-finalize segments if nobody pauses this long
+STREAM_MIN_SILENCE_SECONDS = 0.6  # Pause that ends an utterance
+STREAM_BEAM_SIZE = 1
+
+# Batched Whisper inference across concurrently processed recordings
+WHISPER_BATCHING = os.getenv('WHISPER_BATCHING', 'false').lower() == 'true'
+WHISPER_BATCH_SIZE = int(os.getenv('WHISPER_BATCH_SIZE', '8'))  # 30 s chunks per encoder batch
+WHISPER_BATCH_MAX_WAIT = float(os.getenv('WHISPER_BATCH_MAX_WAIT', '0.5'))  # Seconds to wait for more recordings
+WHISPER_BATCH_MAX_RECORDINGS = int(os.getenv('WHISPER_BATCH_MAX_RECORDINGS', '8'))
+WHISPER_LANGUAGE = os.getenv('WHISPER_LANGUAGE') or None  # None = detect
+
+# Opt-in profiling: requests with an X-Profile-Token header matching this are sampled
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')  # Unset = profiling disabled
+PROFILE_DIR = os.getenv('PROFILE_DIR', './profiles')
+PROFILE_INTERVAL = 0.01  # Seconds between stack samples
+
+# Startup: models load in the background after the API binds its port
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_SECONDS = 3  # Length of the synthetic warm-up clip
+
+# Long recordings are decoded and processed in overlapping windows to bound memory
+CHUNKED_MIN_BYTES = int(os.getenv('CHUNKED_MIN_MB', '20')) * 1024 * 1024  # Files above this use windows
+CHUNK_SECONDS = float(os.getenv('CHUNK_SECONDS', '600'))
+CHUNK_OVERLAP_SECONDS = float(os.getenv('CHUNK_OVERLAP_SECONDS', '10'))
+CHUNK_SPEAKER_THRESHOLD = 0.5  # Min cosine similarity to treat window speakers as the same person
+
+# One VAD pass shared by both models, which then only see the speech
+SHARED_VAD = os.getenv('SHARED_VAD', 'true').lower() == 'true'
+VAD_MIN_SILENCE_MS = int(os.getenv('VAD_MIN_SILENCE_MS', '2000'))  # Shorter pauses stay in the speech
+VAD_SPEECH_PAD_MS = 400  # Audio kept either side of each speech region
+VAD_MAX_REGION_SECONDS = 29  # Keeps regions inside one 30 s Whisper window
+
+# Cascade: a larger Whisper model re-decodes only segments the main model is unsure of
+CASCADE_MODEL = os.getenv('CASCADE_MODEL') or None  # e.g. 'large-v3'; unset = main model only
+CASCADE_MIN_AVG_LOGPROB = float(os.getenv('CASCADE_MIN_AVG_LOGPROB', '-0.7'))
+CASCADE_MAX_NO_SPEECH_PROB = float(os.getenv('CASCADE_MAX_NO_SPEECH_PROB', '0.5'))
+CASCADE_MAX_COMPRESSION_RATIO = float(os.getenv('CASCADE_MAX_COMPRESSION_RATIO', '2.2'))
+CASCADE_MAX_GAP_SECONDS = 1.0  # Weak segments closer than this are re-decoded together
+CASCADE_BEAM_SIZE = 5
+
+# Inference backend (see backends.py); transcription hosts are usually CPU-only
+WHISPER_DEVICE = os.getenv('WHISPER_DEVICE', 'auto')  # auto, cpu or cuda
+WHISPER_COMPUTE_TYPE = os.getenv('WHISPER_COMPUTE_TYPE', 'default')  # e.g. int8, int8_float32, float32
+TORCH_INTEROP_THREADS = int(os.getenv('TORCH_INTEROP_THREADS', '0'))  # 0 = torch default
+DIARIZATION_RUNTIME = os.getenv('DIARIZATION_RUNTIME', 'torch')  # torch, onnx or openvino
+ONNX_DIR = os.getenv('ONNX_DIR', './models/onnx')  # Exported Pyannote networks
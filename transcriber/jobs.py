@@ -0,0 +1,316 @@
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from config import *
+import metrics
+from cancellation import Cancelled, CancelToken, record_cancelled
+from scheduler import ScheduledQueue, duration_class
+from utils import probe_duration, save_transcription
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class Job:
+    """
+    A single transcription request and its current state
+    """
+    def __init__(self, file_path, callback_url=None, save=True, options=None,
+                 priority='normal', duration=None, timeout=None):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.callback_url = callback_url
+        self.save = save
+        self.options = options or {}
+        self.priority = priority
+        self.duration = duration  # Probed from the header, None if unknown
+        self.token = CancelToken(timeout)  # Deadline counts from submission, queue wait included
+        self.status = 'queued'
+        self.stage = None
+        self.result = None
+        self.outputs = []  # Transcript files saved for the job
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    @property
+    def expected_seconds(self):
+        return self.duration if self.duration is not None else JOB_UNKNOWN_SECONDS
+
+    def to_dict(self):
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'file_path': self.file_path,
+            'priority': self.priority,
+            'duration': round(self.duration, 3) if self.duration is not None else None,
+            'error': self.error,
+            'created_at': iso(self.created_at),
+            'started_at': iso(self.started_at),
+            'finished_at': iso(self.finished_at)
+        }
+
+
+class JobQueue:
+    """
+    Bounded in-process queue that runs transcriptions on worker threads
+
+    `transcriber` only needs a `transcribe_file(path, on_stage=None)` method
+    returning `{'conversation': [...], 'metadata': {...}}`, so a stub can be
+    swapped in for testing. Callbacks are sent from their own threads, so
+    a slow receiver never holds up a worker.
+    """
+    def __init__(self, transcriber, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE,
+                 result_ttl=JOB_RESULT_TTL, output_dir=OUTPUT_DIR):
+        self.transcriber = transcriber
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.output_dir = output_dir
+        self._queue = ScheduledQueue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._callbacks = None
+
+    def start(self):
+        """
+        Start the worker threads
+        """
+        self._stopping.clear()
+        self._callbacks = ThreadPoolExecutor(max_workers=JOB_CALLBACK_WORKERS, thread_name_prefix='job-callback')
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker,
+                name=f"transcription-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Ask workers to exit once the jobs already queued are finished
+
+        If the queue is too full to take a stop marker per worker, workers
+        exit after their current job instead and the rest stay queued.
+        """
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                self._stopping.set()
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._callbacks:
+            self._callbacks.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, file_path, callback_url=None, save=True, priority='normal',
+               timeout=JOB_TIMEOUT_SECONDS, **options):
+        """
+        Queue a file for transcription and return its Job
+
+        Jobs run by `priority` (one of JOB_PRIORITIES), then shortest
+        recording first, see ScheduledQueue. A job still unfinished
+        `timeout` seconds after submission is cancelled (0 or None for no
+        limit). Extra `options` are passed on to `transcribe_file` (e.g.
+        `channels`).
+        """
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {', '.join(JOB_PRIORITIES)}")
+        self._prune()
+
+        # Per-speaker tracks are each transcribed in full
+        durations = [probe_duration(path, PROBE_FALLBACK_KBPS) for path in options.get('tracks') or [file_path]]
+        duration = None if None in durations else sum(durations)
+        job = Job(file_path, callback_url=callback_url, save=save, options=options,
+                  priority=priority, duration=duration, timeout=timeout)
+
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError(f"Job queue is full ({self._queue.maxsize} jobs waiting)")
+
+        duration_text = f"{duration:.0f}s" if duration is not None else "unknown length"
+        print(f"📥 Queued job {job.id} ({priority}, {duration_text}): {file_path}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id, reason='cancelled'):
+        """
+        Stop a job: a queued one never starts, a running one stops early
+
+        Returns the Job (None if unknown). Finished jobs are left as they are.
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job.token.cancel(reason)
+        if self._queue.discard(job):
+            self._finish_cancelled(job, Cancelled(reason))
+        return job
+
+    def _finish_cancelled(self, job, error):
+        record_cancelled(error, job.token.stage, time.time() - (job.started_at or time.time()))
+        job.status = 'cancelled'
+        job.error = str(error)
+        job.finished_at = time.time()
+
+    def wait(self, job_id, timeout=None):
+        """
+        Block until a job finishes (mainly for scripts and tests)
+        """
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            job = self.get(job_id)
+            if job is None or job.done:
+                return job
+            if deadline and time.time() > deadline:
+                return job
+            time.sleep(0.05)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            queued_priorities = [job.priority for job in self._jobs.values() if job.status == 'queued']
+        return {
+            'workers': self.workers,
+            'queued': statuses.count('queued'),
+            'queued_by_priority': {p: queued_priorities.count(p) for p in JOB_PRIORITIES},
+            'processing': statuses.count('processing'),
+            'completed': statuses.count('completed'),
+            'failed': statuses.count('failed'),
+            'cancelled': statuses.count('cancelled'),
+            'capacity': self._queue.maxsize
+        }
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        if job.token.cancelled:
+            # Its deadline passed while it waited, so nobody is waiting for it any more
+            self._finish_cancelled(job, Cancelled(job.token.reason))
+            if job.callback_url:
+                self._callbacks.submit(self._send_callback, job)
+            return
+
+        job.status = 'processing'
+        job.started_at = time.time()
+        metrics.QUEUE_WAIT_SECONDS.observe(
+            job.started_at - job.created_at,
+            priority=job.priority,
+            length=duration_class(job.duration)
+        )
+        print(f"⚙️  Starting job {job.id}: {job.file_path}")
+
+        def on_stage(name):
+            job.stage = name
+
+        try:
+            result = self.transcriber.transcribe_file(
+                job.file_path, on_stage=on_stage, cancel=job.token, **job.options
+            )
+            if result is None:
+                raise RuntimeError("Failed to decode audio file")
+
+            if job.save:
+                on_stage('saving')
+                os.makedirs(self.output_dir, exist_ok=True)
+                base_name = os.path.basename(job.file_path).rsplit('.', 1)[0]
+                output_file = os.path.join(self.output_dir, f"{base_name}_transcript.txt")
+                job.outputs = save_transcription(output_file, result['conversation'], result['metadata'])
+
+            job.result = {'status': 'success', **result}
+            job.status = 'completed'
+            print(f"✅ Job {job.id} completed")
+
+        except Cancelled as e:
+            job.error = str(e)
+            job.status = 'cancelled'
+            print(f"🛑 Job {job.id} cancelled ({e.reason})")
+
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+            print(f"❌ Job {job.id} failed: {e}")
+
+        finally:
+            job.stage = None
+            job.finished_at = time.time()
+
+        if job.callback_url:
+            self._callbacks.submit(self._send_callback, job)
+
+    def _send_callback(self, job):
+        """
+        POST the finished job to its callback URL, retrying with backoff
+        """
+        payload = job.to_dict()
+        if job.result:
+            payload['result'] = job.result
+        body = json.dumps(payload).encode('utf-8')
+
+        for attempt in range(1, JOB_CALLBACK_RETRIES + 1):
+            try:
+                request = urllib.request.Request(
+                    job.callback_url,
+                    data=body,
+                    headers={'Content-Type': 'application/json'},
+                    method='POST'
+                )
+                with urllib.request.urlopen(request, timeout=10):
+                    pass
+                print(f"📨 Callback delivered for job {job.id}")
+                return
+            except Exception as e:
+                print(f"⚠️ Callback attempt {attempt} for job {job.id} failed: {e}")
+                if attempt < JOB_CALLBACK_RETRIES:
+                    time.sleep(2 ** attempt)
+
+    def _prune(self):
+        """
+        Forget finished jobs older than the result TTL
+        """
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.done and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,197 @@
+import threading
+
+# Minimal Prometheus-compatible metrics, so /metrics needs no extra dependency
+
+# Latency buckets in seconds, from quick merges up to multi-minute calls
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """Monotonically increasing total, either counted here or read from `function` at scrape time"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        if self.function:
+            # A running total kept by its owner (e.g. the result cache)
+            try:
+                return [f"{self.name} {self.function()}"]
+            except Exception:
+                return []
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from `function` at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.function:
+            # Read live from whoever owns the value (e.g. the job queue)
+            try:
+                return [f"{self.name} {self.function()}"]
+            except Exception:
+                return []
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, [('le', bound)])
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram(
+    'transcriber_stage_seconds',
+    'Time spent in each pipeline stage',
+    ['stage']
+)
+REAL_TIME_FACTOR = Histogram(
+    'transcriber_real_time_factor',
+    'Processing time divided by audio duration, per call',
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+)
+MODEL_LOAD_SECONDS = Gauge(
+    'transcriber_model_load_seconds',
+    'Time taken to load each model',
+    ['model']
+)
+MODEL_WARMUP_SECONDS = Gauge(
+    'transcriber_model_warmup_seconds',
+    'Time taken by the warm-up inference of the last replica loaded'
+)
+AUDIO_BYTES = Counter(
+    'transcriber_audio_bytes_total',
+    'Bytes of input audio processed'
+)
+AUDIO_SECONDS = Counter(
+    'transcriber_audio_seconds_total',
+    'Seconds of audio processed'
+)
+REQUESTS = Counter(
+    'transcriber_requests_total',
+    'HTTP requests by endpoint and status code',
+    ['path', 'status']
+)
+IN_FLIGHT = Gauge(
+    'transcriber_requests_in_flight',
+    'HTTP requests currently being handled'
+)
+CASCADE_ESCALATED_SECONDS = Counter(
+    'transcriber_cascade_escalated_seconds_total',
+    'Seconds of audio re-decoded by the larger cascade model'
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'transcriber_queue_wait_seconds',
+    'Time jobs waited in the queue before starting, by priority and recording length',
+    ['priority', 'length'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+)
+FIRST_SEGMENT_SECONDS = Histogram(
+    'transcriber_time_to_first_segment_seconds',
+    'Time from a streaming request starting to its first transcribed segment being sent',
+    ['path']
+)
+CANCELLED = Counter(
+    'transcriber_cancelled_total',
+    'Transcriptions stopped before finishing, by reason (deadline, disconnected, cancelled) and stage',
+    ['reason', 'stage']
+)
+CANCELLED_SECONDS = Counter(
+    'transcriber_cancelled_seconds_total',
+    'Processing time spent on transcriptions that were then cancelled'
+)
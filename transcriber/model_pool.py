@@ -0,0 +1,236 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from backends import split_cpu_threads
+from config import *
+
+
+class PoolSaturatedError(Exception):
+    """Raised when every replica already has its maximum number of requests"""
+    status_code = 429
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ModelsNotReadyError(PoolSaturatedError):
+    """Raised when requests arrive before the models have finished loading"""
+    status_code = 503
+
+
+class Replica:
+    """
+    One loaded AudioTranscriber and the requests currently assigned to it
+    """
+    def __init__(self, index, transcriber):
+        self.index = index
+        self.transcriber = transcriber
+        self.in_flight = 0
+        self.processed = 0
+
+
+def build_transcriber(index, cpu_threads, cache):
+    """
+    Default replica factory: a full AudioTranscriber with its own thread budget
+
+    The budget is split between Whisper and Pyannote when they run in
+    parallel (see split_cpu_threads). Torch's thread count is process-wide,
+    which works because every replica gets the same diarization share.
+    """
+    from transcriber import AudioTranscriber
+
+    whisper_threads, diarization_threads = split_cpu_threads(cpu_threads)
+    transcriber = AudioTranscriber(
+        whisper_model=WHISPER_MODEL,
+        hf_token=HF_TOKEN,
+        whisper_cpu_threads=whisper_threads,
+        diarization_cpu_threads=diarization_threads,
+        cache=cache
+    )
+    if WARMUP_ENABLED:
+        transcriber.warm_up()
+    return transcriber
+
+
+class ModelPool:
+    """
+    K model replicas with least-loaded dispatch and admission control
+
+    Replicas are threads in this process; Whisper (CTranslate2) and
+    Pyannote (torch) release the GIL while they compute, so each replica
+    gets its own share of the cores. `factory(index, cpu_threads, cache)`
+    builds a replica, so a stub can be swapped in for testing.
+
+    Nothing is loaded until `load()` (or `start_loading()` to load in the
+    background); until then requests get ModelsNotReadyError.
+    """
+    def __init__(self, replicas=MODEL_REPLICAS, max_in_flight=MODEL_MAX_INFLIGHT,
+                 cpu_threads=MODEL_CPU_THREADS, factory=build_transcriber):
+        self.replica_count = replicas
+        self.max_in_flight = max_in_flight
+        self.cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // replicas)
+        self.factory = factory
+        self.cache = None
+        if CACHE_ENABLED:
+            from cache import TranscriptCache
+            self.cache = TranscriptCache()
+
+        self.replicas = []
+        self.state = 'idle'
+        self.error = None
+        self.load_seconds = None
+        self._condition = threading.Condition()
+        self._avg_seconds = None
+        self.rejected = 0
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def load(self):
+        """
+        Load (and warm up) all replicas in parallel
+        """
+        with self._condition:
+            if self.state in ('loading', 'ready'):
+                return
+            self.state = 'loading'
+
+        started = time.perf_counter()
+        print(f"🔄 Loading {self.replica_count} model replica(s), {self.cpu_threads} CPU threads each...")
+        try:
+            with ThreadPoolExecutor(max_workers=self.replica_count) as loader:
+                transcribers = list(loader.map(
+                    lambda i: self.factory(i, self.cpu_threads, self.cache),
+                    range(self.replica_count)
+                ))
+        except Exception as e:
+            print(f"❌ Failed to load models: {e}")
+            with self._condition:
+                self.state = 'failed'
+                self.error = str(e)
+                self._condition.notify_all()
+            return
+
+        with self._condition:
+            self.replicas = [Replica(i, t) for i, t in enumerate(transcribers)]
+            self.load_seconds = time.perf_counter() - started
+            self.state = 'ready'
+            self._condition.notify_all()
+        print(f"✅ Models ready in {self.load_seconds:.1f}s")
+
+    def start_loading(self):
+        """
+        Load the models on a background thread and return immediately
+        """
+        thread = threading.Thread(target=self.load, name='model-pool-loader', daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def capacity(self):
+        return len(self.replicas) * self.max_in_flight
+
+    def _least_loaded(self):
+        if not self.replicas:
+            return None
+        replica = min(self.replicas, key=lambda r: r.in_flight)
+        return replica if replica.in_flight < self.max_in_flight else None
+
+    def retry_after(self):
+        """
+        Seconds a rejected client should wait, from the average call duration
+        """
+        if self._avg_seconds is None:
+            return MODEL_RETRY_AFTER
+        return max(1, math.ceil(self._avg_seconds))
+
+    def acquire(self, block=False, timeout=None):
+        """
+        Reserve the least-loaded replica
+
+        Raises PoolSaturatedError when all replicas are full, unless
+        `block` is set, in which case it waits for a free slot.
+        """
+        with self._condition:
+            if block and not self.ready:
+                self._condition.wait_for(lambda: self.state in ('ready', 'failed'), timeout)
+            if not self.ready:
+                raise ModelsNotReadyError(
+                    f"Models are {self.state}" + (f": {self.error}" if self.error else ""),
+                    MODEL_RETRY_AFTER
+                )
+
+            replica = self._least_loaded()
+            if replica is None and block:
+                self._condition.wait_for(lambda: self._least_loaded() is not None, timeout)
+                replica = self._least_loaded()
+            if replica is None:
+                self.rejected += 1
+                raise PoolSaturatedError(
+                    f"All {len(self.replicas)} model replicas are busy",
+                    self.retry_after()
+                )
+            replica.in_flight += 1
+            return replica
+
+    def release(self, replica, seconds=None):
+        with self._condition:
+            replica.in_flight -= 1
+            replica.processed += 1
+            if seconds is not None:
+                # Exponential moving average of time spent per request
+                if self._avg_seconds is None:
+                    self._avg_seconds = seconds
+                else:
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self, block=False):
+        """
+        `with pool.lease() as transcriber:` reserves a replica for the block
+        """
+        replica = self.acquire(block=block)
+        started = time.perf_counter()
+        try:
+            yield replica.transcriber
+        finally:
+            self.release(replica, time.perf_counter() - started)
+
+    def transcribe_file(self, audio_file, **kwargs):
+        """
+        Run transcribe_file on a free replica, waiting for one if needed
+
+        Lets the pool stand in for a single AudioTranscriber (e.g. in JobQueue).
+        """
+        with self.lease(block=True) as transcriber:
+            return transcriber.transcribe_file(audio_file, **kwargs)
+
+    def stats(self):
+        with self._condition:
+            backend = getattr(self.replicas[0].transcriber, 'backend', None) if self.replicas else None
+            return {
+                'state': self.state,
+                'error': self.error,
+                'load_seconds': round(self.load_seconds, 3) if self.load_seconds else None,
+                'replicas': [
+                    {'index': r.index, 'in_flight': r.in_flight, 'processed': r.processed}
+                    for r in self.replicas
+                ],
+                'cpu_threads_per_replica': self.cpu_threads,
+                'stage_cpu_threads': {
+                    'whisper': backend.whisper_cpu_threads,
+                    'diarization': backend.applied_torch_threads() or backend.torch_threads
+                } if backend else None,
+                'backend': backend.describe() if backend else None,
+                'in_flight': sum(r.in_flight for r in self.replicas),
+                'capacity': self.capacity,
+                'rejected': self.rejected,
+                'avg_seconds': round(self._avg_seconds, 3) if self._avg_seconds else None
+            }
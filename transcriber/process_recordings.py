@@ -1,60 +1,346 @@
 import os
 import glob
+import json
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
 from transcriber import AudioTranscriber
+from backends import split_cpu_threads
+from cache import hash_audio
 from config import *
+from utils import decode_audio, save_transcription
+from writers import find_transcript
 
+try:
+    import fcntl
+except ImportError:  # Windows: saves are still atomic, just not serialized
+    fcntl = None
 
-def process_all_recordings():
+
+def find_recordings(recordings_dir=RECORDINGS_DIR):
     """
-    Process all recordings in the recordings directory
+    All supported audio files in the recordings directory
     """
-    print("🔍 Scanning for recordings...")
-    
-    # Find all audio files
     audio_files = []
     for ext in SUPPORTED_FORMATS:
-        pattern = os.path.join(RECORDINGS_DIR, f"*{ext}")
+        pattern = os.path.join(recordings_dir, f"*{ext}")
         audio_files.extend(glob.glob(pattern))
-    
-    if not audio_files:
-        print(f"❌ No audio files found in {RECORDINGS_DIR}")
-        return
-    
-    print(f"✅ Found {len(audio_files)} recordings")
-    
-    # Initialize transcriber
+    return sorted(audio_files)
+
+
+def transcript_path(audio_file, output_dir):
+    base_name = os.path.basename(audio_file).rsplit('.', 1)[0]
+    return os.path.join(output_dir, f"{base_name}_transcript.txt")
+
+
+class Manifest:
+    """
+    Processing state of every recording, saved after each file
+
+    A recording is skipped when its size and mtime (or, if those changed,
+    its content hash) match a successful entry, so a crashed or repeated
+    batch resumes where it left off.
+
+    Several processes (batch runs, the watcher) can share one manifest:
+    each save re-reads the file under a lock and merges in only the
+    entries this process changed, so nobody overwrites the others' work.
+    """
+    def __init__(self, path=BATCH_MANIFEST):
+        self.path = path
+        self.entries = {}
+        self._changed = set()
+        self._loaded_mtime = None
+        self._reload()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}, None
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f), mtime
+
+    def _reload(self):
+        """
+        Pick up entries other processes saved since we last read the file
+        """
+        mtime = os.stat(self.path).st_mtime_ns if os.path.exists(self.path) else None
+        if mtime != self._loaded_mtime:
+            entries, self._loaded_mtime = self._read()
+            entries.update({key: self.entries[key] for key in self._changed if key in self.entries})
+            self.entries = entries
+
+    def is_processed(self, audio_file, output_dir):
+        self._reload()
+        key = os.path.abspath(audio_file)
+        stat = os.stat(audio_file)
+        entry = self.entries.get(key)
+
+        if entry and entry['status'] == 'success':
+            if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                return True
+            # Touched but possibly unchanged: compare content
+            if entry['size'] == stat.st_size and entry.get('sha256') == hash_audio(audio_file):
+                entry['mtime'] = stat.st_mtime
+                self._changed.add(key)
+                self.save()
+                return True
+            return False
+
+        # Processed before the manifest existed
+        if not entry and find_transcript(transcript_path(audio_file, output_dir)):
+            self.record(audio_file, status='success', output=transcript_path(audio_file, output_dir))
+            return True
+
+        return False
+
+    def record(self, audio_file, **fields):
+        stat = os.stat(audio_file)
+        key = os.path.abspath(audio_file)
+        self._changed.add(key)
+        self.entries[key] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': hash_audio(audio_file),
+            'processed_at': datetime.now().isoformat(),
+            **fields
+        }
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # Merge our entries into the latest copy on disk
+            entries, _ = self._read()
+            entries.update({key: self.entries[key] for key in self._changed if key in self.entries})
+
+            # Write to a temp file and rename so a crash never leaves a torn manifest
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=2)
+            os.replace(temp_path, self.path)
+            self.entries = entries
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+
+def process_file(transcriber, audio_file, output_dir, audio=None):
+    """
+    Transcribe one recording, save it and return its summary entry
+    """
+    started = time.perf_counter()
+    try:
+        result = transcriber.transcribe_file(audio_file, audio=audio)
+        if result is None:
+            raise RuntimeError("Failed to decode audio file")
+
+        save_started = time.perf_counter()
+        outputs = save_transcription(transcript_path(audio_file, output_dir), result['conversation'], result['metadata'])
+
+        metadata = result['metadata']
+        timings = {} if metadata.get('cached') else dict(metadata.get('timings', {}))
+        timings['save'] = round(time.perf_counter() - save_started, 3)
+        timings['wall'] = round(time.perf_counter() - started, 3)
+        return {
+            'file': audio_file,
+            'status': 'success',
+            'output': outputs[0] if outputs else None,
+            'duration': metadata['duration'],
+            'cached': metadata.get('cached', False),
+            'timings': timings
+        }
+
+    except Exception as e:
+        print(f"❌ Error processing {audio_file}: {e}")
+        return {
+            'file': audio_file,
+            'status': 'failed',
+            'error': str(e),
+            'timings': {'wall': round(time.perf_counter() - started, 3)}
+        }
+
+
+def run_serial(audio_files, output_dir, prefetch):
+    """
+    One transcriber; the next files are decoded while the current one runs
+
+    Files above CHUNKED_MIN_BYTES are not prefetched: transcribe_file
+    decodes them window by window itself, so memory stays bounded.
+    """
     transcriber = AudioTranscriber(
         whisper_model=WHISPER_MODEL,
         hf_token=HF_TOKEN
     )
-    
-    # Process each file
+
+    if not IN_MEMORY_DECODE or prefetch < 1:
+        for audio_file in audio_files:
+            yield process_file(transcriber, audio_file, output_dir)
+        return
+
+    with ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix='decode') as decoder:
+        pending = deque()
+        remaining = iter(audio_files)
+
+        def queue_next():
+            audio_file = next(remaining, None)
+            if audio_file and os.path.getsize(audio_file) > CHUNKED_MIN_BYTES:
+                pending.append((audio_file, None))
+            elif audio_file:
+                pending.append((audio_file, decoder.submit(decode_audio, audio_file, SAMPLE_RATE)))
+
+        for _ in range(prefetch):
+            queue_next()
+
+        while pending:
+            audio_file, future = pending.popleft()
+            queue_next()
+            if future is None:
+                yield process_file(transcriber, audio_file, output_dir)
+                continue
+            audio = future.result()
+            if audio is None:
+                yield {'file': audio_file, 'status': 'failed', 'error': 'Failed to decode audio file', 'timings': {}}
+                continue
+            yield process_file(transcriber, audio_file, output_dir, audio=audio)
+
+
+_worker_transcriber = None
+
+
+def _init_worker(cpu_threads):
+    """
+    Load the models once per worker process
+    """
+    global _worker_transcriber
+    whisper_threads, diarization_threads = split_cpu_threads(cpu_threads)
+    _worker_transcriber = AudioTranscriber(
+        whisper_model=WHISPER_MODEL,
+        hf_token=HF_TOKEN,
+        whisper_cpu_threads=whisper_threads,
+        diarization_cpu_threads=diarization_threads
+    )
+
+
+def _process_in_worker(audio_file, output_dir):
+    return process_file(_worker_transcriber, audio_file, output_dir)
+
+
+def run_parallel(audio_files, output_dir, workers):
+    """
+    Shard files across worker processes that each keep their own models
+    """
+    cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(cpu_threads,)
+    ) as pool:
+        futures = [pool.submit(_process_in_worker, f, output_dir) for f in audio_files]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def process_all_recordings(recordings_dir=RECORDINGS_DIR, output_dir=OUTPUT_DIR,
+                           workers=1, prefetch=BATCH_PREFETCH, force=False,
+                           manifest_path=BATCH_MANIFEST, summary_path=BATCH_SUMMARY):
+    """
+    Process all new or changed recordings in the recordings directory
+    """
+    print("🔍 Scanning for recordings...")
+
+    # Find all audio files
+    audio_files = find_recordings(recordings_dir)
+
+    if not audio_files:
+        print(f"❌ No audio files found in {recordings_dir}")
+        return
+
+    print(f"✅ Found {len(audio_files)} recordings")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(manifest_path)
+
+    # Skip recordings that are already processed and unchanged
     results = []
-    for i, audio_file in enumerate(audio_files, 1):
-        print(f"\n[{i}/{len(audio_files)}]")
-        try:
-            result = transcriber.process_recording(audio_file)
-            results.append({
-                'file': audio_file,
-                'status': 'success',
-                'result': result
-            })
-        except Exception as e:
-            print(f"❌ Error processing {audio_file}: {e}")
-            results.append({
-                'file': audio_file,
-                'status': 'failed',
-                'error': str(e)
-            })
-    
+    todo = []
+    for audio_file in audio_files:
+        if not force and manifest.is_processed(audio_file, output_dir):
+            results.append({'file': audio_file, 'status': 'skipped'})
+        else:
+            todo.append(audio_file)
+
+    print(f"⏭️  Skipping {len(audio_files) - len(todo)} already processed")
+
+    started = time.perf_counter()
+    started_at = datetime.now().isoformat()
+
+    if workers > 1:
+        processed = run_parallel(todo, output_dir, workers)
+    else:
+        processed = run_serial(todo, output_dir, prefetch)
+
+    # Process each file
+    for i, result in enumerate(processed, 1):
+        print(f"\n[{i}/{len(todo)}] {result['status']}: {result['file']}")
+        manifest.record(
+            result['file'],
+            **{k: v for k, v in result.items() if k != 'file'}
+        )
+        results.append(result)
+
+    wall_time = time.perf_counter() - started
+
     # Summary
+    counts = {
+        status: sum(1 for r in results if r['status'] == status)
+        for status in ('success', 'skipped', 'failed')
+    }
+    summary = {
+        'started_at': started_at,
+        'finished_at': datetime.now().isoformat(),
+        'wall_time': round(wall_time, 3),
+        'workers': workers,
+        'total': len(audio_files),
+        **counts,
+        'audio_seconds': round(sum(r.get('duration', 0) for r in results if r['status'] == 'success'), 3),
+        'files': results
+    }
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
     print(f"\n{'='*60}")
     print(f"PROCESSING SUMMARY")
     print(f"{'='*60}")
-    success_count = sum(1 for r in results if r['status'] == 'success')
-    print(f"✅ Successful: {success_count}/{len(audio_files)}")
-    print(f"❌ Failed: {len(audio_files) - success_count}/{len(audio_files)}")
+    print(f"✅ Successful: {counts['success']}/{len(audio_files)}")
+    print(f"⏭️  Skipped: {counts['skipped']}/{len(audio_files)}")
+    print(f"❌ Failed: {counts['failed']}/{len(audio_files)}")
+    print(f"⏱️  Wall time: {wall_time:.1f}s")
+    print(f"📄 Summary: {summary_path}")
+
+    return summary
 
 
 if __name__ == "__main__":
-    process_all_recordings()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Transcribe new or changed recordings")
+    parser.add_argument('--recordings-dir', default=RECORDINGS_DIR)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes, each with its own models')
+    parser.add_argument('--prefetch', type=int, default=BATCH_PREFETCH, help='Files decoded ahead (single worker)')
+    parser.add_argument('--force', action='store_true', help='Reprocess recordings already in the manifest')
+    parser.add_argument('--manifest', default=BATCH_MANIFEST)
+    parser.add_argument('--summary', default=BATCH_SUMMARY)
+    args = parser.parse_args()
+
+    process_all_recordings(
+        recordings_dir=args.recordings_dir,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        force=args.force,
+        manifest_path=args.manifest,
+        summary_path=args.summary
+    )
@@ -0,0 +1,139 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from config import *
+
+# Threads parked in these modules are idle (waiting on locks, queues or
+# sockets) and would otherwise dominate the samples
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py', 'base_events.py')
+
+# The profiler of the request being handled, for profiled() to pick up
+REQUEST_PROFILER = contextvars.ContextVar('request_profiler', default=None)
+
+
+class SamplingProfiler:
+    """
+    Low-overhead stack sampler for the threads of the process
+
+    Like py-spy, it periodically records the stack of each thread rather
+    than tracing every call, so it also sees work running in threadpool
+    and model worker threads. With `only_watched`, just the threads a
+    request's work runs on (see profiled) are sampled, so concurrent
+    requests don't show up in its profile. Stacks are written in the
+    collapsed ("folded") format that flamegraph tools read.
+    """
+    def __init__(self, interval=PROFILE_INTERVAL, only_watched=False):
+        self.interval = interval
+        self.only_watched = only_watched
+        self.watched = Counter()
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def watch(self, thread_id):
+        self.watched[thread_id] += 1
+
+    def unwatch(self, thread_id):
+        self.watched[thread_id] -= 1
+        if self.watched[thread_id] <= 0:
+            del self.watched[thread_id]
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                    continue
+                if self.only_watched and thread_id not in self.watched:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def top(self, limit=20):
+        """
+        Functions that appear most often at the top of a stack
+        """
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {'function': name, 'samples': count, 'percent': round(100 * count / total, 1)}
+            for name, count in leaves.most_common(limit)
+        ]
+
+    def save(self, path):
+        """
+        Write the folded stacks to `path` (see profile_path) and return it
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def profile_path(label):
+    """
+    Where a profile labelled `label` is saved, in PROFILE_DIR
+    """
+    safe_label = ''.join(c if c.isalnum() else '_' for c in label).strip('_') or 'profile'
+    return os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d_%H%M%S}_{safe_label}.folded")
+
+
+def profiled(func):
+    """
+    `func`, sampled by the current request's profiler on whichever thread it runs
+
+    Wrap work before handing it to another thread. The profiler travels
+    with the wrapper, so work that func hands on in turn is sampled too.
+    """
+    profiler = REQUEST_PROFILER.get()
+    if profiler is None:
+        return func
+
+    def run(*args, **kwargs):
+        thread_id = threading.get_ident()
+        profiler.watch(thread_id)
+        token = REQUEST_PROFILER.set(profiler)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            REQUEST_PROFILER.reset(token)
+            profiler.unwatch(thread_id)
+    return run
+
+
+def profile_for(seconds, label='process'):
+    """
+    Sample the whole process for a number of seconds (blocking)
+    """
+    profiler = SamplingProfiler().start()
+    time.sleep(seconds)
+    profiler.stop()
+    return profiler, profiler.save(profile_path(label))
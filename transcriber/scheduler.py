@@ -0,0 +1,76 @@
+import queue
+import time
+
+from config import *
+
+
+def duration_class(seconds):
+    """
+    Coarse recording length bucket, used as a metrics label
+    """
+    if seconds is None:
+        return 'unknown'
+    if seconds < 300:
+        return 'under_5m'
+    if seconds < 1800:
+        return '5m_to_30m'
+    return 'over_30m'
+
+
+class ScheduledQueue(queue.Queue):
+    """
+    Job queue ordered by priority class and expected cost, with aging
+
+    Every waiting job scores
+
+        class index * priority_step + expected seconds - aging_rate * seconds waited
+
+    and the lowest score runs next: high priority before normal, short
+    calls before long ones in the same class, while a long call keeps
+    moving up as it waits so it is never starved. With `shortest_first`
+    off, jobs in a class run oldest first. Items without a priority (the
+    workers' stop sentinels) always come last.
+    """
+    def __init__(self, maxsize=0, priority_step=JOB_PRIORITY_STEP, aging_rate=JOB_AGING_RATE,
+                 shortest_first=JOB_SHORTEST_FIRST):
+        self.priority_step = priority_step
+        self.aging_rate = aging_rate
+        self.shortest_first = shortest_first
+        super().__init__(maxsize)
+
+    def score(self, job, now):
+        if job is None:
+            return float('inf')
+        cost = job.expected_seconds if self.shortest_first else 0
+        waited = now - job.created_at
+        return JOB_PRIORITIES.index(job.priority) * self.priority_step + cost - self.aging_rate * waited
+
+    # queue.Queue storage hooks, called with the queue's lock held
+    def _init(self, maxsize):
+        self.items = []
+
+    def _qsize(self):
+        return len(self.items)
+
+    def _put(self, item):
+        self.items.append(item)
+
+    def _get(self):
+        # A linear scan: scores change as jobs age, and the queue holds at most JOB_QUEUE_SIZE jobs
+        now = time.time()
+        best = min(range(len(self.items)), key=lambda i: self.score(self.items[i], now))
+        return self.items.pop(best)
+
+    def discard(self, item):
+        """
+        Drop a waiting item (a cancelled job) so its slot frees up now
+        """
+        with self.mutex:
+            if item not in self.items:
+                return False
+            self.items.remove(item)
+            self.unfinished_tasks -= 1
+            if not self.unfinished_tasks:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify()
+            return True
@@ -0,0 +1,314 @@
+"""
+Full-text search over saved transcripts (SQLite FTS5)
+
+Every transcript written by save_transcription is indexed turn by turn,
+so phrases can be found across calls, optionally for one speaker only,
+with the turn's timestamps.
+
+Usage:
+    python search.py rebuild [--output-dir DIR]
+    python search.py query "refund" [--speaker Customer] [--phrase]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from config import *
+from writers import WRITERS, find_transcript, load_transcript
+
+# Turn rowids are call id << TURN_BITS | turn index, so a call's turns are
+# one rowid range (cheap to replace) and rowid order is newest call first
+TURN_BITS = 20
+REBUILD_COMMIT_EVERY = 1000  # Transcripts per transaction while rebuilding, so other writers aren't blocked
+SORTS = ('recent', 'relevance')
+
+
+def match_query(text, phrase=False):
+    """
+    FTS5 MATCH expression for a user's query
+
+    Words must all appear (in any order); "quoted parts" must appear as
+    phrases, and a trailing * matches any word starting with the prefix.
+    With `phrase`, the whole query is one phrase. Everything else is
+    treated as plain words, so user input can't produce a syntax error.
+    """
+    parts = [text] if phrase else [a or b for a, b in re.findall(r'"([^"]*)"|(\S+)', text)]
+    terms = []
+    for part in parts:
+        words = re.findall(r'\w+', part)
+        if words:
+            prefix = ' *' if part.rstrip('"').endswith('*') else ''
+            terms.append('"' + ' '.join(words) + '"' + prefix)
+    if not terms:
+        raise ValueError("The query has no words to search for")
+    return ' AND '.join(terms)
+
+
+class TranscriptIndex:
+    """
+    Incremental FTS5 index of transcript turns
+
+    Indexing a transcript that is already in the index (same output path)
+    replaces it. The database is in WAL mode, so the API, the watcher and
+    batch runs can all update it while searches run.
+    """
+    def __init__(self, path=SEARCH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._create()
+
+    def _create(self, suffix=''):
+        self._db.execute(f"""
+            CREATE TABLE IF NOT EXISTS calls{suffix} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transcript TEXT NOT NULL UNIQUE,
+                filename TEXT,
+                duration REAL,
+                processed_at TEXT,
+                agent_id TEXT,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS turns{suffix} USING fts5(
+                text, speaker UNINDEXED, start UNINDEXED, end UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+        self._db.commit()
+
+    def _add(self, transcript, conversation, metadata, suffix=''):
+        row = self._db.execute(f"SELECT id FROM calls{suffix} WHERE transcript = ?", (transcript,)).fetchone()
+        if row:
+            self._db.execute(
+                f"DELETE FROM turns{suffix} WHERE rowid BETWEEN ? AND ?",
+                (row[0] << TURN_BITS, ((row[0] + 1) << TURN_BITS) - 1)
+            )
+            self._db.execute(f"DELETE FROM calls{suffix} WHERE id = ?", (row[0],))
+
+        call_id = self._db.execute(
+            f"INSERT INTO calls{suffix} (transcript, filename, duration, processed_at, agent_id, indexed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (transcript, metadata.get('filename'), metadata.get('duration'),
+             metadata.get('processed_at'), metadata.get('agent_id'), time.time())
+        ).lastrowid
+        self._db.executemany(
+            f"INSERT INTO turns{suffix} (rowid, text, speaker, start, end) VALUES (?, ?, ?, ?, ?)",
+            (
+                ((call_id << TURN_BITS) | i, turn['text'], turn['speaker'], turn['start'], turn['end'])
+                for i, turn in enumerate(conversation[:1 << TURN_BITS])
+            )
+        )
+
+    def add(self, transcript, conversation, metadata):
+        """
+        Index (or re-index) one transcript; `transcript` is its output .txt path
+        """
+        with self._lock:
+            self._add(transcript, conversation, metadata)
+            self._db.commit()
+
+    def add_many(self, transcripts):
+        """
+        Index (transcript, conversation, metadata) tuples in one transaction
+        """
+        count = 0
+        with self._lock:
+            for transcript, conversation, metadata in transcripts:
+                self._add(transcript, conversation, metadata)
+                count += 1
+            self._db.commit()
+        return count
+
+    def optimize(self):
+        """
+        Merge the index's segments, which keeps queries fast after bulk loads
+        """
+        with self._lock:
+            self._db.execute("INSERT INTO turns (turns) VALUES ('optimize')")
+            self._db.commit()
+
+    def search(self, query, speaker=None, phrase=False, sort='recent', limit=20, cursor=None):
+        """
+        Matching turns and the calls they belong to
+
+        `recent` lists newest calls first and pages by rowid, so every page
+        costs the same however many calls match; `relevance` ranks by BM25
+        and pages by offset. Returns (hits, next_cursor).
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(SORTS)}")
+        expression = f"text : ({match_query(query, phrase)})"
+
+        sql = (
+            "SELECT turns.rowid, turns.speaker, turns.start, turns.end, turns.text, "
+            "highlight(turns, 0, '<mark>', '</mark>'), "
+            "calls.transcript, calls.filename, calls.duration, calls.processed_at, calls.agent_id "
+            "FROM turns JOIN calls ON calls.id = turns.rowid >> ? "
+            "WHERE turns MATCH ?"
+        )
+        params = [TURN_BITS, expression]
+        if speaker:
+            # The whole label, so 'Agent' doesn't also match 'Agent 2'
+            sql += " AND turns.speaker = ?"
+            params.append(speaker)
+        if sort == 'recent':
+            if cursor is not None:
+                sql += " AND turns.rowid < ?"
+                params.append(int(cursor))
+            sql += " ORDER BY turns.rowid DESC LIMIT ?"
+            params.append(limit + 1)
+        else:
+            sql += " ORDER BY rank LIMIT ? OFFSET ?"
+            params.extend([limit + 1, int(cursor or 0)])
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+
+        hits = [
+            {
+                'speaker': turn_speaker,
+                'start': start,
+                'end': end,
+                'text': text,
+                'highlight': highlight,
+                'call': {
+                    'transcript': transcript,
+                    'filename': filename,
+                    'duration': duration,
+                    'processed_at': processed_at,
+                    'agent_id': agent_id
+                }
+            }
+            for _, turn_speaker, start, end, text, highlight, transcript, filename, duration, processed_at, agent_id
+            in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = rows[limit - 1][0] if sort == 'recent' else int(cursor or 0) + limit
+        return hits, next_cursor
+
+    def rebuild(self, output_dir=OUTPUT_DIR):
+        """
+        Re-index every transcript saved in `output_dir`, oldest first
+
+        Only `*_transcript.<format>` files are read, so batch manifests and
+        summaries in the same folder are ignored. The new index is built in
+        separate tables that replace the live ones in one transaction at the
+        end, so searches keep working meanwhile and a failed rebuild leaves
+        the old index in place. Transcripts that other processes index
+        meanwhile are carried over.
+        """
+        suffixes = sorted({suffix for suffix, _ in WRITERS.values()}, key=len, reverse=True)
+        transcripts = set()
+        for name in os.listdir(output_dir):
+            suffix = next((s for s in suffixes if name.endswith('_transcript' + s)), None)
+            if suffix:
+                transcripts.add(os.path.join(output_dir, name[:-len(suffix)] + '.txt'))
+
+        found = []
+        for path in transcripts:
+            saved = find_transcript(path)
+            try:
+                found.append((os.path.getmtime(saved), path, saved))
+            except (OSError, TypeError):
+                # Deleted since the folder was listed (find_transcript returns None)
+                continue
+        found.sort()
+
+        started = time.time()
+        with self._lock:
+            self._db.execute("DROP TABLE IF EXISTS turns_rebuild")
+            self._db.execute("DROP TABLE IF EXISTS calls_rebuild")
+            self._create('_rebuild')
+            try:
+                count = 0
+                for _, path, saved in found:
+                    try:
+                        data = load_transcript(saved)
+                        conversation, metadata = data['conversation'], data['metadata']
+                    except (OSError, ValueError, KeyError, TypeError) as e:
+                        print(f"⚠️  Skipping {saved}: {e!r}")
+                        continue
+                    self._add(path, conversation, metadata, suffix='_rebuild')
+                    count += 1
+                    if count % REBUILD_COMMIT_EVERY == 0:
+                        self._db.commit()
+
+                # Keep what other processes indexed while this ran; holding the
+                # write lock from here on means nothing lands between copy and swap
+                self._db.commit()
+                self._db.execute("BEGIN IMMEDIATE")
+                for call_id, transcript, filename, duration, processed_at, agent_id in self._db.execute(
+                    "SELECT id, transcript, filename, duration, processed_at, agent_id FROM calls WHERE indexed_at >= ?",
+                    (started,)
+                ).fetchall():
+                    turns = self._db.execute(
+                        "SELECT text, speaker, start, end FROM turns WHERE rowid BETWEEN ? AND ? ORDER BY rowid",
+                        (call_id << TURN_BITS, ((call_id + 1) << TURN_BITS) - 1)
+                    ).fetchall()
+                    conversation = [{'text': t, 'speaker': sp, 'start': st, 'end': en} for t, sp, st, en in turns]
+                    metadata = {'filename': filename, 'duration': duration, 'processed_at': processed_at, 'agent_id': agent_id}
+                    self._add(transcript, conversation, metadata, suffix='_rebuild')
+
+                self._db.execute("INSERT INTO turns_rebuild (turns_rebuild) VALUES ('optimize')")
+                self._db.execute("DROP TABLE turns")
+                self._db.execute("DROP TABLE calls")
+                self._db.execute("ALTER TABLE turns_rebuild RENAME TO turns")
+                self._db.execute("ALTER TABLE calls_rebuild RENAME TO calls")
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return count
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    The process-wide index at SEARCH_INDEX_PATH, opened on first use
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TranscriptIndex()
+        return _index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = commands.add_parser('rebuild', help='Re-index all transcripts in the output folder')
+    rebuild_parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    query_parser = commands.add_parser('query', help='Search the index')
+    query_parser.add_argument('text')
+    query_parser.add_argument('--speaker')
+    query_parser.add_argument('--phrase', action='store_true', help='Match the whole query as one phrase')
+    query_parser.add_argument('--sort', choices=SORTS, default='recent')
+    query_parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--index', default=SEARCH_INDEX_PATH)
+    args = parser.parse_args()
+
+    index = TranscriptIndex(args.index)
+    if args.command == 'rebuild':
+        started = time.perf_counter()
+        count = index.rebuild(args.output_dir)
+        print(f"✅ Indexed {count} transcripts from {args.output_dir} in {time.perf_counter() - started:.1f}s")
+    else:
+        started = time.perf_counter()
+        hits, _ = index.search(args.text, args.speaker, args.phrase, args.sort, args.limit)
+        print(f"🔎 {len(hits)} results in {(time.perf_counter() - started) * 1000:.1f}ms")
+        for hit in hits:
+            print(f"{hit['call']['filename']} [{hit['start']:.1f}s] {hit['speaker']}: {hit['text']}")
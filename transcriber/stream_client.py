@@ -0,0 +1,83 @@
+"""
+Replay an audio file to /ws/transcribe in real time and report latency
+
+Latency of a final segment is the time between sending the audio where
+the segment ends and receiving the segment.
+
+Usage:
+    python stream_client.py call.wav --url ws://localhost:8000/ws/transcribe
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import numpy as np
+import websockets
+
+from config import *
+from utils import decode_audio
+
+
+async def replay(url, pcm, chunk_ms, speed):
+    chunk_bytes = int(SAMPLE_RATE * chunk_ms / 1000) * 2
+    events = []
+
+    async with websockets.connect(url, max_size=None) as ws:
+        started = time.perf_counter()
+
+        async def send():
+            for i in range(0, len(pcm), chunk_bytes):
+                await ws.send(pcm[i:i + chunk_bytes])
+                # Pace chunks as if they were being captured live
+                sent_seconds = (i + chunk_bytes) / 2 / SAMPLE_RATE
+                delay = started + sent_seconds / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await ws.send(json.dumps({'event': 'end'}))
+
+        sender = asyncio.create_task(send())
+        async for message in ws:
+            event = json.loads(message)
+            event['received_at'] = time.perf_counter() - started
+            events.append(event)
+            if event['type'] == 'final':
+                print(f"[{event['start']:7.2f} → {event['end']:7.2f}] {event['text']}")
+            if event['type'] == 'done':
+                break
+        await sender
+
+    return events, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='Audio file to replay')
+    parser.add_argument('--url', default=f"ws://localhost:{FASTAPI_PORT}/ws/transcribe")
+    parser.add_argument('--chunk-ms', type=int, default=100)
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed (1.0 = real time)')
+    args = parser.parse_args()
+
+    audio = decode_audio(args.file, SAMPLE_RATE)
+    if audio is None:
+        raise SystemExit(f"❌ Could not decode {args.file}")
+    pcm = (np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes()
+    audio_seconds = len(audio) / SAMPLE_RATE
+
+    events, wall = asyncio.run(replay(args.url, pcm, args.chunk_ms, args.speed))
+
+    finals = [e for e in events if e['type'] == 'final']
+    partials = [e for e in events if e['type'] == 'partial']
+    latencies = [e['received_at'] - e['end'] / args.speed for e in finals]
+
+    print(f"\n{'='*60}")
+    print(f"Audio: {audio_seconds:.1f}s   Wall: {wall:.1f}s")
+    print(f"Final segments: {len(finals)}   Partial updates: {len(partials)}")
+    if partials:
+        print(f"First partial after: {partials[0]['received_at']:.2f}s")
+    if latencies:
+        latencies.sort()
+        print(f"Final latency p50: {statistics.median(latencies):.2f}s   "
+              f"p95: {latencies[int(0.95 * (len(latencies) - 1))]:.2f}s   max: {latencies[-1]:.2f}s")
+    print(f"Hang-up to complete transcript: {wall - audio_seconds / args.speed:.2f}s")
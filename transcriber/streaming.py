@@ -0,0 +1,128 @@
+import threading
+
+import numpy as np
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from config import *
+
+
+class StreamingSession:
+    """
+    Incremental transcription of live 16 kHz mono PCM16 audio
+
+    Audio is appended as it arrives; `step()` runs VAD over the buffered
+    window and decodes it with `decode(audio, prompt)`, which returns a
+    list of {'start', 'end', 'text'} dicts relative to the audio passed in.
+    Speech followed by enough silence is emitted as `final` segments and
+    dropped from the buffer; speech still in progress is emitted as a
+    `partial` that later steps revise.
+    """
+    def __init__(self, decode, sample_rate=SAMPLE_RATE, step_seconds=STREAM_STEP_SECONDS,
+                 max_window_seconds=STREAM_MAX_WINDOW_SECONDS,
+                 min_silence_seconds=STREAM_MIN_SILENCE_SECONDS):
+        self.decode = decode
+        self.sample_rate = sample_rate
+        self.step_samples = int(step_seconds * sample_rate)
+        self.max_window_samples = int(max_window_seconds * sample_rate)
+        self.min_silence_samples = int(min_silence_seconds * sample_rate)
+        self.vad_options = VadOptions(min_silence_duration_ms=int(min_silence_seconds * 1000))
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._lock = threading.Lock()
+        self._offset = 0  # Samples already dropped from the front of the buffer
+        self._received = 0
+        self._pending = 0  # Samples received since the last step
+        self._prompt = ''
+
+    @property
+    def duration(self):
+        return self._received / self.sample_rate
+
+    def append(self, pcm):
+        """
+        Add raw PCM16 little-endian bytes; cheap enough for the event loop
+        """
+        samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+        with self._lock:
+            self._buffer = np.concatenate([self._buffer, samples])
+            self._received += len(samples)
+            self._pending += len(samples)
+
+    @property
+    def ready(self):
+        """True once enough new audio arrived for another decode"""
+        return self._pending >= self.step_samples
+
+    def step(self, final=False):
+        """
+        Decode what is buffered and return partial/final segment events
+        """
+        with self._lock:
+            audio = self._buffer
+            offset = self._offset
+            self._pending = 0
+
+        if len(audio) == 0:
+            return []
+
+        speech = get_speech_timestamps(audio, self.vad_options, sampling_rate=self.sample_rate)
+        if not speech:
+            # Only silence so far: drop it but keep a short tail in case a
+            # word is just starting at the edge
+            self._drop(max(0, len(audio) - self.min_silence_samples))
+            return []
+
+        trailing_silence = len(audio) - speech[-1]['end']
+
+        if final or trailing_silence >= self.min_silence_samples:
+            # The utterance has ended: everything up to here is final
+            cut = len(audio) if final else speech[-1]['end']
+            segments = self._decode(audio[:cut], offset)
+            self._drop(cut)
+            return self._finalize(segments)
+
+        segments = self._decode(audio, offset)
+        if len(audio) >= self.max_window_samples:
+            if not segments:
+                # Speech the model makes nothing of: don't let it pile up
+                self._drop(speech[-1]['end'])
+                return []
+            # No pause for too long: commit all but the segment still being spoken
+            done = segments[:-1] or segments
+            cut = int(done[-1]['end'] * self.sample_rate) - offset
+            self._drop(cut)
+            return self._finalize(done)
+
+        if not segments:
+            return []
+        return [{
+            'type': 'partial',
+            'start': segments[0]['start'],
+            'end': segments[-1]['end'],
+            'text': ' '.join(s['text'] for s in segments)
+        }]
+
+    def finish(self):
+        """
+        Flush the remaining audio as final segments
+        """
+        return self.step(final=True)
+
+    def _decode(self, audio, offset):
+        segments = self.decode(audio, self._prompt)
+        start = offset / self.sample_rate
+        return [
+            {'start': round(start + s['start'], 3), 'end': round(start + s['end'], 3), 'text': s['text'].strip()}
+            for s in segments if s['text'].strip()
+        ]
+
+    def _finalize(self, segments):
+        if segments:
+            # Condition the next window on what was just said
+            self._prompt = segments[-1]['text']
+        return [{'type': 'final', **s} for s in segments]
+
+    def _drop(self, samples):
+        with self._lock:
+            self._buffer = self._buffer[samples:]
+            self._offset += samples
@@ -0,0 +1,384 @@
+"""
+Synthetic calls, stub models and slow reference implementations
+
+Shared by the tests and benchmark_suite.py so both exercise the pipeline
+with the same data. Nothing here needs network access, a GPU or model
+downloads.
+"""
+import random
+import time
+import wave
+from collections import namedtuple
+
+import numpy as np
+
+from backends import InferenceBackend
+from config import *
+
+# Fundamental frequency of each synthetic speaker (Hz)
+VOICES = {'SPEAKER_00': 140.0, 'SPEAKER_01': 240.0}
+
+WORDS = "yes sure the account number is let me check that for you one moment please thank you".split()
+COMMON_WORDS = ("yes okay thank you the account order please check let me one moment sure "
+                "i can see that your payment was card number help today problem").split()
+RARE_WORDS = "refund chargeback cancellation supervisor complaint escalate fraud".split()
+
+
+# --- Audio -------------------------------------------------------------
+
+def tone(seconds, frequency=220):
+    """
+    A PCM16 sine wave, quiet enough to leave headroom
+    """
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (3000 * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+def write_wav(path, audio):
+    """
+    Write 16 kHz mono WAV from PCM16 samples or floats in [-1, 1]
+    """
+    if audio.dtype != np.int16:
+        audio = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(audio.tobytes())
+    return str(path)
+
+
+def write_long_wav(path, hours):
+    """
+    Stream a 16 kHz mono tone to disk a minute at a time
+    """
+    minute = tone(60).tobytes()
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        for _ in range(int(hours * 60)):
+            f.writeframes(minute)
+    return str(path)
+
+
+def synth_call(seconds, seed):
+    """
+    Alternating turns of two harmonic "voices" with pauses and line noise
+
+    Returns (float32 samples, reference turns).
+    """
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    turns = []
+    speakers = list(VOICES)
+    speaker = 0
+    t = 0.5
+    while t < seconds - 1.5:
+        end = min(t + rng.uniform(1.5, 8.0), seconds - 0.5)
+        f0 = VOICES[speakers[speaker]] * rng.uniform(0.97, 1.03)
+        start_sample, end_sample = int(t * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        tt = np.arange(end_sample - start_sample) / SAMPLE_RATE
+        voice = sum(np.sin(2 * np.pi * f0 * k * tt) / k for k in range(1, 5))
+        syllables = (0.5 + 0.5 * np.sin(2 * np.pi * 4 * tt)) ** 2
+        audio[start_sample:end_sample] += (0.2 * voice * syllables).astype(np.float32)
+        turns.append({'start': round(t, 3), 'end': round(end, 3), 'speaker': speakers[speaker]})
+
+        t = end + rng.uniform(0.3, 2.5)
+        speaker = 1 - speaker
+    audio += (0.003 * rng.standard_normal(len(audio))).astype(np.float32)
+    return audio, turns
+
+
+# --- Conversations -----------------------------------------------------
+
+def random_conversation(rng, turns, speakers):
+    """
+    Turns on a 10 ms grid that mostly alternate, sometimes overlap and leave long pauses
+    """
+    conversation = []
+    t = rng.choice([0, rng.randint(0, 800)]) / 100
+    for _ in range(turns):
+        length = rng.randint(20, 1500) / 100
+        conversation.append({
+            'start': t,
+            'end': round(t + length, 2),
+            'speaker': rng.choice(speakers),
+            'text': ' '.join('word' for _ in range(rng.randint(0, 30)))
+        })
+        # Negative steps start the next turn before this one ends
+        t = round(max(0, t + length + rng.choice([-2, -0.5, 0.3, 1, 8]) * rng.random()), 2)
+    return conversation
+
+
+def random_intervals(count, duration, speakers, rng, grid=None):
+    """
+    Random, partly overlapping intervals spread over `duration` seconds
+    """
+    intervals = []
+    for _ in range(count):
+        start = rng.uniform(0, duration)
+        end = start + rng.expovariate(count / (2 * duration))
+        if grid:
+            # Coarse times make equal overlaps (ties) and touching edges common
+            start, end = round(start / grid) * grid, round(end / grid) * grid
+        intervals.append({'start': start, 'end': end, 'speaker': rng.choice(speakers)})
+    return intervals
+
+
+def synthetic_transcript(turns, seed=7):
+    """
+    (conversation, metadata) of a two-speaker call with realistic turn lengths
+    """
+    rng = random.Random(seed)
+    conversation = []
+    t = 0.0
+    for i in range(turns):
+        length = rng.uniform(1, 12)
+        conversation.append({
+            'start': round(t, 2),
+            'end': round(t + length, 2),
+            'speaker': ('Agent', 'Customer')[i % 2],
+            'text': ' '.join(rng.choice(WORDS) for _ in range(int(length * 2.5)))
+        })
+        t += length + rng.uniform(0.1, 1.5)
+    metadata = {
+        'filename': 'synthetic.webm',
+        'duration': t,
+        'processed_at': '2024-01-01T00:00:00',
+        'speakers_detected': 2,
+        'language': 'en'
+    }
+    return conversation, metadata
+
+
+def synthetic_transcripts(calls, turns, seed):
+    """
+    (output_file, conversation, metadata) of many calls; about 2% of turns hold a rare word
+    """
+    rng = random.Random(seed)
+    for call in range(calls):
+        conversation = []
+        t = 0.0
+        for i in range(turns):
+            words = [rng.choice(COMMON_WORDS) for _ in range(rng.randint(3, 20))]
+            if rng.random() < 0.02:
+                words.insert(rng.randrange(len(words)), rng.choice(RARE_WORDS))
+            length = len(words) / 2.5
+            conversation.append({
+                'start': round(t, 2),
+                'end': round(t + length, 2),
+                'speaker': ('Agent', 'Customer')[i % 2],
+                'text': ' '.join(words)
+            })
+            t += length + rng.uniform(0.2, 2)
+        metadata = {'filename': f'call_{call:07d}.webm', 'duration': t, 'processed_at': '2024-01-01T00:00:00'}
+        yield f'/output/call_{call:07d}_transcript.txt', conversation, metadata
+
+
+# --- Stub models -------------------------------------------------------
+
+class StubTranscriber:
+    """
+    A segment every 5 s from two alternating voices, relabelled at random in every window
+
+    Stands in for AudioTranscriber.run_stages in windowed decoding: each
+    voice has a fixed embedding (plus `noise`), but window-local labels
+    are shuffled like Pyannote's.
+    """
+    def __init__(self, seed=0, noise=0.0):
+        self.voices = np.random.default_rng(seed).standard_normal((2, 64))
+        self.random = random.Random(seed)
+        self.noise = noise
+
+    def run_stages(self, audio, return_embeddings=True, cancel=None):
+        labels = ['SPEAKER_00', 'SPEAKER_01']
+        self.random.shuffle(labels)
+        segments, turns = [], []
+        for i, start in enumerate(np.arange(0, len(audio) / SAMPLE_RATE - 4.5, 5.0)):
+            segments.append({'start': start, 'end': start + 4.5, 'text': f'segment {i}'})
+            turns.append({'start': start, 'end': start + 5, 'speaker': labels[i % 2]})
+        voices = self.voices
+        if self.noise:
+            voices = voices + np.random.default_rng().standard_normal(voices.shape) * self.noise
+        embeddings = {labels[0]: voices[0], labels[1]: voices[1]}
+        return {'segments': segments, 'language': 'en'}, (turns, embeddings), {}
+
+
+Segment = namedtuple('Segment', 'start end text avg_logprob no_speech_prob compression_ratio')
+Info = namedtuple('Info', 'language')
+Turn = namedtuple('Turn', 'start end')
+
+
+def voiced_regions(audio, frame_seconds=0.02, min_gap=0.3):
+    """
+    (start, end) seconds of the frames with clearly more energy than the noise floor
+    """
+    frame = int(frame_seconds * SAMPLE_RATE)
+    frames = len(audio) // frame
+    if not frames:
+        return []
+    energy = np.sqrt(np.mean(audio[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+    voiced = energy > 0.02
+
+    regions = []
+    for index in np.flatnonzero(voiced):
+        start, end = index * frame_seconds, (index + 1) * frame_seconds
+        if regions and start - regions[-1][1] <= min_gap:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    return [tuple(r) for r in regions]
+
+
+def pitch_speaker(audio, start, end):
+    """
+    Which synthetic voice a region belongs to, from its strongest frequency
+    """
+    clip = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+    spectrum = np.abs(np.fft.rfft(clip))
+    frequencies = np.fft.rfftfreq(len(clip), 1 / SAMPLE_RATE)
+    band = (frequencies > 80) & (frequencies < 400)
+    if not band.any():
+        return 'SPEAKER_00'
+    peak = frequencies[band][np.argmax(spectrum[band])]
+    return 'SPEAKER_00' if peak < sum(VOICES.values()) / 2 else 'SPEAKER_01'
+
+
+class StubWhisperModel:
+    """
+    faster-whisper stand-in: a segment per voiced region, `rtf` seconds per second of audio
+    """
+    def __init__(self, rtf):
+        self.rtf = rtf
+
+    def transcribe(self, audio, **kwargs):
+        time.sleep(len(audio) / SAMPLE_RATE * self.rtf)
+        segments = [
+            Segment(start, end, ' ' + ' '.join(['word'] * max(1, int((end - start) * 2.5))), -0.3, 0.05, 1.4)
+            for start, end in voiced_regions(audio)
+        ]
+        return iter(segments), Info('en')
+
+
+class StubAnnotation:
+    def __init__(self, turns):
+        self.turns = turns
+
+    def itertracks(self, yield_label=False):
+        for start, end, speaker in self.turns:
+            yield Turn(start, end), None, speaker
+
+    def labels(self):
+        return sorted({speaker for _, _, speaker in self.turns})
+
+
+class StubDiarizationPipeline:
+    """
+    Pyannote stand-in: voiced regions labelled by pitch, `rtf` seconds per second of audio
+    """
+    def __init__(self, rtf):
+        self.rtf = rtf
+
+    def __call__(self, audio, return_embeddings=False, hook=None):
+        audio = audio['waveform'][0].numpy()
+        if hook:
+            hook('segmentation', None)
+        time.sleep(len(audio) / SAMPLE_RATE * self.rtf)
+        if hook:
+            hook('embeddings', None)
+        annotation = StubAnnotation([
+            (start, end, pitch_speaker(audio, start, end))
+            for start, end in voiced_regions(audio)
+        ])
+        if not return_embeddings:
+            return annotation
+        voices = {'SPEAKER_00': [1.0, 0.0], 'SPEAKER_01': [0.0, 1.0]}
+        return annotation, np.array([voices[label] for label in annotation.labels()])
+
+
+class StubBackend(InferenceBackend):
+    """
+    Loads stub models costing `*_rtf` seconds per second of audio
+    """
+    def __init__(self, whisper_rtf=0.05, diarization_rtf=0.08):
+        super().__init__(device='cpu', compute_type='stub', diarization_runtime='torch')
+        self.whisper_rtf = whisper_rtf
+        self.diarization_rtf = diarization_rtf
+
+    def configure_torch(self):
+        pass
+
+    def load_whisper(self, model_name, num_workers=None):
+        return StubWhisperModel(self.whisper_rtf)
+
+    def load_diarization(self, hf_token):
+        self.active_diarization_runtime = 'stub'
+        return StubDiarizationPipeline(self.diarization_rtf)
+
+
+# --- Reference implementations ----------------------------------------
+
+def scan_speakers(segments, diarization):
+    """
+    The original O(segments × turns) speaker lookup, one segment at a time
+    """
+    from transcriber import AudioTranscriber
+    return [
+        AudioTranscriber.find_speaker_for_segment(None, s['start'], s['end'], diarization)
+        for s in segments
+    ]
+
+
+def reference_analytics(conversation, duration, dead_air_seconds, resolution=0.01):
+    """
+    conversation_analytics figures by walking a 10 ms timeline and the turns one at a time
+
+    Exact for turn times on the `resolution` grid (see random_conversation).
+    """
+    turns = sorted(conversation, key=lambda turn: turn['start'])
+    duration = max([duration or 0] + [turn['end'] for turn in turns])
+    talking = [set() for _ in range(int(round(duration / resolution)))]
+    for turn in turns:
+        for cell in range(int(round(turn['start'] / resolution)), int(round(turn['end'] / resolution))):
+            talking[cell].add(turn['speaker'])
+
+    speakers = sorted({turn['speaker'] for turn in turns})
+    talk = {s: sum(s in cell for cell in talking) * resolution for s in speakers}
+    speech = sum(bool(cell) for cell in talking) * resolution
+
+    gaps, run = [], 0
+    for cell in talking + [{'end'}]:
+        if cell and run:
+            gaps.append(run * resolution)
+        run = 0 if cell else run + 1
+    dead_air = [g for g in gaps if g >= dead_air_seconds - 1e-9]
+
+    interruptions = {s: 0 for s in speakers}
+    for i, turn in enumerate(turns):
+        if any(other['speaker'] != turn['speaker'] and other['end'] > turn['start'] for other in turns[:i]):
+            interruptions[turn['speaker']] += 1
+
+    monologues = []
+    for turn in turns:
+        if monologues and monologues[-1][0] == turn['speaker']:
+            monologues[-1][2] = max(monologues[-1][2], turn['end'])
+        else:
+            monologues.append([turn['speaker'], turn['start'], turn['end']])
+    longest = max(monologues, key=lambda m: m[2] - m[1]) if monologues else None
+
+    words = {s: sum(len(t['text'].split()) for t in turns if t['speaker'] == s) for s in speakers}
+    return {
+        'talk_seconds': {s: round(talk[s], 2) for s in speakers},
+        'words_per_minute': {s: round(words[s] / talk[s] * 60, 1) if talk[s] else 0.0 for s in speakers},
+        'interruptions': interruptions,
+        'speech_seconds': round(speech, 2),
+        'silence_seconds': round(duration - speech, 2),
+        'overlap_seconds': round(sum(talk.values()) - speech, 2),
+        'dead_air': {
+            'count': len(dead_air),
+            'seconds': round(sum(dead_air), 2),
+            'longest_seconds': round(max(dead_air), 2) if dead_air else 0.0
+        },
+        'longest_monologue_seconds': round(longest[2] - longest[1], 2) if longest else None
+    }
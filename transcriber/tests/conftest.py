@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The transcriber modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the result cache and search index that modules open on import out of ./cache
+_state = tempfile.mkdtemp(prefix='transcriber-tests-')
+os.environ['CACHE_PATH'] = os.path.join(_state, 'transcripts.sqlite3')
+os.environ['SEARCH_INDEX_PATH'] = os.path.join(_state, 'search.sqlite3')
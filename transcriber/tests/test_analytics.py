@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from analytics import conversation_analytics
+from synthetic import random_conversation, reference_analytics
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_matches_the_reference_on_random_calls(seed):
+    rng = random.Random(seed)
+    speakers = ['Agent', 'Customer', 'Supervisor'][:rng.choice([1, 2, 3])]
+    conversation = random_conversation(rng, rng.randint(1, 120), speakers)
+    duration = conversation[-1]['end'] + rng.choice([0, 4, 20])
+    rng.shuffle(conversation)
+
+    result = conversation_analytics(conversation, duration, dead_air_seconds=5)
+    expected = reference_analytics(conversation, duration, 5)
+
+    assert result['talk_seconds'] == pytest.approx(expected['talk_seconds'], abs=0.011)
+    assert result['interruptions'] == expected['interruptions']
+    for key in ('speech_seconds', 'silence_seconds', 'overlap_seconds'):
+        assert result[key] == pytest.approx(expected[key], abs=0.011), key
+    assert result['dead_air']['count'] == expected['dead_air']['count']
+    assert result['dead_air']['seconds'] == pytest.approx(expected['dead_air']['seconds'], abs=0.011)
+    assert result['words_per_minute'] == pytest.approx(expected['words_per_minute'], abs=0.2)
+    longest = result['longest_monologue']['seconds'] if result['longest_monologue'] else None
+    assert longest == pytest.approx(expected['longest_monologue_seconds'], abs=0.011)
+    assert sum(result['talk_ratio'].values()) == pytest.approx(1, abs=0.01)
+
+
+def test_overlap_and_interruption_are_credited_to_whoever_cuts_in():
+    conversation = [
+        {'start': 0, 'end': 10, 'speaker': 'Agent', 'text': 'a long explanation of the plan'},
+        {'start': 3, 'end': 4, 'speaker': 'Customer', 'text': 'okay'},
+        {'start': 12, 'end': 13, 'speaker': 'Customer', 'text': 'thanks'}
+    ]
+    result = conversation_analytics(conversation, 20, dead_air_seconds=5)
+    assert result['interruptions'] == {'Agent': 0, 'Customer': 1}
+    assert result['overlap_seconds'] == 1.0
+    assert result['speech_seconds'] == 11.0
+    assert result['dead_air'] == {'count': 1, 'seconds': 7.0, 'longest_seconds': 7.0}
+    assert result['longest_monologue'] == {'speaker': 'Agent', 'start': 0.0, 'seconds': 10.0}
+    assert result['words_per_minute']['Agent'] == pytest.approx(6 / 10 * 60, abs=0.1)
+
+
+def test_consecutive_turns_by_one_speaker_are_one_monologue():
+    conversation = [
+        {'start': 0, 'end': 4, 'speaker': 'Agent', 'text': 'one'},
+        {'start': 3, 'end': 9, 'speaker': 'Agent', 'text': 'two'},
+        {'start': 10, 'end': 12, 'speaker': 'Customer', 'text': 'three'}
+    ]
+    result = conversation_analytics(conversation, 12)
+    assert result['longest_monologue']['seconds'] == 9.0
+    assert result['talk_seconds'] == {'Agent': 9.0, 'Customer': 2.0}
+    assert result['interruptions'] == {'Agent': 0, 'Customer': 0}
+
+
+@pytest.mark.parametrize('duration, dead_air', [(30, 30.0), (3, 0.0), (None, 0.0)])
+def test_silent_call(duration, dead_air):
+    result = conversation_analytics([], duration, dead_air_seconds=5)
+    assert result['speech_seconds'] == 0.0
+    assert result['silence_seconds'] == (duration or 0)
+    assert result['dead_air']['seconds'] == dead_air
+    assert result['dead_air']['count'] == (1 if dead_air else 0)
+    assert result['longest_monologue'] is None
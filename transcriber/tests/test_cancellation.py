@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('httpx')
+
+import metrics
+import transcriber_api
+from cancellation import Cancelled, CancelToken
+from model_pool import ModelPool
+from transcriber import AudioTranscriber
+
+
+class LoopingTranscriber(AudioTranscriber):
+    """
+    An AudioTranscriber without models whose work never ends unless cancelled
+    """
+    def __init__(self):
+        self.started = threading.Event()
+        self.stopped = threading.Event()
+
+    def _transcribe_file(self, audio_file, on_stage, *args):
+        cancel = args[-1]
+        cancel.stage = 'transcribing'
+        self.started.set()
+        try:
+            while True:
+                cancel.check()
+                time.sleep(0.01)
+        finally:
+            self.stopped.set()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = LoopingTranscriber()
+    pool = ModelPool(replicas=1, max_in_flight=1, cpu_threads=1, factory=lambda index, cpu_threads, cache: stub)
+    pool.load()
+    monkeypatch.setattr(transcriber_api, 'model_pool', pool)
+    stub.pool = pool
+    return stub
+
+
+def test_check_raises_once_cancelled_or_due():
+    token = CancelToken()
+    token.check()
+    token.cancel('disconnected')
+    token.cancel('deadline')
+    with pytest.raises(Cancelled) as error:
+        token.check()
+    assert error.value.reason == 'disconnected'
+
+    token = CancelToken(timeout=0.01)
+    assert token.remaining() > 0
+    time.sleep(0.02)
+    assert token.cancelled and token.reason == 'deadline' and token.remaining() == 0
+    assert CancelToken().remaining() is None
+
+
+def test_deadline_stops_the_work_and_frees_the_replica(stub, tmp_path):
+    from fastapi.testclient import TestClient
+
+    recording = tmp_path / 'call.wav'
+    recording.write_bytes(b'RIFF')
+    before = metrics.CANCELLED.value(reason='deadline', stage='transcribing')
+
+    response = TestClient(transcriber_api.app).post(
+        '/transcribe-from-path',
+        json={'file_path': str(recording)},
+        headers={'X-Request-Timeout': '0.2'}
+    )
+
+    assert response.status_code == 504
+    assert 'deadline' in response.json()['detail']
+    assert stub.stopped.is_set()
+    assert stub.pool.stats()['in_flight'] == 0
+    assert metrics.CANCELLED.value(reason='deadline', stage='transcribing') == before + 1
+
+
+def test_disconnect_stops_the_work_and_frees_the_replica(stub, tmp_path):
+    recording = tmp_path / 'call.wav'
+    recording.write_bytes(b'RIFF')
+    before = metrics.CANCELLED.value(reason='disconnected', stage='transcribing')
+    body = json.dumps({'file_path': str(recording)}).encode()
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': '/transcribe-from-path', 'raw_path': b'/transcribe-from-path',
+        'root_path': '', 'query_string': b'', 'server': ('test', 80), 'client': ('test', 1234),
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    }
+    sent = []
+
+    async def run():
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # The client hangs up once the work has started
+            while not stub.started.is_set():
+                await asyncio.sleep(0.01)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await asyncio.wait_for(transcriber_api.app(scope, receive, send), timeout=10)
+
+    asyncio.run(run())
+
+    assert sent[0]['status'] == 499
+    assert stub.stopped.is_set()
+    assert stub.pool.stats()['in_flight'] == 0
+    assert metrics.CANCELLED.value(reason='disconnected', stage='transcribing') == before + 1
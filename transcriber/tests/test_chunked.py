@@ -0,0 +1,168 @@
+import shutil
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import chunked
+import process_recordings
+import transcriber
+from chunked import transcribe_in_windows
+from config import SAMPLE_RATE
+from synthetic import StubTranscriber, tone, write_wav
+from utils import iter_audio_windows
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+
+
+@needs_ffmpeg
+def test_windows_cover_the_audio_exactly(tmp_path):
+    samples = tone(95)
+    write_wav(tmp_path / 'call.wav', samples)
+
+    windows = list(iter_audio_windows(str(tmp_path / 'call.wav'), 30, 5, SAMPLE_RATE))
+    assert [start for start, _, _ in windows] == [0, 25 * SAMPLE_RATE, 50 * SAMPLE_RATE, 75 * SAMPLE_RATE]
+    assert [last for _, _, last in windows] == [False, False, False, True]
+
+    # Stitching the windows back (dropping each overlap) gives the whole recording
+    stitched = np.concatenate([windows[0][1]] + [w[1][5 * SAMPLE_RATE:] for w in windows[1:]])
+    np.testing.assert_allclose(stitched, samples / 32768, atol=1e-4)
+
+
+@needs_ffmpeg
+def test_memory_stays_bounded_on_long_recordings(tmp_path):
+    seconds = 30 * 60
+    write_wav(tmp_path / 'long.wav', tone(seconds))
+
+    tracemalloc.start()
+    try:
+        transcription, diarization, _, audio_seconds = transcribe_in_windows(
+            StubTranscriber(), str(tmp_path / 'long.wav'), window_seconds=60, overlap_seconds=5
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    full_decode = seconds * SAMPLE_RATE * 4
+    assert audio_seconds == pytest.approx(seconds)
+    assert peak < full_decode / 5
+
+    # Nothing duplicated or dropped at the seams, and speakers stitched across windows
+    starts = [s['start'] for s in transcription['segments']]
+    assert starts == [5.0 * i for i in range(seconds // 5)]
+    assert {turn['speaker'] for turn in diarization} == {'SPEAKER_00', 'SPEAKER_01'}
+
+
+def test_batches_do_not_prefetch_chunked_recordings(tmp_path, monkeypatch):
+    small, large = tmp_path / 'small.wav', tmp_path / 'large.wav'
+    small.write_bytes(b'0' * 10)
+    large.write_bytes(b'0' * 1000)
+    decoded, processed = [], []
+
+    def fake_decode(path, sample_rate):
+        decoded.append(path)
+        return np.zeros(10, dtype=np.float32)
+
+    def fake_process(transcriber, audio_file, output_dir, audio=None):
+        processed.append((audio_file, audio is not None))
+        return {'file': audio_file, 'status': 'success'}
+
+    monkeypatch.setattr(process_recordings, 'AudioTranscriber', lambda **kwargs: None)
+    monkeypatch.setattr(process_recordings, 'decode_audio', fake_decode)
+    monkeypatch.setattr(process_recordings, 'process_file', fake_process)
+    monkeypatch.setattr(process_recordings, 'IN_MEMORY_DECODE', True)
+    monkeypatch.setattr(process_recordings, 'CHUNKED_MIN_BYTES', 100)
+
+    files = [str(small), str(large), str(small)]
+    list(process_recordings.run_serial(files, str(tmp_path), prefetch=2))
+
+    assert decoded == [str(small), str(small)]
+    assert processed == [(str(small), True), (str(large), False), (str(small), True)]
+
+
+class StubVoiceprints:
+    def __init__(self, voiceprint):
+        self.voiceprint = voiceprint
+
+    def get(self, agent_id):
+        return self.voiceprint
+
+    def version(self, agent_id):
+        return 1
+
+
+def bare_transcriber(stub, voiceprint=None):
+    """
+    An AudioTranscriber without models, running `stub`'s stages
+    """
+    t = transcriber.AudioTranscriber.__new__(transcriber.AudioTranscriber)
+    t.cache = None
+    t.parallel_stages = False
+    t.voiceprints = StubVoiceprints(voiceprint)
+    t.run_stages = stub.run_stages
+    return t
+
+
+def fake_windows(seconds, window_seconds, overlap_seconds):
+    """
+    iter_audio_windows over `seconds` of silence, without ffmpeg or the memory
+    """
+    window, step = int(window_seconds * SAMPLE_RATE), int((window_seconds - overlap_seconds) * SAMPLE_RATE)
+    total = int(seconds * SAMPLE_RATE)
+    def windows(source, *args):
+        for start in range(0, total, step):
+            length = min(window, total - start)
+            yield start, np.broadcast_to(np.float32(0), (length,)), start + length >= total
+            if start + length >= total:
+                break
+    return windows
+
+
+def test_chunked_recordings_are_attributed_by_voiceprint(tmp_path, monkeypatch):
+    stub = StubTranscriber()
+    voiceprint = stub.voices[0] / np.linalg.norm(stub.voices[0])
+    large = tmp_path / 'large.wav'
+    large.write_bytes(b'0' * 1000)
+    monkeypatch.setattr(transcriber, 'CHUNKED_MIN_BYTES', 100)
+    monkeypatch.setattr(chunked, 'iter_audio_windows', fake_windows(1500, chunked.CHUNK_SECONDS, chunked.CHUNK_OVERLAP_SECONDS))
+
+    result = bare_transcriber(stub, voiceprint).transcribe_file(str(large), agent_id='alice')
+
+    # Every other 5 s segment is the enrolled voice, whichever window it fell in
+    speakers = [turn['speaker'] for turn in result['conversation']]
+    assert len(speakers) == 300
+    assert speakers == ['Agent', 'Customer'] * 150
+    assert result['metadata']['speaker_source'] == 'diarization+voiceprint'
+    assert result['metadata']['agent_id'] == 'alice'
+
+
+def test_chunked_recordings_keep_diarization_labels_for_unknown_voices(monkeypatch):
+    stub = StubTranscriber()
+    monkeypatch.setattr(chunked, 'iter_audio_windows', fake_windows(300, 120, 10))
+
+    voiceprint = np.zeros(64)
+    voiceprint[0] = 1.0
+    stub.voices[:, 0] = -10  # Both voices point away from the voiceprint
+    transcription, turns, _, _ = transcribe_in_windows(stub, 'call.wav', 120, 10, voiceprint=voiceprint)
+
+    assert transcription['speaker_source'] == 'diarization'
+    assert {turn['speaker'] for turn in turns} == {'SPEAKER_00', 'SPEAKER_01'}
+
+
+def test_per_channel_input_is_decoded_in_full_whatever_its_size(tmp_path, monkeypatch):
+    large = tmp_path / 'stereo.wav'
+    large.write_bytes(b'0' * 1000)
+    channels = [np.zeros(SAMPLE_RATE * 10, dtype=np.float32), np.ones(SAMPLE_RATE * 10, dtype=np.float32)]
+    monkeypatch.setattr(transcriber, 'CHUNKED_MIN_BYTES', 100)
+    monkeypatch.setattr(transcriber, 'decode_channels', lambda source, sample_rate: channels)
+    monkeypatch.setattr(chunked, 'transcribe_in_windows', lambda *args, **kwargs: pytest.fail('per-channel input was windowed'))
+
+    t = bare_transcriber(StubTranscriber())
+    t.transcribe_audio = lambda audio, on_segment=None, cancel=None: {
+        'segments': [{'start': float(audio[0]), 'end': float(audio[0]) + 1, 'text': 'hello'}],
+        'language': 'en'
+    }
+    result = t.transcribe_file(str(large), channels=True)
+
+    assert [turn['speaker'] for turn in result['conversation']] == ['Agent', 'Customer']
+    assert result['metadata']['speaker_source'] == 'channels'
@@ -0,0 +1,163 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from config import SAMPLE_RATE
+from jobs import JobQueue, QueueFullError
+from synthetic import write_wav
+
+
+class StubTranscriber:
+    """
+    Returns a one-turn call; holds every job while `gate` is clear, stopping if cancelled
+    """
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = []
+
+    def transcribe_file(self, path, on_stage=None, cancel=None, **options):
+        self.started.append(path)
+        on_stage('transcribing')
+        while not self.gate.wait(0.01):
+            cancel.check()
+        return {
+            'conversation': [{'start': 0.0, 'end': 1.0, 'speaker': 'Agent', 'text': 'hello'}],
+            'metadata': {'filename': path, 'duration': 1.0, 'processed_at': '2024-01-01T00:00:00',
+                         'options': options}
+        }
+
+
+def silence(path, seconds=1):
+    return write_wav(path, np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16))
+
+
+@pytest.fixture
+def stub():
+    stub = StubTranscriber()
+    yield stub
+    stub.gate.set()
+
+
+@pytest.fixture
+def jobs(stub, tmp_path):
+    jobs = JobQueue(stub, workers=1, max_queued=2, output_dir=str(tmp_path / 'out'))
+    jobs.start()
+    yield jobs
+    stub.gate.set()
+    jobs.stop(timeout=5)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_submit_runs_the_job_and_keeps_its_result(jobs, stub, tmp_path):
+    job = jobs.submit(silence(tmp_path / 'call.wav', 3), save=False, channels=True)
+    assert job.duration == pytest.approx(3)
+    assert jobs.wait(job.id, timeout=5).status == 'completed'
+
+    assert jobs.get(job.id) is job
+    assert job.result['status'] == 'success'
+    assert job.result['conversation'][0]['text'] == 'hello'
+    assert job.result['metadata']['options'] == {'channels': True}
+    assert job.to_dict()['status'] == 'completed' and job.to_dict()['finished_at']
+    assert jobs.stats()['completed'] == 1
+    assert jobs.get('missing') is None
+
+
+def test_saved_jobs_list_their_outputs(jobs, tmp_path):
+    job = jobs.submit(silence(tmp_path / 'call.wav'))
+    jobs.wait(job.id, timeout=5)
+    assert job.status == 'completed'
+    assert job.outputs and all(path.startswith(str(tmp_path / 'out')) for path in job.outputs)
+
+
+def test_status_follows_the_job(jobs, stub, tmp_path):
+    stub.gate.clear()
+    job = jobs.submit(silence(tmp_path / 'call.wav'), save=False)
+    wait_for(lambda: job.status == 'processing')
+    assert job.stage == 'transcribing'
+    assert jobs.stats()['processing'] == 1
+
+    stub.gate.set()
+    jobs.wait(job.id, timeout=5)
+    assert job.status == 'completed' and job.stage is None
+
+
+def test_cancel_a_queued_job_frees_its_slot(jobs, stub, tmp_path):
+    stub.gate.clear()
+    running = jobs.submit(silence(tmp_path / 'a.wav'), save=False)
+    wait_for(lambda: running.status == 'processing')
+    queued = jobs.submit(silence(tmp_path / 'b.wav'), save=False)
+
+    assert jobs.cancel(queued.id).status == 'cancelled'
+    assert jobs.stats()['queued'] == 0
+    stub.gate.set()
+    jobs.wait(running.id, timeout=5)
+    assert stub.started == [running.file_path]
+
+
+def test_cancel_a_running_job_stops_it(jobs, stub, tmp_path):
+    stub.gate.clear()
+    job = jobs.submit(silence(tmp_path / 'call.wav'), save=False)
+    wait_for(lambda: job.status == 'processing')
+
+    jobs.cancel(job.id)
+    assert jobs.wait(job.id, timeout=5).status == 'cancelled'
+    assert job.result is None
+    assert jobs.cancel('missing') is None
+
+
+def test_a_full_queue_rejects_new_jobs(jobs, stub, tmp_path):
+    stub.gate.clear()
+    running = jobs.submit(silence(tmp_path / 'a.wav'), save=False)
+    wait_for(lambda: running.status == 'processing')
+    waiting = [jobs.submit(silence(tmp_path / f'{i}.wav'), save=False) for i in range(2)]
+
+    with pytest.raises(QueueFullError):
+        jobs.submit(silence(tmp_path / 'late.wav'), save=False)
+    assert jobs.stats()['queued'] == 2
+    assert all(jobs.get(job.id) for job in waiting)
+
+
+def test_stop_does_not_block_on_a_full_queue(jobs, stub, tmp_path):
+    stub.gate.clear()
+    running = jobs.submit(silence(tmp_path / 'a.wav'), save=False)
+    wait_for(lambda: running.status == 'processing')
+    waiting = [jobs.submit(silence(tmp_path / f'{i}.wav'), save=False) for i in range(2)]
+
+    stopper = threading.Thread(target=jobs.stop, kwargs={'timeout': 0.1})
+    stopper.start()
+    stopper.join(2)
+    assert not stopper.is_alive()
+
+    # The worker finishes its job and exits without starting the queued ones
+    stub.gate.set()
+    jobs.wait(running.id, timeout=5)
+    time.sleep(0.1)
+    assert [job.status for job in waiting] == ['queued', 'queued']
+
+
+def test_slow_callbacks_do_not_hold_up_the_worker(jobs, tmp_path, monkeypatch):
+    release = threading.Event()
+    delivered = []
+
+    def slow_callback(job):
+        release.wait(5)
+        delivered.append(job.id)
+
+    monkeypatch.setattr(jobs, '_send_callback', slow_callback)
+    first = jobs.submit(silence(tmp_path / 'a.wav'), callback_url='http://example.invalid', save=False)
+    second = jobs.submit(silence(tmp_path / 'b.wav'), callback_url='http://example.invalid', save=False)
+
+    assert jobs.wait(second.id, timeout=2).status == 'completed'
+    assert delivered == []
+    release.set()
+    wait_for(lambda: len(delivered) == 2)
+    assert set(delivered) == {first.id, second.id}
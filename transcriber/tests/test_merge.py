@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from synthetic import random_intervals, scan_speakers
+from utils import find_speakers_for_segments
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('grid', [None, 1.0])
+def test_sweep_matches_scan(seed, grid):
+    rng = random.Random(seed)
+    segments = random_intervals(300, 600, ['-'], rng, grid)
+    diarization = random_intervals(rng.choice([0, 5, 300]), 600, ['SPEAKER_00', 'SPEAKER_01', 'SPEAKER_02'], rng, grid)
+
+    expected = scan_speakers(segments, diarization)
+    assert find_speakers_for_segments(segments, diarization) == expected
+
+
+def test_ties_go_to_the_first_speaker_in_diarization_order():
+    segment = [{'start': 0, 'end': 4}]
+    diarization = [
+        {'start': 2, 'end': 6, 'speaker': 'SPEAKER_01'},
+        {'start': -2, 'end': 2, 'speaker': 'SPEAKER_00'}
+    ]
+    assert find_speakers_for_segments(segment, diarization) == ['SPEAKER_01']
+
+
+def test_overlaps_are_summed_per_speaker():
+    segment = [{'start': 0, 'end': 10}]
+    diarization = [
+        {'start': 0, 'end': 2, 'speaker': 'SPEAKER_00'},
+        {'start': 2, 'end': 6, 'speaker': 'SPEAKER_01'},
+        {'start': 6, 'end': 9, 'speaker': 'SPEAKER_00'}
+    ]
+    assert find_speakers_for_segments(segment, diarization) == ['SPEAKER_00']
+
+
+def test_segments_without_overlap_are_unknown():
+    segments = [{'start': 0, 'end': 1}, {'start': 5, 'end': 6}, {'start': 8, 'end': 9}]
+    diarization = [{'start': 1, 'end': 5, 'speaker': 'SPEAKER_00'}]
+    assert find_speakers_for_segments(segments, diarization) == ['UNKNOWN', 'UNKNOWN', 'UNKNOWN']
+    assert find_speakers_for_segments(segments, []) == ['UNKNOWN'] * 3
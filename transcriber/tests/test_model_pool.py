@@ -0,0 +1,39 @@
+import pytest
+
+from backends import InferenceBackend, split_cpu_threads
+from model_pool import ModelPool, PoolSaturatedError
+
+
+class StubTranscriber:
+    def __init__(self, cpu_threads):
+        whisper, diarization = split_cpu_threads(cpu_threads, parallel_stages=True)
+        self.backend = InferenceBackend(device='cpu', whisper_cpu_threads=whisper, torch_threads=diarization)
+
+
+@pytest.mark.parametrize('budget, parallel, expected', [
+    (8, True, (4, 4)),
+    (7, True, (4, 3)),
+    (1, True, (1, 1)),
+    (8, False, (8, 8))
+])
+def test_parallel_stages_share_the_replica_budget(budget, parallel, expected):
+    assert split_cpu_threads(budget, parallel) == expected
+
+
+def test_pool_reports_the_threads_each_stage_gets():
+    pool = ModelPool(replicas=2, max_in_flight=1, cpu_threads=6,
+                     factory=lambda index, cpu_threads, cache: StubTranscriber(cpu_threads))
+    pool.load()
+    stats = pool.stats()
+    assert stats['cpu_threads_per_replica'] == 6
+    assert stats['stage_cpu_threads'] == {'whisper': 3, 'diarization': 3}
+
+
+def test_lease_rejects_when_every_replica_is_busy():
+    pool = ModelPool(replicas=1, max_in_flight=1, cpu_threads=2,
+                     factory=lambda index, cpu_threads, cache: StubTranscriber(cpu_threads))
+    pool.load()
+    with pool.lease():
+        with pytest.raises(PoolSaturatedError):
+            pool.acquire()
+    assert pool.stats()['in_flight'] == 0
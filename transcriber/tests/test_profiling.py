@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import metrics
+import profiling
+from profiling import REQUEST_PROFILER, SamplingProfiler, profiled
+
+
+def spin(seconds):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def request_work():
+    spin(0.2)
+
+
+def other_request():
+    spin(0.4)
+
+
+def test_request_profile_only_samples_the_requests_threads():
+    profiler = SamplingProfiler(interval=0.005, only_watched=True).start()
+    bystander = threading.Thread(target=other_request)
+    bystander.start()
+
+    context = REQUEST_PROFILER.set(profiler)
+    try:
+        worker = threading.Thread(target=profiled(request_work))
+    finally:
+        REQUEST_PROFILER.reset(context)
+    worker.start()
+    worker.join()
+    bystander.join()
+    profiler.stop()
+
+    stacks = ''.join(profiler.samples)
+    assert 'request_work' in stacks
+    assert 'other_request' not in stacks
+    assert not profiler.watched
+
+
+def test_profiled_is_a_no_op_outside_a_profiled_request():
+    assert profiled(request_work) is request_work
+
+
+def test_streamed_response_is_profiled_to_its_end(tmp_path, monkeypatch):
+    pytest.importorskip('httpx')
+    import transcriber_api
+    from starlette.responses import StreamingResponse
+
+    monkeypatch.setattr(transcriber_api, 'PROFILE_TOKEN', 'secret')
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+
+    async def app(scope, receive, send):
+        async def body():
+            yield b'first\n'
+            # Work handed to a thread after the headers have gone out
+            await asyncio.get_running_loop().run_in_executor(None, profiled(request_work))
+            yield b'last\n'
+        await StreamingResponse(body())(scope, receive, send)
+
+    scope = {'type': 'http', 'path': '/transcribe-stream', 'headers': [(b'x-profile-token', b'secret')]}
+    sent = []
+
+    async def receive():
+        # The client stays connected
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(transcriber_api.RequestTracker(app)(scope, receive, send))
+
+    name = dict(sent[0]['headers'])[b'x-profile-file'].decode()
+    assert b''.join(m.get('body', b'') for m in sent[1:]) == b'first\nlast\n'
+    assert 'request_work' in (tmp_path / name).read_text()
+
+
+def test_cache_hits_and_misses_are_counters():
+    import transcriber_api
+
+    rendered = metrics.render()
+    for name in ('cache_hits', 'cache_misses', 'vad_cache_hits', 'vad_cache_misses'):
+        assert f"# TYPE transcriber_{name}_total counter" in rendered
@@ -0,0 +1,97 @@
+import queue
+import time
+
+import pytest
+
+from scheduler import ScheduledQueue, duration_class
+
+
+class StubJob:
+    def __init__(self, name, priority='normal', seconds=60, waited=0):
+        self.name = name
+        self.priority = priority
+        self.expected_seconds = seconds
+        self.created_at = time.time() - waited
+
+
+def drain(q):
+    return [q.get_nowait().name for _ in range(q.qsize())]
+
+
+def test_higher_priority_classes_run_first():
+    q = ScheduledQueue()
+    for job in [StubJob('low', 'low'), StubJob('normal'), StubJob('high', 'high')]:
+        q.put(job)
+    assert drain(q) == ['high', 'normal', 'low']
+
+
+def test_shortest_recording_first_within_a_priority():
+    q = ScheduledQueue(aging_rate=0)
+    for name, seconds in [('long', 3600), ('short', 30), ('medium', 600)]:
+        q.put(StubJob(name, seconds=seconds))
+    assert drain(q) == ['short', 'medium', 'long']
+
+
+def test_oldest_first_when_shortest_first_is_off():
+    q = ScheduledQueue(shortest_first=False)
+    for name, seconds, waited in [('new', 10, 0), ('old', 3600, 100), ('middle', 60, 50)]:
+        q.put(StubJob(name, seconds=seconds, waited=waited))
+    assert drain(q) == ['old', 'middle', 'new']
+
+
+def test_aging_promotes_a_starved_long_job():
+    q = ScheduledQueue(aging_rate=4)
+    # An hour-long call gains 4 s of head start per second queued, so after
+    # 15 minutes it outranks a fresh 10-minute call
+    q.put(StubJob('fresh', seconds=600))
+    q.put(StubJob('starved', seconds=3600, waited=15 * 60))
+    assert drain(q) == ['starved', 'fresh']
+
+    q.put(StubJob('fresh', seconds=600))
+    q.put(StubJob('recent', seconds=3600, waited=60))
+    assert drain(q) == ['fresh', 'recent']
+
+
+def test_aging_can_cross_priority_classes():
+    q = ScheduledQueue(priority_step=7200, aging_rate=4)
+    q.put(StubJob('high', 'high', seconds=60))
+    q.put(StubJob('low', 'low', seconds=60, waited=3600 + 60))
+    assert drain(q) == ['low', 'high']
+
+
+def test_stop_markers_come_last():
+    q = ScheduledQueue()
+    q.put(None)
+    q.put(StubJob('job', 'low', seconds=10 ** 6))
+    assert q.get_nowait().name == 'job'
+    assert q.get_nowait() is None
+
+
+def test_discard_frees_the_slot():
+    q = ScheduledQueue(maxsize=2)
+    first, second = StubJob('first'), StubJob('second')
+    q.put(first)
+    q.put(second)
+    with pytest.raises(queue.Full):
+        q.put_nowait(StubJob('third'))
+
+    assert q.discard(first)
+    assert not q.discard(first)
+    q.put_nowait(StubJob('third'))
+    assert drain(q) == ['second', 'third']
+
+
+def test_discard_counts_as_done_for_join():
+    q = ScheduledQueue()
+    job = StubJob('job')
+    q.put(job)
+    q.discard(job)
+    assert q.unfinished_tasks == 0
+    q.join()  # Would block if the discarded job were still owed a task_done()
+
+
+@pytest.mark.parametrize('seconds, expected', [
+    (None, 'unknown'), (0, 'under_5m'), (299, 'under_5m'), (300, '5m_to_30m'), (1800, 'over_30m')
+])
+def test_duration_class(seconds, expected):
+    assert duration_class(seconds) == expected
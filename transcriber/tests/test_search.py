@@ -0,0 +1,189 @@
+import json
+import os
+
+import pytest
+
+import config
+import search
+from search import TranscriptIndex, match_query
+from utils import save_transcription
+
+REFUND_CALL = [
+    {'start': 0.0, 'end': 2.0, 'speaker': 'Agent', 'text': 'Thank you for calling, how can I help?'},
+    {'start': 2.5, 'end': 6.0, 'speaker': 'Customer', 'text': 'I would like a refund for my order'},
+    {'start': 6.5, 'end': 9.0, 'speaker': 'Agent', 'text': 'I can process that refund today'}
+]
+BILLING_CALL = [
+    {'start': 0.0, 'end': 3.0, 'speaker': 'Customer', 'text': 'My card was charged twice'},
+    {'start': 3.5, 'end': 5.0, 'speaker': 'Agent', 'text': 'Let me check the payment'}
+]
+
+
+def metadata(name):
+    return {'filename': f'{name}.webm', 'duration': 10.0, 'processed_at': '2024-01-01T00:00:00'}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return TranscriptIndex(str(tmp_path / 'search.sqlite3'))
+
+
+def texts(hits):
+    return [hit['text'] for hit in hits]
+
+
+def test_match_query_quotes_user_input():
+    assert match_query('refund order') == '"refund" AND "order"'
+    assert match_query('"thank you" refu*') == '"thank you" AND "refu" *'
+    assert match_query('thank you', phrase=True) == '"thank you"'
+    assert match_query('OR NOT ) ( :') == '"OR" AND "NOT"'
+    with pytest.raises(ValueError):
+        match_query('" * -')
+
+
+def test_search_words_phrases_prefixes_and_speakers(index):
+    index.add('/out/refund_transcript.txt', REFUND_CALL, metadata('refund'))
+    index.add('/out/billing_transcript.txt', BILLING_CALL, metadata('billing'))
+
+    hits, cursor = index.search('refund')
+    assert texts(hits) == ['I can process that refund today', 'I would like a refund for my order']
+    assert cursor is None
+    assert hits[0]['highlight'] == 'I can process that <mark>refund</mark> today'
+    assert hits[0]['call']['filename'] == 'refund.webm'
+    assert (hits[0]['start'], hits[0]['end'], hits[0]['speaker']) == (6.5, 9.0, 'Agent')
+
+    assert texts(index.search('refund', speaker='Customer')[0]) == ['I would like a refund for my order']
+    assert texts(index.search('charged twice', phrase=True)[0]) == ['My card was charged twice']
+    assert index.search('twice charged', phrase=True)[0] == []
+    assert texts(index.search('pay*')[0]) == ['Let me check the payment']
+    assert len(index.search('refund', sort='relevance')[0]) == 2
+
+
+
+def test_speaker_filter_matches_the_whole_label(index):
+    second_agent = [dict(turn, speaker=turn['speaker'].replace('Agent', 'Agent 2')) for turn in REFUND_CALL]
+    index.add('/out/refund_transcript.txt', REFUND_CALL, metadata('refund'))
+    index.add('/out/transfer_transcript.txt', second_agent, metadata('transfer'))
+
+    hits, _ = index.search('refund', speaker='Agent')
+    assert [(hit['speaker'], hit['call']['filename']) for hit in hits] == [('Agent', 'refund.webm')]
+    assert len(index.search('refund', speaker='Agent 2')[0]) == 1
+    assert index.search('refund', speaker='agent')[0] == []
+
+def test_reindexing_a_transcript_replaces_it(index):
+    index.add('/out/call_transcript.txt', REFUND_CALL, metadata('call'))
+    index.add('/out/call_transcript.txt', BILLING_CALL, metadata('call'))
+    assert index.search('refund')[0] == []
+    assert len(index.search('card')[0]) == 1
+
+
+@pytest.mark.parametrize('sort', ['recent', 'relevance'])
+def test_cursor_pages_through_every_hit_once(index, sort):
+    index.add_many(
+        (f'/out/call{i}_transcript.txt', REFUND_CALL, metadata(f'call{i}'))
+        for i in range(7)
+    )
+    pages, cursor = [], None
+    while True:
+        hits, cursor = index.search('refund', sort=sort, limit=3, cursor=cursor)
+        pages.append(hits)
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [3, 3, 3, 3, 2]
+    seen = [(hit['call']['filename'], hit['start']) for page in pages for hit in page]
+    assert len(set(seen)) == 14
+    if sort == 'recent':
+        assert seen[0][0] == 'call6.webm'
+
+
+def test_rebuild_indexes_only_transcripts(index, tmp_path):
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    save_transcription(str(output_dir / 'refund_transcript.txt'), REFUND_CALL, metadata('refund'), formats=['json'])
+    save_transcription(str(output_dir / 'billing_transcript.txt'), BILLING_CALL, metadata('billing'),
+                       formats=['ndjson.gz'], text=False)
+    # Batch runs write these next to the transcripts
+    (output_dir / 'manifest.json').write_text(json.dumps({'/recordings/a.webm': {'status': 'success'}}))
+    (output_dir / 'batch_summary.json').write_text(json.dumps({'total': 2}))
+    (output_dir / 'broken_transcript.json').write_text(json.dumps({'metadata': {}}))
+
+    index.add('/elsewhere/old_transcript.txt', BILLING_CALL, metadata('old'))
+    assert index.rebuild(str(output_dir)) == 2
+
+    assert texts(index.search('refund', speaker='Customer')[0]) == ['I would like a refund for my order']
+    assert [hit['call']['filename'] for hit in index.search('card')[0]] == ['billing.webm']
+
+
+
+def test_rebuild_skips_transcripts_deleted_meanwhile(index, tmp_path, monkeypatch):
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    for name in ('refund', 'gone', 'moved'):
+        save_transcription(str(output_dir / f'{name}_transcript.txt'), REFUND_CALL, metadata(name), formats=['json'])
+
+    def find_transcript(path):
+        if 'gone' in path:
+            return None
+        if 'moved' in path:
+            return str(output_dir / 'missing_transcript.json')
+        return str(output_dir / 'refund_transcript.json')
+    monkeypatch.setattr(search, 'find_transcript', find_transcript)
+
+    assert index.rebuild(str(output_dir)) == 1
+    assert {hit['call']['filename'] for hit in index.search('refund')[0]} == {'refund.webm'}
+
+def test_failed_rebuild_keeps_the_old_index(index, tmp_path, monkeypatch):
+    index.add('/out/refund_transcript.txt', REFUND_CALL, metadata('refund'))
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    save_transcription(str(output_dir / 'billing_transcript.txt'), BILLING_CALL, metadata('billing'), formats=['json'])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(index, '_add', fail)
+    with pytest.raises(RuntimeError):
+        index.rebuild(str(output_dir))
+    monkeypatch.undo()
+
+    assert len(index.search('refund')[0]) == 2
+    index.add('/out/billing_transcript.txt', BILLING_CALL, metadata('billing'))
+    assert len(index.search('card')[0]) == 1
+
+
+def test_saving_a_transcript_indexes_it(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SEARCH_INDEX_ENABLED', True)
+    monkeypatch.setattr(search, '_index', index)
+    output_file = str(tmp_path / 'refund_transcript.txt')
+    save_transcription(output_file, REFUND_CALL, metadata('refund'), formats=['json'])
+
+    hits, _ = index.search('refund')
+    assert {hit['call']['transcript'] for hit in hits} == {output_file}
+
+
+def test_search_endpoint(index, monkeypatch):
+    pytest.importorskip('httpx')
+    from fastapi.testclient import TestClient
+    import transcriber_api
+
+    monkeypatch.setattr(search, '_index', index)
+    index.add_many(
+        (f'/out/call{i}_transcript.txt', REFUND_CALL, metadata(f'call{i}'))
+        for i in range(60)
+    )
+    client = TestClient(transcriber_api.app)
+
+    # 120 matching turns; the page size is capped at SEARCH_MAX_LIMIT
+    response = client.get('/search', params={'q': 'refund', 'limit': 1000})
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body['results']) == config.SEARCH_MAX_LIMIT
+    next_page = client.get('/search', params={'q': 'refund', 'limit': 1000, 'cursor': body['next_cursor']}).json()
+    assert len(next_page['results']) == 120 - config.SEARCH_MAX_LIMIT
+    assert next_page['next_cursor'] is None
+
+    agent = client.get('/search', params={'q': 'refund', 'speaker': 'Agent', 'limit': 100}).json()
+    assert {hit['speaker'] for hit in agent['results']} == {'Agent'}
+    assert len(agent['results']) == 60
+
+    assert client.get('/search', params={'q': '" *'}).status_code == 422
+    assert client.get('/search', params={'q': 'refund', 'sort': 'oldest'}).status_code == 422
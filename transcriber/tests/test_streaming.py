@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('faster_whisper')
+
+import streaming
+from config import SAMPLE_RATE
+from streaming import StreamingSession
+
+
+def runs(audio):
+    """
+    (start, end) sample ranges of non-zero audio
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], audio != 0, [0]]).astype(np.int8)))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+@pytest.fixture(autouse=True)
+def stub_vad(monkeypatch):
+    """
+    Anything non-zero is speech
+    """
+    speech = lambda audio, options, sampling_rate: [{'start': s, 'end': e} for s, e in runs(audio)]
+    monkeypatch.setattr(streaming, 'get_speech_timestamps', speech)
+
+
+def decode_speech(audio, prompt):
+    return [{'start': s / SAMPLE_RATE, 'end': e / SAMPLE_RATE, 'text': 'hello'} for s, e in runs(audio)]
+
+
+def pcm(seconds, speech=True):
+    return np.full(int(seconds * SAMPLE_RATE), 1000 if speech else 0, dtype='<i2').tobytes()
+
+
+def test_partials_become_finals_after_a_pause():
+    session = StreamingSession(decode_speech, min_silence_seconds=0.6)
+
+    session.append(pcm(1))
+    assert session.step() == [{'type': 'partial', 'start': 0.0, 'end': 1.0, 'text': 'hello'}]
+    session.append(pcm(1))
+    assert session.step() == [{'type': 'partial', 'start': 0.0, 'end': 2.0, 'text': 'hello'}]
+
+    session.append(pcm(1, speech=False))
+    assert session.step() == [{'type': 'final', 'start': 0.0, 'end': 2.0, 'text': 'hello'}]
+    assert len(session._buffer) == SAMPLE_RATE
+
+    session.append(pcm(0.5))
+    assert session.finish() == [{'type': 'final', 'start': 3.0, 'end': 3.5, 'text': 'hello'}]
+    assert len(session._buffer) == 0
+
+
+def test_buffer_stays_bounded_when_speech_never_decodes():
+    session = StreamingSession(lambda audio, prompt: [], max_window_seconds=5)
+
+    for _ in range(60):
+        session.append(pcm(1))
+        assert session.step() == []
+        assert len(session._buffer) <= session.max_window_samples
+    assert session.duration == 60
+
+
+def test_long_speech_without_pauses_is_finalized_at_the_max_window():
+    def decode_seconds(audio, prompt):
+        # One segment per second of speech
+        return [{'start': s, 'end': s + 1, 'text': f'word {s}'} for s in range(len(audio) // SAMPLE_RATE)]
+
+    session = StreamingSession(decode_seconds, max_window_seconds=5)
+    finals = []
+    for _ in range(20):
+        session.append(pcm(1))
+        finals += [e for e in session.step() if e['type'] == 'final']
+        assert len(session._buffer) <= session.max_window_samples
+
+    assert [e['start'] for e in finals] == [float(s) for s in range(len(finals))]
+    assert len(finals) >= 15
@@ -0,0 +1,99 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import writers
+from synthetic import synthetic_transcript
+from writers import (WRITERS, find_transcript, from_columns, iter_turns, load_metadata, load_transcript,
+                     to_columns, transcript_path, write_transcript)
+
+CONVERSATION = [
+    {'start': 0.0, 'end': 2.5, 'speaker': 'Agent', 'text': 'Hello, how can I help?'},
+    {'start': 2.8, 'end': 6.1, 'speaker': 'Customer', 'text': 'Mi pedido llegó dañado — ¿reembolso?'},
+    {'start': 6.4, 'end': 7.0, 'speaker': 'Agent', 'text': 'Sure.'},
+    {'start': 7.2, 'end': 9.9, 'speaker': 'Supervisor', 'text': ''}
+]
+METADATA = {'filename': 'call.webm', 'duration': 10.0, 'language': 'en', 'speakers_detected': 3}
+
+
+@pytest.mark.parametrize('fmt', list(WRITERS))
+@pytest.mark.parametrize('conversation', [CONVERSATION, []], ids=['turns', 'empty'])
+def test_every_format_round_trips(tmp_path, fmt, conversation):
+    output_file = str(tmp_path / 'call_transcript.txt')
+    path = write_transcript(output_file, conversation, METADATA, fmt)
+
+    assert path == transcript_path(output_file, fmt)
+    assert load_transcript(path) == {'metadata': METADATA, 'conversation': conversation}
+    assert list(iter_turns(path)) == conversation
+    assert load_metadata(path) == METADATA
+
+
+@pytest.mark.parametrize('fmt', ['json', 'orjson'])
+def test_json_is_indented_with_or_without_orjson(tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(writers, 'orjson', None)
+    path = write_transcript(str(tmp_path / 'call_transcript.txt'), CONVERSATION, METADATA, fmt)
+    assert path.endswith('call_transcript.json')
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    assert json.loads(text) == {'metadata': METADATA, 'conversation': CONVERSATION}
+    assert text.startswith('{\n  "metadata"')
+
+
+def test_every_format_has_its_own_file(tmp_path):
+    output_file = str(tmp_path / 'call_transcript.txt')
+    paths = [write_transcript(output_file, CONVERSATION, METADATA, fmt) for fmt in WRITERS]
+    assert len(set(paths)) == len(WRITERS)
+    assert all(load_transcript(path)['conversation'] == CONVERSATION for path in paths)
+
+
+def test_compact_formats_are_smaller_than_json(tmp_path):
+    conversation, metadata = synthetic_transcript(2000)
+    output_file = str(tmp_path / 'call_transcript.txt')
+    sizes = {fmt: os.path.getsize(write_transcript(output_file, conversation, metadata, fmt)) for fmt in WRITERS}
+
+    # Columns drop the repeated keys and speaker labels, gzip the rest of the redundancy
+    assert sizes['columnar'] < 0.8 * sizes['json']
+    assert sizes['ndjson.gz'] < 0.3 * sizes['json']
+    assert sizes['ndjson.gz'] < sizes['columnar']
+
+
+def test_ndjson_puts_metadata_first_then_one_turn_per_line(tmp_path):
+    path = write_transcript(str(tmp_path / 'call_transcript.txt'), CONVERSATION, METADATA, 'ndjson.gz')
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [{'metadata': METADATA}] + CONVERSATION
+
+
+def test_columns_store_each_speaker_once():
+    packed = to_columns(CONVERSATION)
+    assert packed['speakers'] == ['Agent', 'Customer', 'Supervisor']
+    assert packed['columns']['speaker'] == [0, 1, 0, 2]
+    assert from_columns(packed['speakers'], packed['columns']) == CONVERSATION
+
+
+def test_columns_fill_keys_missing_from_some_turns():
+    conversation = [dict(CONVERSATION[0], confidence=0.93), CONVERSATION[1]]
+    packed = to_columns(conversation)
+    assert packed['columns']['confidence'] == [0.93, None]
+    assert from_columns(packed['speakers'], packed['columns'])[1] == dict(CONVERSATION[1], confidence=None)
+
+
+def test_find_transcript_uses_any_saved_format(tmp_path):
+    output_file = str(tmp_path / 'call_transcript.txt')
+    assert find_transcript(output_file) is None
+    path = write_transcript(output_file, CONVERSATION, METADATA, 'ndjson.gz')
+    assert find_transcript(output_file) == path
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='Unknown transcript format'):
+        write_transcript(str(tmp_path / 'call_transcript.txt'), CONVERSATION, METADATA, 'xml')
+
+
+def test_empty_file_is_an_error(tmp_path):
+    path = tmp_path / 'call_transcript.json'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        load_transcript(str(path))
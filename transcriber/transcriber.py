@@ -1,68 +1,228 @@
-import whisper
-from pyannote.audio import Pipeline
-from faster_whisper import WhisperModel 
-import torch
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 import os
+import time
 from config import *
 from utils import *
+from cache import TranscriptCache, config_fingerprint, hash_audio
+from vad import SpeechMap
+from cascade import CascadeDecoder, combine_stats
+from backends import InferenceBackend
+from analytics import conversation_analytics
+from cancellation import Cancelled, record_cancelled
+from profiling import profiled
+from voiceprints import SpeakerEmbedder, VoiceprintStore, agent_windows, label_clusters, windows_to_turns
+import metrics
+
+# torch, faster_whisper and pyannote are imported when the models load, so
+# importing this module (e.g. by the API before it binds its port) is fast
 
 
 class AudioTranscriber:
-    def __init__(self, whisper_model='base', hf_token=None):
+    def __init__(self, whisper_model='base', hf_token=None,
+                 parallel_stages=PARALLEL_STAGES,
+                 whisper_cpu_threads=WHISPER_CPU_THREADS,
+                 diarization_cpu_threads=DIARIZATION_CPU_THREADS,
+                 whisper_num_workers=WHISPER_NUM_WORKERS,
+                 use_cache=CACHE_ENABLED, cache=None,
+                 batching=WHISPER_BATCHING, shared_vad=SHARED_VAD,
+                 cascade_model=CASCADE_MODEL, backend=None, voiceprints=None):
         print("🔄 Loading models...")
         
-        # Load Whisper
-        print(f"Loading Whisper model: {whisper_model}")
-        # self.whisper_model = whisper.load_model(whisper_model)
-        self.whisper_model = WhisperModel(whisper_model, device="cuda" if torch.cuda.is_available() else "cpu")
-        print("✅ Whisper loaded")
+        # The backend decides device, compute type, threads and Pyannote's runtime;
+        # by default it's built from config with the thread budgets given here
+        self.backend = backend or InferenceBackend(
+            whisper_cpu_threads=whisper_cpu_threads,
+            whisper_num_workers=whisper_num_workers,
+            torch_threads=diarization_cpu_threads
+        )
         
-        # Load Pyannote diarization pipeline
-        print("Loading Pyannote diarization...")
-        self.diarization_pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1",
-            use_auth_token=hf_token or HF_TOKEN
+        # Whisper (CTranslate2) and Pyannote (torch) keep separate CPU thread
+        # pools, so pinning torch here leaves Whisper's budget untouched
+        self.backend.configure_torch()
+        
+        # The models don't depend on each other, so load them side by side
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix='model-loader') as loader:
+            whisper_future = loader.submit(self._load_whisper, whisper_model)
+            diarization_future = loader.submit(self._load_diarization, hf_token)
+            cascade_future = None
+            if cascade_model:
+                cascade_future = loader.submit(self._load_whisper, cascade_model, 1, 'whisper_cascade')
+            self.whisper_model = whisper_future.result()
+            self.diarization_pipeline = diarization_future.result()
+        
+        # Optionally re-decode low-confidence segments with a larger Whisper model
+        self.cascade = None
+        self.cascade_model = cascade_model
+        if cascade_future:
+            self.cascade = CascadeDecoder(cascade_future.result())
+        
+        # Calls with an enrolled agent are attributed by voiceprint instead of clustering
+        self.voiceprints = voiceprints or VoiceprintStore()
+        self.embedder = SpeakerEmbedder(self.diarization_pipeline)
+        
+        # Optionally pack chunks of concurrent recordings into shared Whisper batches
+        self.batcher = None
+        if batching:
+            from batching import WhisperBatcher
+            self.batcher = WhisperBatcher(self.whisper_model)
+        
+        # One thread per model: each model runs one file at a time, but
+        # transcription and diarization of the same file can overlap.
+        # With batching, several recordings must reach the batcher at once.
+        self.parallel_stages = parallel_stages
+        self.shared_vad = shared_vad
+        self._transcribe_pool = ThreadPoolExecutor(
+            max_workers=WHISPER_BATCH_MAX_RECORDINGS if batching else 1,
+            thread_name_prefix='whisper'
         )
+        self._diarize_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pyannote')
         
-        # Use GPU if available
-        if torch.cuda.is_available():
-            self.diarization_pipeline.to(torch.device("cuda"))
-            print("✅ Pyannote loaded (GPU)")
-        else:
-            print("✅ Pyannote loaded (CPU)")
+        # Results are reused for identical audio processed with the same settings
+        # (replicas in a ModelPool pass one shared cache)
+        self.cache = cache or (TranscriptCache() if use_cache else None)
+        cascade_settings = None
+        if cascade_model:
+            cascade_settings = [
+                cascade_model, CASCADE_MIN_AVG_LOGPROB, CASCADE_MAX_NO_SPEECH_PROB,
+                CASCADE_MAX_COMPRESSION_RATIO, CASCADE_MAX_GAP_SECONDS
+            ]
+        # Quantization and runtime change results slightly; thread counts don't
+        backend_settings = [self.backend.compute_type, self.backend.active_diarization_runtime]
+        self.cache_fingerprint = config_fingerprint(
+            whisper_model=whisper_model, batching=batching, shared_vad=shared_vad,
+            cascade=cascade_settings, backend=backend_settings
+        )
+        self.channels_fingerprint = config_fingerprint(
+            whisper_model=whisper_model, batching=batching, channel_labels=CHANNEL_LABELS,
+            cascade=cascade_settings, backend=backend_settings
+        )
+        self.vad_fingerprint = config_fingerprint(
+            vad=[VAD_MIN_SILENCE_MS, VAD_SPEECH_PAD_MS, VAD_MAX_REGION_SECONDS]
+        )
     
     
-    def transcribe_audio(self, audio_file):
+    def _load_whisper(self, whisper_model, num_workers=None, name='whisper'):
+        print(f"Loading Whisper model: {whisper_model}")
+        load_started = time.perf_counter()
+        model = self.backend.load_whisper(whisper_model, num_workers)
+        metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - load_started, model=name)
+        print(f"✅ Whisper loaded ({whisper_model}, {self.backend.resolve_device()}, {self.backend.compute_type})")
+        return model
+    
+    
+    def _load_diarization(self, hf_token):
+        print("Loading Pyannote diarization...")
+        load_started = time.perf_counter()
+        pipeline = self.backend.load_diarization(hf_token)
+        print(f"✅ Pyannote loaded ({self.backend.resolve_device()}, {self.backend.active_diarization_runtime})")
+        metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - load_started, model='pyannote')
+        return pipeline
+    
+    
+    def warm_up(self, seconds=WARMUP_SECONDS):
+        """
+        Run both models once on synthetic audio
+
+        The first inference pays for lazy allocations and kernel selection;
+        doing it here keeps that cost off the first real call.
+        """
+        started = time.perf_counter()
+        rng = np.random.default_rng(0)
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        audio = (0.1 * np.sin(2 * np.pi * 220 * t) + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+        # Skip VAD, which could find no speech in a tone and leave the models idle
+        self.run_stages(audio, speech=SpeechMap.whole(audio))
+        metrics.MODEL_WARMUP_SECONDS.set(time.perf_counter() - started)
+        print(f"🔥 Warm-up done in {time.perf_counter() - started:.1f}s")
+    
+    
+    def transcribe_audio(self, audio_file, speech_regions=None, on_segment=None, cancel=None):
         """
         Transcribe audio using Whisper
+
+        `audio_file` is a file path or a 16 kHz mono float32 array.
+        `speech_regions` means the audio is already speech only (cut by a
+        shared VAD pass) and lists its regions, so Whisper's VAD is skipped.
+        With a cascade model, weak segments are re-decoded by it and the
+        result carries `cascade` stats. `on_segment` is called with each
+        segment as soon as Whisper decodes it (before any cascade pass).
+        A `cancel` token is checked between segments.
         """
         print(f"\n🎤 Transcribing audio...")
-        segments_generator, info = self.whisper_model.transcribe(
-            audio_file,
-            vad_filter=True
-        )
-        
-        # The transcribe method of faster-whisper returns a generator.
-        # We need to convert it to a list of dictionaries to match the structure
-        # expected by the rest of the script (similar to openai-whisper's output).
-        segments = [
-            {'start': s.start, 'end': s.end, 'text': s.text} 
-            for s in segments_generator
-        ]
+        if cancel:
+            cancel.check()
+        if self.batcher and isinstance(audio_file, np.ndarray):
+            result = self.batcher.transcribe(audio_file, speech_regions)
+            if cancel:
+                cancel.check()
+            if on_segment:
+                for segment in result['segments']:
+                    on_segment(segment)
+        else:
+            segments_generator, info = self.whisper_model.transcribe(
+                audio_file,
+                vad_filter=speech_regions is None
+            )
+            
+            # The transcribe method of faster-whisper returns a generator.
+            # We need to convert it to a list of dictionaries to match the structure
+            # expected by the rest of the script (similar to openai-whisper's output).
+            # Confidence scores are kept for the cascade.
+            segments = []
+            for s in segments_generator:
+                # Whisper decodes lazily, so stopping here skips the rest of the audio
+                if cancel:
+                    cancel.check()
+                segment = {
+                    'start': s.start,
+                    'end': s.end,
+                    'text': s.text,
+                    'avg_logprob': s.avg_logprob,
+                    'no_speech_prob': s.no_speech_prob,
+                    'compression_ratio': s.compression_ratio
+                }
+                segments.append(segment)
+                if on_segment:
+                    on_segment(segment)
+            
+            result = {'segments': segments, 'language': info.language}
         
-        result = {'segments': segments, 'language': info.language}
+        if self.cascade and isinstance(audio_file, np.ndarray):
+            if cancel:
+                cancel.check()
+            result = self.cascade.refine(audio_file, result)
         
         print(f"✅ Transcription complete")
         return result
     
     
-    def diarize_audio(self, audio_file):
+    def diarize_audio(self, audio_file, return_embeddings=False, cancel=None):
         """
         Perform speaker diarization using Pyannote
+
+        `audio_file` is a file path or a 16 kHz mono float32 array. With
+        `return_embeddings`, returns (segments, {speaker: embedding}). A
+        `cancel` token is checked by Pyannote's progress hook, between
+        steps and embedding batches.
         """
         print(f"\n👥 Performing speaker diarization...")
-        diarization = self.diarization_pipeline(audio_file)
+        if isinstance(audio_file, np.ndarray):
+            import torch
+
+            # Pass decoded audio as a waveform dict so Pyannote doesn't re-read the file
+            audio_file = {
+                'waveform': torch.from_numpy(audio_file).unsqueeze(0),
+                'sample_rate': SAMPLE_RATE
+            }
+        options = {'hook': cancel.hook} if cancel else {}
+        embeddings = None
+        if return_embeddings:
+            diarization, vectors = self.diarization_pipeline(audio_file, return_embeddings=True, **options)
+            embeddings = dict(zip(diarization.labels(), vectors))
+        else:
+            diarization = self.diarization_pipeline(audio_file, **options)
         
         segments = []
         for turn, _, speaker in diarization.itertracks(yield_label=True):
@@ -73,9 +233,194 @@ class AudioTranscriber:
             })
         
         print(f"✅ Found {len(set([s['speaker'] for s in segments]))} speakers")
+        if return_embeddings:
+            return segments, embeddings
         return segments
     
     
+    def attribute_speakers(self, audio, voiceprint, cancel=None):
+        """
+        Agent/Customer turns of 16 kHz mono audio, given the agent's voiceprint
+
+        Embeds short windows and compares them with the voiceprint, which
+        skips Pyannote's segmentation and clustering. If the agent is
+        barely (or always) heard, the call is diarized in full instead and
+        the cluster closest to the voiceprint is named the agent.
+        Returns (segments, speaker_source).
+        """
+        print(f"\n🎙️  Attributing speakers by voiceprint...")
+        starts, ends, embeddings = self.embedder.windows(audio, cancel=cancel)
+        if len(embeddings) and embeddings.shape[1] != len(voiceprint):
+            print("⚠️  Voiceprint was enrolled with a different embedding model, re-enroll the agent")
+        elif len(embeddings):
+            is_agent = agent_windows(embeddings, voiceprint)
+            share = is_agent.mean()
+            if VOICEPRINT_MIN_SHARE <= share <= VOICEPRINT_MAX_SHARE:
+                segments = windows_to_turns(starts, ends, is_agent)
+                print(f"✅ Agent speaks in {share:.0%} of {len(embeddings)} windows")
+                return segments, 'voiceprint'
+            print(f"⚠️  Agent matched {share:.0%} of windows, falling back to diarization")
+
+        segments, centroids = self.diarize_audio(audio, return_embeddings=True, cancel=cancel)
+        names = label_clusters(centroids, voiceprint)
+        for segment in segments:
+            segment['speaker'] = names.get(segment['speaker'], segment['speaker'])
+        return segments, 'diarization+voiceprint' if names else 'diarization'
+    
+    
+    def enroll_agent(self, agent_id, audio):
+        """
+        Add a recording of the agent alone (16 kHz mono) to their voiceprint
+        """
+        _, _, embeddings = self.embedder.windows(audio)
+        if not len(embeddings):
+            raise ValueError("No speech found in the enrollment audio")
+        return self.voiceprints.enroll(agent_id, embeddings)
+    
+    
+    def detect_speech(self, audio, audio_hash=None):
+        """
+        Speech regions of decoded audio, reused from the cache when we've seen it
+        """
+        key = None
+        if self.cache and audio_hash:
+            key = self.cache.make_key(audio_hash, self.vad_fingerprint)
+            cached = self.cache.get(key, kind='vad')
+            if cached:
+                return SpeechMap.from_dict(cached)
+
+        speech = SpeechMap.detect(audio)
+        if key:
+            self.cache.put(key, speech.to_dict())
+        return speech
+    
+    
+    def run_stages(self, audio, return_embeddings=False, speech=None, voiceprint=None, on_segment=None,
+                   cancel=None):
+        """
+        Run transcription and diarization, concurrently when enabled
+
+        Returns (transcription, diarization, timings) where timings holds
+        the wall-clock seconds of each stage. With `return_embeddings`,
+        diarization is (segments, {speaker: embedding}). With an agent's
+        `voiceprint`, speakers are attributed by `attribute_speakers` and
+        the transcription reports how in `speaker_source`.
+
+        With shared VAD, speech is found once (or taken from `speech`) and
+        both models only get the speech regions cut together; timestamps
+        are mapped back to the original audio and the transcription
+        reports `speech_seconds`. `on_segment` gets each Whisper segment as
+        it is decoded, in original-audio time. Both stages stop early once
+        `cancel` is cancelled.
+        """
+        timings = {}
+        if not (self.shared_vad and isinstance(audio, np.ndarray)):
+            speech = None
+        else:
+            vad_started = time.perf_counter()
+            if speech is None:
+                speech = self.detect_speech(audio)
+            audio = speech.compact(audio)
+            timings['vad'] = time.perf_counter() - vad_started
+            print(f"🔇 Speech is {speech.speech_ratio:.0%} of the audio")
+
+            if not len(audio):
+                # Nothing but silence, so neither model has any work to do
+                transcription = {'segments': [], 'language': WHISPER_LANGUAGE or 'en', 'speech_seconds': 0}
+                return transcription, (([], {}) if return_embeddings else []), timings
+
+        transcribe = lambda a: self.transcribe_audio(a, on_segment=on_segment, cancel=cancel)
+        if speech is not None:
+            emit = None
+            if on_segment:
+                emit = lambda segment: on_segment(speech.map_segments([segment])[0])
+            transcribe = lambda a: self.transcribe_audio(
+                a, speech_regions=speech.compact_regions(), on_segment=emit, cancel=cancel
+            )
+        diarize = lambda a: self.diarize_audio(a, cancel=cancel)
+        if return_embeddings:
+            diarize = lambda a: self.diarize_audio(a, return_embeddings=True, cancel=cancel)
+        elif voiceprint is not None:
+            diarize = lambda a: self.attribute_speakers(a, voiceprint, cancel=cancel)
+
+        def timed(name, func):
+            started = time.perf_counter()
+            result = func(audio)
+            timings[name] = time.perf_counter() - started
+            return result
+
+        if self.parallel_stages:
+            transcribe_future = self._transcribe_pool.submit(profiled(timed), 'transcribe', transcribe)
+            diarize_future = self._diarize_pool.submit(profiled(timed), 'diarize', diarize)
+            try:
+                transcription, diarization = transcribe_future.result(), diarize_future.result()
+            except Cancelled:
+                # The other stage stops at its next check; wait so the replica is really free
+                wait([transcribe_future, diarize_future])
+                raise
+        else:
+            transcription = timed('transcribe', transcribe)
+            diarization = timed('diarize', diarize)
+        if voiceprint is not None and not return_embeddings:
+            diarization, transcription['speaker_source'] = diarization
+
+        if speech is not None:
+            transcription['segments'] = speech.map_segments(transcription['segments'])
+            transcription['speech_seconds'] = speech.speech_seconds
+            if return_embeddings:
+                diarization = (speech.map_turns(diarization[0]), diarization[1])
+            else:
+                diarization = speech.map_turns(diarization)
+        return transcription, diarization, timings
+    
+    
+    def transcribe_channels(self, channels, labels=CHANNEL_LABELS, on_segment=None, cancel=None):
+        """
+        Transcribe a recording with one speaker per channel, without diarization
+
+        Each channel is transcribed on its own (in parallel) and labelled
+        by position in `labels`; segments are interleaved by start time.
+        `on_segment` gets each segment, with its `speaker`, as it is decoded.
+        Returns (conversation, transcription, timings).
+        """
+        print(f"\n🎚️ Transcribing {len(channels)} channels separately (no diarization)...")
+        channel_labels = [labels[i] if i < len(labels) else f"CHANNEL_{i}" for i in range(len(channels))]
+
+        def transcribe(index):
+            emit = None
+            if on_segment:
+                emit = lambda segment: on_segment({**segment, 'speaker': channel_labels[index]})
+            return self.transcribe_audio(channels[index], on_segment=emit, cancel=cancel)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(channels), thread_name_prefix='whisper-channel') as pool:
+            transcriptions = list(pool.map(profiled(transcribe), range(len(channels))))
+        timings = {'transcribe': time.perf_counter() - started}
+
+        merge_started = time.perf_counter()
+        conversation = []
+        for label, channel in zip(channel_labels, transcriptions):
+            for segment in channel['segments']:
+                conversation.append({
+                    'start': segment['start'],
+                    'end': segment['end'],
+                    'speaker': label,
+                    'text': segment['text'].strip()
+                })
+        conversation.sort(key=lambda turn: turn['start'])
+        timings['merge'] = time.perf_counter() - merge_started
+
+        # Report the language of whichever side did most of the talking
+        language = max(transcriptions, key=lambda t: len(t['segments']))['language']
+        transcription = {'segments': conversation, 'language': language}
+        cascade = combine_stats([t.get('cascade') for t in transcriptions])
+        if cascade:
+            transcription['cascade'] = cascade
+
+        print(f"✅ Merged {len(conversation)} conversation turns")
+        return conversation, transcription, timings
+    
+    
     def merge_transcription_and_diarization(self, transcription, diarization):
         """
         Merge Whisper transcription with Pyannote diarization
@@ -84,14 +429,14 @@ class AudioTranscriber:
         
         conversation = []
         
-        for segment in transcription['segments']:
+        # Find which speaker was talking during each segment
+        speakers = find_speakers_for_segments(transcription['segments'], diarization)
+        
+        for segment, speaker in zip(transcription['segments'], speakers):
             text = segment['text'].strip()
             start = segment['start']
             end = segment['end']
             
-            # Find which speaker was talking during this segment
-            speaker = self.find_speaker_for_segment(start, end, diarization)
-            
             # Map to readable labels (Agent/Customer)
             speaker_label = SPEAKER_LABELS.get(speaker, speaker)
             
@@ -128,9 +473,244 @@ class AudioTranscriber:
         return 'UNKNOWN'
     
     
+    def transcribe_file(self, audio_file, on_stage=None, data=None, audio=None,
+                        channels=False, tracks=None, agent_id=None, on_segment=None, cancel=None):
+        """
+        Run decode → transcribe → diarize → merge on one file
+
+        Returns a dict with the conversation and its metadata, or None
+        if the file could not be decoded. `data` holds the file contents
+        when they are already in memory (e.g. an upload) and `audio` the
+        already-decoded samples; `audio_file` is then only used for its
+        name and cache key. `data` may also be a binary file object (e.g.
+        a spooled upload). `on_stage` is called with the name of each
+        stage as it starts.
+
+        Inputs larger than CHUNKED_MIN_BYTES are decoded and processed in
+        overlapping windows so memory stays flat however long the call is.
+        Per-channel input is the exception: every channel is decoded in
+        full, since the channels are transcribed side by side.
+
+        When each participant was recorded separately, diarization is
+        skipped: `channels` means the file has one speaker per stereo
+        channel, and `tracks` lists one file (path or bytes) per speaker.
+        Speakers are named from CHANNEL_LABELS in channel/track order.
+
+        With the `agent_id` of an enrolled agent, speakers are attributed
+        by voiceprint (see attribute_speakers) and labelled from
+        VOICEPRINT_LABELS; unknown agents get the usual diarization.
+
+        `on_segment` is called (from worker threads) with each Whisper
+        segment as soon as it is decoded, before speakers are known; for
+        long inputs, once per processed window. Cache hits call it never.
+
+        With a `cancel` token (see cancellation.CancelToken), the work
+        stops at the next stage, segment or diarization batch once it is
+        cancelled or its deadline passes, raising Cancelled.
+        """
+        started = time.perf_counter()
+        try:
+            return self._transcribe_file(audio_file, on_stage, data, audio, channels, tracks,
+                                         agent_id, on_segment, cancel)
+        except Cancelled as e:
+            record_cancelled(e, cancel.stage, time.perf_counter() - started)
+            raise
+
+
+    def _transcribe_file(self, audio_file, on_stage, data, audio, channels, tracks, agent_id,
+                         on_segment, cancel):
+        def stage(name):
+            if on_stage:
+                on_stage(name)
+            if cancel:
+                cancel.stage = name
+                cancel.check()
+
+        started = time.perf_counter()
+        wav_file = None
+        per_channel = channels or bool(tracks)
+        sources = list(tracks) if tracks else [audio_file if data is None else data]
+
+        voiceprint = None
+        if agent_id and not per_channel:
+            voiceprint = self.voiceprints.get(agent_id)
+            if voiceprint is None:
+                print(f"⚠️  No voiceprint enrolled for agent {agent_id}, diarizing instead")
+
+        # Step 0: Return the stored result for audio we've already processed
+        cache_key = audio_hash = None
+        if self.cache:
+            stage('checking_cache')
+            audio_hash = hash_audio(sources if tracks else sources[0])
+            fingerprint = self.channels_fingerprint if per_channel else self.cache_fingerprint
+            if voiceprint is not None:
+                fingerprint += f":voiceprint:{agent_id}:{self.voiceprints.version(agent_id)}"
+            cache_key = self.cache.make_key(audio_hash, fingerprint)
+            cached = self.cache.get(cache_key)
+            if cached:
+                print(f"⚡ Cache hit: {audio_file}")
+                cached['metadata'].update({
+                    'filename': os.path.basename(audio_file),
+                    'cached': True
+                })
+                return cached
+
+        size = sum(source_size(source) for source in sources)
+        chunked = audio is None and not per_channel and size > CHUNKED_MIN_BYTES
+        if not chunked:
+            sources = [s.read() if hasattr(s, 'read') else s for s in sources]
+            if data is not None:
+                data = sources[0]
+
+        # Step 1: Decode once into memory, or convert to WAV on disk
+        stage('decoding')
+        decode_started = time.perf_counter()
+        if chunked:
+            pass
+        elif per_channel and audio is None:
+            if tracks:
+                audio = [decode_audio(source, SAMPLE_RATE) for source in sources]
+                if any(track is None for track in audio):
+                    return None
+            else:
+                audio = decode_channels(sources[0], SAMPLE_RATE)
+                if audio is None:
+                    return None
+            if len(audio) == 1:
+                print("⚠️  Only one channel found, falling back to diarization")
+                audio = audio[0]
+                per_channel = False
+        elif audio is not None:
+            pass
+        elif data is not None or IN_MEMORY_DECODE:
+            audio = decode_audio(audio_file if data is None else data, SAMPLE_RATE)
+            if audio is None:
+                return None
+        elif not audio_file.endswith('.wav'):
+            audio = wav_file = convert_to_wav(audio_file)
+            if not wav_file:
+                return None
+        else:
+            audio = audio_file
+        decode_time = time.perf_counter() - decode_started
+
+        try:
+            if per_channel:
+                # Step 2: Channels already separate the speakers, so skip Pyannote
+                stage('transcribing')
+                conversation, transcription, timings = self.transcribe_channels(
+                    audio, on_segment=on_segment, cancel=cancel
+                )
+                speakers = {turn['speaker'] for turn in conversation}
+                audio_seconds = max(len(track) for track in audio) / SAMPLE_RATE
+            elif chunked:
+                # Step 2 + 3: Transcribe and diarize, one window at a time
+                from chunked import transcribe_in_windows
+
+                stage('transcribing+diarizing' if self.parallel_stages else 'transcribing')
+
+                print(f"🧩 Large input ({size / 1024 / 1024:.0f}MB), processing in windows")
+                transcription, diarization, timings, audio_seconds = transcribe_in_windows(
+                    self, audio_file if data is None else data, on_segment=on_segment, cancel=cancel,
+                    voiceprint=voiceprint
+                )
+                decode_time = timings.pop('decode')
+            else:
+                # Step 2 + 3: Find speech once, then transcribe and diarize only the speech
+                speech = None
+                if self.shared_vad and isinstance(audio, np.ndarray):
+                    stage('detecting_speech')
+                    vad_started = time.perf_counter()
+                    speech = self.detect_speech(audio, audio_hash)
+                    vad_time = time.perf_counter() - vad_started
+                stage('transcribing+diarizing' if self.parallel_stages else 'transcribing')
+                if not isinstance(audio, np.ndarray):
+                    voiceprint = None
+                transcription, diarization, timings = self.run_stages(
+                    audio, speech=speech, voiceprint=voiceprint, on_segment=on_segment, cancel=cancel
+                )
+                if speech is not None:
+                    timings['vad'] += vad_time
+                audio_seconds = len(audio) / SAMPLE_RATE if isinstance(audio, np.ndarray) else None
+
+            # Step 4: Merge
+            if not per_channel:
+                stage('merging')
+                merge_started = time.perf_counter()
+                conversation = self.merge_transcription_and_diarization(
+                    transcription,
+                    diarization
+                )
+                timings['merge'] = time.perf_counter() - merge_started
+                speakers = set([s['speaker'] for s in diarization])
+        finally:
+            # Cleanup temporary WAV file if created
+            if wav_file and os.path.exists(wav_file):
+                os.remove(wav_file)
+
+        timings['decode'] = decode_time
+        timings['total'] = time.perf_counter() - started
+
+        for name, seconds in timings.items():
+            if name != 'total':
+                metrics.STAGE_SECONDS.observe(seconds, stage=name)
+        if audio_seconds:
+            metrics.AUDIO_SECONDS.inc(audio_seconds)
+            metrics.REAL_TIME_FACTOR.observe(timings['total'] / audio_seconds)
+        metrics.AUDIO_BYTES.inc(size)
+
+        metadata = {
+            'filename': os.path.basename(audio_file),
+            'duration': transcription['segments'][-1]['end'] if transcription['segments'] else 0,
+            'language': transcription.get('language', 'en'),
+            'speakers_detected': len(speakers),
+            'speaker_source': 'channels' if per_channel else transcription.pop('speaker_source', 'diarization'),
+            'processed_at': datetime.now().isoformat(),
+            'timings': {name: round(seconds, 3) for name, seconds in timings.items()}
+        }
+
+        if agent_id:
+            metadata['agent_id'] = agent_id
+
+        metadata['analytics'] = conversation_analytics(conversation, audio_seconds)
+
+        speech_seconds = transcription.pop('speech_seconds', None)
+        if speech_seconds is not None and audio_seconds:
+            speech_ratio = min(1.0, speech_seconds / audio_seconds)
+            # Model time grows about linearly with audio length, so estimate
+            # what the skipped silence would have cost
+            model_seconds = timings.get('transcribe', 0)
+            if self.parallel_stages:
+                model_seconds = max(model_seconds, timings.get('diarize', 0))
+            else:
+                model_seconds += timings.get('diarize', 0)
+            metadata['vad'] = {
+                'speech_ratio': round(speech_ratio, 3),
+                'skipped_seconds': round(audio_seconds - min(speech_seconds, audio_seconds), 1),
+                'estimated_seconds_saved': round(model_seconds * (1 - speech_ratio) / speech_ratio, 3) if speech_ratio else None
+            }
+
+        cascade = transcription.pop('cascade', None)
+        if cascade:
+            metadata['cascade'] = {
+                'model': self.cascade_model,
+                'segments': cascade['segments'],
+                'escalated_segments': cascade['escalated_segments'],
+                'escalated_seconds': round(cascade['escalated_seconds'], 1),
+                'escalated_ratio': round(cascade['escalated_seconds'] / cascade['audio_seconds'], 3) if cascade['audio_seconds'] else 0,
+                'seconds': round(cascade['seconds'], 3)
+            }
+
+        result = {'conversation': conversation, 'metadata': metadata}
+        if cache_key:
+            self.cache.put(cache_key, result)
+
+        return result
+
+
     def process_recording(self, audio_file, output_dir=OUTPUT_DIR):
         """
-        Complete pipeline: convert → transcribe → diarize → merge
+        Complete pipeline: decode → transcribe → diarize → merge → save
         """
         print(f"\n{'='*60}")
         print(f"Processing: {audio_file}")
@@ -139,41 +719,18 @@ class AudioTranscriber:
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
         
-        # Step 1: Convert to WAV if needed
-        if not audio_file.endswith('.wav'):
-            wav_file = convert_to_wav(audio_file)
-            if not wav_file:
-                return None
-        else:
-            wav_file = audio_file
-        
-        # Step 2: Transcribe
-        transcription = self.transcribe_audio(wav_file)
-        
-        # Step 3: Diarize
-        diarization = self.diarize_audio(wav_file)
-        
-        # Step 4: Merge
-        conversation = self.merge_transcription_and_diarization(
-            transcription, 
-            diarization
-        )
+        result = self.transcribe_file(audio_file)
+        if result is None:
+            return None
         
         # Step 5: Save results
         base_name = os.path.basename(audio_file).rsplit('.', 1)[0]
         output_file = os.path.join(output_dir, f"{base_name}_transcript.txt")
         
-        metadata = {
-            'filename': os.path.basename(audio_file),
-            'duration': transcription['segments'][-1]['end'] if transcription['segments'] else 0,
-            'language': transcription.get('language', 'en'),
-            'processed_at': datetime.now().isoformat()
-        }
-        
-        save_transcription(output_file, conversation, metadata)
+        save_transcription(output_file, result['conversation'], result['metadata'])
         
         print(f"\n✅ Processing complete!")
-        return conversation
+        return result['conversation']
 
 
 # Main execution
@@ -1,16 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
+import asyncio
+import io
+import json
 import os
-import tempfile
+import time
+from contextlib import ExitStack
 from datetime import datetime
+from urllib.parse import parse_qs
 from pydantic import BaseModel
+from typing import List, Literal, Optional
 
-from transcriber import AudioTranscriber
 from config import *
-from utils import convert_to_wav, save_transcription
+from utils import decode_audio, save_transcription, source_size
+from cancellation import Cancelled, CancelToken
+from voiceprints import AGENT_ID_PATTERN, VoiceprintStore
+from writers import dumps, orjson, to_columns
+from jobs import JobQueue, QueueFullError
+from search import get_index
+from model_pool import ModelPool, PoolSaturatedError
+from profiling import REQUEST_PROFILER, SamplingProfiler, profile_for, profile_path, profiled
+import metrics
 
 # Initialize FastAPI
 app = FastAPI(
@@ -28,13 +42,235 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize transcriber (load models once at startup)
-print("🔄 Loading AI models...")
-transcriber = AudioTranscriber(
-    whisper_model=WHISPER_MODEL,
-    hf_token=HF_TOKEN
+class GZipUnlessStreaming(GZipMiddleware):
+    """
+    GZipMiddleware that leaves `?stream=` responses alone
+
+    The compressor holds small writes back until it has a block's worth,
+    which would delay every streamed segment until the end of the call.
+    """
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "stream" in parse_qs(scope.get("query_string", b"").decode()):
+            return await self.app(scope, receive, send)
+        await super().__call__(scope, receive, send)
+
+
+# Compress responses for clients sending Accept-Encoding: gzip
+app.add_middleware(GZipUnlessStreaming, minimum_size=RESPONSE_GZIP_MIN_BYTES)
+
+class UploadSizeLimit:
+    """
+    Reject oversized uploads while they stream in, before they are buffered
+
+    Requests declaring a Content-Length over the limit are refused straight
+    away; otherwise the body is counted as it arrives and the request is
+    aborted with 413 as soon as it passes the limit.
+    """
+    def __init__(self, app, max_bytes=MAX_FILE_SIZE, paths=("/transcribe", "/transcribe-tracks")):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        detail = f"File too large. Max size: {self.max_bytes / 1024 / 1024}MB"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and int(content_length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadSizeLimit)
+
+# Model replicas load in the background once the server is up, so the
+# port binds immediately and /health reports progress
+model_pool = ModelPool()
+
+# Background job queue for submit/poll transcription
+job_queue = JobQueue(model_pool)
+
+# Enrolled agent voiceprints (replicas read the same files)
+voiceprints = VoiceprintStore()
+
+
+metrics.Gauge(
+    'transcriber_queue_depth',
+    'Transcription jobs waiting for a worker',
+    function=lambda: job_queue.stats()['queued']
+)
+metrics.Gauge(
+    'transcriber_replicas_busy',
+    'Requests currently assigned to model replicas',
+    function=lambda: model_pool.stats()['in_flight']
+)
+metrics.Counter(
+    'transcriber_cache_hits_total',
+    'Result cache hits since startup',
+    function=lambda: model_pool.cache.hits if model_pool.cache else 0
+)
+metrics.Counter(
+    'transcriber_cache_misses_total',
+    'Result cache misses since startup',
+    function=lambda: model_pool.cache.misses if model_pool.cache else 0
 )
-print("✅ Models loaded successfully!")
+metrics.Counter(
+    'transcriber_vad_cache_hits_total',
+    'VAD speech map cache hits since startup',
+    function=lambda: model_pool.cache.vad_hits if model_pool.cache else 0
+)
+metrics.Counter(
+    'transcriber_vad_cache_misses_total',
+    'VAD speech map cache misses since startup',
+    function=lambda: model_pool.cache.vad_misses if model_pool.cache else 0
+)
+
+
+class RequestTracker:
+    """
+    Count requests and, when asked with the profiling token, sample the request
+
+    A plain ASGI middleware rather than `@app.middleware("http")`, whose
+    wrapped `receive` keeps handlers from reliably seeing the client
+    disconnect (see run_cancellable). It returns only once the response
+    has been sent, so streamed responses are profiled to their end; the
+    profile's file name goes out up front in `X-Profile-File`.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            return await self.app(scope, receive, send)
+
+        profiler = path = None
+        token = dict(scope["headers"]).get(b"x-profile-token")
+        if PROFILE_TOKEN and token == PROFILE_TOKEN.encode():
+            # Only the threads running this request's work (see profiled)
+            profiler = SamplingProfiler(only_watched=True).start()
+            path = profile_path(scope["path"])
+
+        status = 500
+
+        async def tracked_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profiler:
+                    headers = [*message.get("headers", []), (b"x-profile-file", os.path.basename(path).encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        metrics.IN_FLIGHT.inc()
+        context = REQUEST_PROFILER.set(profiler)
+        try:
+            await self.app(scope, receive, tracked_send)
+        finally:
+            REQUEST_PROFILER.reset(context)
+            metrics.IN_FLIGHT.dec()
+            # Label by route template, not URL, so job and agent ids don't each add a series
+            route = scope.get("route")
+            metrics.REQUESTS.inc(path=route.path if route else "unmatched", status=status)
+            if profiler:
+                profiler.stop().save(path)
+                print(f"🔬 Profile saved: {path} ({profiler.sample_count} samples)")
+
+
+app.add_middleware(RequestTracker)
+
+
+@app.on_event("startup")
+async def start_background_work():
+    model_pool.start_loading()
+    job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    job_queue.stop(timeout=5)
+
+
+def pool_saturated(error):
+    """
+    429 (busy) or 503 (still loading) response telling the client when to retry
+    """
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def check_agent_id(agent_id):
+    if agent_id is not None and not AGENT_ID_PATTERN.match(agent_id):
+        raise HTTPException(status_code=422, detail="agent_id may only contain letters, digits, '_' and '-'")
+    return agent_id
+
+
+def request_token(http_request):
+    """
+    CancelToken for a request, due after X-Request-Timeout seconds (capped
+    by REQUEST_TIMEOUT_SECONDS) so work stops once the caller gives up
+    """
+    timeout = REQUEST_TIMEOUT_SECONDS
+    header = http_request.headers.get("X-Request-Timeout")
+    if header:
+        try:
+            timeout = float(header)
+        except ValueError:
+            timeout = 0
+        if timeout <= 0:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be a positive number of seconds")
+        if REQUEST_TIMEOUT_SECONDS:
+            timeout = min(timeout, REQUEST_TIMEOUT_SECONDS)
+    return CancelToken(timeout)
+
+
+async def run_cancellable(http_request, token, func, *args, **kwargs):
+    """
+    Run `func(*args, cancel=token, **kwargs)` on the threadpool, cancelling it if the client leaves
+
+    Only returns (or raises) once the worker thread has stopped, so the
+    caller's replica lease is not released while the replica is still busy.
+    """
+    work = asyncio.ensure_future(run_in_threadpool(profiled(func), *args, cancel=token, **kwargs))
+    try:
+        while not work.done():
+            await asyncio.wait({work}, timeout=DISCONNECT_POLL_SECONDS)
+            if not work.done() and not token.cancelled and await http_request.is_disconnected():
+                token.cancel('disconnected')
+    except asyncio.CancelledError:
+        token.cancel('disconnected')
+        raise
+    return work.result()
+
+
+def cancelled_error(error):
+    """
+    504 when the deadline passed, 499 (client closed request) otherwise
+    """
+    return HTTPException(status_code=504 if error.reason == 'deadline' else 499, detail=str(error))
+
+
+def resolve_server_path(file_path):
+    """
+    Resolve a recording path sent by the Node server to a local path
+    """
+    return os.path.join(SERVER_BASE_DIR, file_path)
 
 
 @app.get("/")
@@ -49,30 +285,226 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
+    """
+    Detailed health check
+    
+    `status` is liveness (the process is serving requests); `ready` says
+    whether the models are loaded. Jobs can be submitted before then and
+    start once loading finishes.
+    """
     return {
         "status": "healthy",
+        "ready": model_pool.ready,
         "whisper_model": WHISPER_MODEL,
+        "cascade_model": CASCADE_MODEL,
+        "models": model_pool.stats(),
+        "jobs": job_queue.stats(),
+        "cache": model_pool.cache.stats() if model_pool.cache else None,
         "timestamp": datetime.now().isoformat()
     }
 
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the models are loaded and warmed up"""
+    stats = model_pool.stats()
+    if not model_pool.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": stats['state'], "error": stats['error']},
+            headers={"Retry-After": str(MODEL_RETRY_AFTER)}
+        )
+    return {"status": "ready", "load_seconds": stats['load_seconds']}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/debug/profile")
+async def profile_process(request: Request, seconds: float = 30):
+    """
+    Sample every thread for a while and return the hottest functions
+    
+    Needs the `X-Profile-Token` header to match PROFILE_TOKEN. The full
+    folded stacks are written to PROFILE_DIR for flamegraph tools.
+    """
+    if not PROFILE_TOKEN or request.headers.get("X-Profile-Token") != PROFILE_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling is not enabled")
+
+    profiler, path = await run_in_threadpool(profile_for, min(seconds, 300))
+    return {
+        "file": path,
+        "samples": profiler.sample_count,
+        "top": profiler.top()
+    }
+
+
+def transcript_response(result, layout='turns'):
+    """
+    JSON response for a transcript, with the conversation as turns or columns
+
+    `columns` sends one array per field (see writers.to_columns) instead
+    of a dict per turn. Encoded with orjson when it is installed.
+    """
+    if layout == 'columns':
+        conversation = result.get('conversation') or []
+        result = {key: value for key, value in result.items() if key != 'conversation'}
+        result.update(to_columns(conversation))
+    response_class = ORJSONResponse if orjson else JSONResponse
+    return response_class(content=result)
+
+
+STREAM_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+
+def encode_event(event, stream):
+    """
+    One streamed event as an NDJSON line or a server-sent event
+    """
+    if stream == 'sse':
+        return b'event: ' + event['event'].encode() + b'\ndata: ' + dumps(event) + b'\n\n'
+    return dumps(event) + b'\n'
+
+
+def speaker_patch(segments, conversation):
+    """
+    The `speakers` event completing the segments already streamed
+
+    `speakers` lines up with the streamed segment indexes. When the final
+    conversation no longer matches them (e.g. the cascade re-decoded some
+    segments), the event also carries the `conversation` that replaces them.
+    """
+    key = lambda turn: (round(turn['start'], 3), round(turn['end'], 3), turn['text'])
+    if len(segments) == len(conversation):
+        speakers = {key(turn): turn['speaker'] for turn in conversation}
+        labels = [speakers.get(key(segment)) for segment in segments]
+        if None not in labels:
+            return {'event': 'speakers', 'speakers': labels}
+    return {
+        'event': 'speakers',
+        'speakers': [turn['speaker'] for turn in conversation],
+        'conversation': conversation
+    }
+
+
+def stream_transcription(path, stream, token, run, owned=None):
+    """
+    Stream a transcription's segments as Whisper decodes them
+
+    Reserves a replica and calls `run(transcriber, on_segment, cancel)` on
+    a worker thread; it returns the transcribe_file result. Events, in
+    order: `segment` (index, start, end, text, and speaker when already
+    known), one `speakers` patch once diarization and merging finish (see
+    speaker_patch), then `done` with the metadata, or `error`. The work is
+    cancelled through `token` if the client stops reading. `owned` (e.g.
+    an upload's file) is closed once the work is done.
+    """
+    stack = ExitStack()
+    if owned is not None:
+        stack.enter_context(owned)
+    try:
+        transcriber = stack.enter_context(model_pool.lease())
+    except BaseException:
+        stack.close()
+        raise
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    started = time.perf_counter()
+
+    def on_segment(segment):
+        loop.call_soon_threadsafe(events.put_nowait, ('segment', segment))
+
+    def work():
+        # The replica stays reserved until the work is done, even if the client has gone
+        with stack:
+            try:
+                outcome = ('result', run(transcriber, on_segment, token))
+            except Exception as e:
+                outcome = ('error', e)
+        loop.call_soon_threadsafe(events.put_nowait, outcome)
+
+    loop.run_in_executor(None, profiled(work))
+
+    async def body():
+        sent = []
+        finished = False
+
+        def segment_event(segment):
+            if not sent:
+                metrics.FIRST_SEGMENT_SECONDS.observe(time.perf_counter() - started, path=path)
+            turn = {'start': segment['start'], 'end': segment['end'], 'text': segment['text'].strip()}
+            if 'speaker' in segment:
+                turn['speaker'] = segment['speaker']
+            sent.append(turn)
+            return encode_event({'event': 'segment', 'index': len(sent) - 1, **turn}, stream)
+
+        try:
+            while True:
+                kind, value = await events.get()
+                if kind == 'segment':
+                    yield segment_event(value)
+                    continue
+
+                finished = True
+                if kind == 'error' or value is None:
+                    detail = str(value) if kind == 'error' else "Failed to decode audio file"
+                    print(f"❌ Error: {detail}")
+                    yield encode_event({'event': 'error', 'detail': detail}, stream)
+                    return
+
+                if not sent:
+                    # Cached results come back whole, so send them as segments first
+                    for turn in value['conversation']:
+                        yield segment_event(turn)
+                yield encode_event(speaker_patch(sent, value['conversation']), stream)
+                yield encode_event({'event': 'done', 'metadata': value['metadata']}, stream)
+                print(f"✅ Streamed {len(sent)} segments")
+                return
+        finally:
+            # The client went away mid-stream
+            if not finished:
+                token.cancel('disconnected')
+
+    return StreamingResponse(
+        body(),
+        media_type=STREAM_MEDIA_TYPES[stream],
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.post("/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+async def transcribe_audio(http_request: Request, file: UploadFile = File(...), channels: bool = Form(False),
+                           agent_id: Optional[str] = Form(None),
+                           layout: Literal['turns', 'columns'] = 'turns',
+                           stream: Optional[Literal['ndjson', 'sse']] = None):
     """
     Transcribe audio file with speaker diarization
     
     Args:
         file: Audio file (webm, mp3, wav, m4a)
+        channels: The file is stereo with one speaker per channel
+            (CHANNEL_LABELS order), so diarization is skipped
+        agent_id: Enrolled agent on the call, attributed by voiceprint
+        layout: Query parameter, `columns` for one array per field
+        stream: Query parameter, `ndjson` or `sse` to stream segments as
+            they are transcribed (see stream_transcription)
     
     Returns:
         JSON with conversation and metadata
     """
-    temp_file = None
-    wav_file = None
-    
     try:
         # Validate file
+        check_agent_id(agent_id)
+        token = request_token(http_request)
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
         
@@ -83,67 +515,59 @@ async def transcribe_audio(file: UploadFile = File(...)):
                 detail=f"Unsupported format. Supported: {', '.join(SUPPORTED_FORMATS)}"
             )
         
-        # Read file content
-        content = await file.read()
+        # The form parser has already spooled the upload to a temporary
+        # file; hand that over rather than reading it all into memory
+        size = source_size(file.file)
         
-        # Check file size
-        if len(content) > MAX_FILE_SIZE:
+        # Check file size (UploadSizeLimit usually rejects these earlier)
+        if size > MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=413,
                 detail=f"File too large. Max size: {MAX_FILE_SIZE / 1024 / 1024}MB"
             )
         
         print(f"\n{'='*60}")
-        print(f"📁 Processing: {file.filename} ({len(content)} bytes)")
+        print(f"📁 Processing: {file.filename} ({size} bytes)")
         print(f"{'='*60}")
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(
-            delete=False, 
-            suffix=f'.{file_ext}'
-        ) as temp:
-            temp.write(content)
-            temp_file = temp.name
-        
-        print(f"💾 Saved to temp: {temp_file}")
-        
-        # Convert to WAV if needed
-        if file_ext != 'wav':
-            wav_file = convert_to_wav(temp_file)
-            if not wav_file:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to convert audio file"
-                )
-        else:
-            wav_file = temp_file
-        
-        # Transcribe
-        print("🎤 Transcribing audio...")
-        transcription = await run_in_threadpool(transcriber.transcribe_audio, wav_file)
-        
-        # Diarize
-        print("👥 Performing speaker diarization...")
-        diarization = await run_in_threadpool(transcriber.diarize_audio, wav_file)
+        if stream:
+            # Take the spooled upload over, since FastAPI may close it as soon
+            # as this handler returns; the stream closes it when it is done
+            upload, file.file = file.file, io.BytesIO()
+            return stream_transcription('/transcribe', stream, token, lambda transcriber, on_segment, cancel: transcriber.transcribe_file(
+                file.filename,
+                data=upload,
+                channels=channels,
+                agent_id=agent_id,
+                on_segment=on_segment,
+                cancel=cancel
+            ), owned=upload)
         
-        # Merge
-        print("🔗 Merging transcription with speakers...")
-        conversation = await run_in_threadpool(transcriber.merge_transcription_and_diarization,
-            transcription,
-            diarization
-        )
+        # Decode → transcribe → diarize → merge (in windows for long calls),
+        # stopped early if the client disconnects or the deadline passes
+        with model_pool.lease() as transcriber:
+            result = await run_cancellable(
+                http_request,
+                token,
+                transcriber.transcribe_file,
+                file.filename,
+                data=file.file,
+                channels=channels,
+                agent_id=agent_id
+            )
+        if result is None:
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to decode audio file"
+            )
+        conversation = result['conversation']
+        metadata = result['metadata']
         
         # Prepare response
         result = {
             "status": "success",
             "conversation": conversation,
-            "metadata": {
-                "filename": file.filename,
-                "duration": transcription['segments'][-1]['end'] if transcription['segments'] else 0,
-                "language": transcription.get('language', 'en'),
-                "speakers_detected": len(set([s['speaker'] for s in diarization])),
-                "processed_at": datetime.now().isoformat()
-            }
+            "metadata": metadata
         }
         
         print(f"✅ Processing complete!")
@@ -151,116 +575,419 @@ async def transcribe_audio(file: UploadFile = File(...)):
         print(f"   - Speakers: {result['metadata']['speakers_detected']}")
         print(f"   - Turns: {len(conversation)}")
         
-        return JSONResponse(content=result)
+        return transcript_response(result, layout)
     
     except HTTPException as e:
         raise e
     
+    except PoolSaturatedError as e:
+        raise pool_saturated(e)
+    
+    except Cancelled as e:
+        raise cancelled_error(e)
+    
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/transcribe-tracks")
+async def transcribe_tracks(http_request: Request, agent: UploadFile = File(...), customer: UploadFile = File(...),
+                            layout: Literal['turns', 'columns'] = 'turns',
+                            stream: Optional[Literal['ndjson', 'sse']] = None):
+    """
+    Transcribe a call recorded as one track per participant
     
-    finally:
-        # Cleanup temporary files
-        if temp_file and os.path.exists(temp_file):
-            os.remove(temp_file)
-        if wav_file and wav_file != temp_file and os.path.exists(wav_file):
-            os.remove(wav_file)
+    Each track is transcribed on its own and labelled by who recorded it,
+    so no diarization is needed.
+    
+    Args:
+        agent: Agent's audio track
+        customer: Customer's audio track
+    
+    Returns:
+        JSON with conversation and metadata
+    """
+    uploads = [agent, customer]
+    try:
+        token = request_token(http_request)
+        for upload in uploads:
+            file_ext = (upload.filename or '').split('.')[-1].lower()
+            if f'.{file_ext}' not in SUPPORTED_FORMATS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unsupported format. Supported: {', '.join(SUPPORTED_FORMATS)}"
+                )
+        
+        print(f"\n{'='*60}")
+        print(f"📁 Processing tracks: {', '.join(u.filename for u in uploads)}")
+        print(f"{'='*60}")
+        
+        if stream:
+            tracks = [await upload.read() for upload in uploads]
+            return stream_transcription('/transcribe-tracks', stream, token, lambda transcriber, on_segment, cancel: transcriber.transcribe_file(
+                agent.filename,
+                tracks=tracks,
+                on_segment=on_segment,
+                cancel=cancel
+            ))
+        
+        with model_pool.lease() as transcriber:
+            result = await run_cancellable(
+                http_request,
+                token,
+                transcriber.transcribe_file,
+                agent.filename,
+                tracks=[upload.file for upload in uploads]
+            )
+        if result is None:
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to decode audio file"
+            )
+        
+        print(f"✅ Processing complete!")
+        return transcript_response({"status": "success", **result}, layout)
+    
+    except HTTPException as e:
+        raise e
+    
+    except PoolSaturatedError as e:
+        raise pool_saturated(e)
+    
+    except Cancelled as e:
+        raise cancelled_error(e)
+    
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 class FilePathRequest(BaseModel):
     file_path: str
+    channels: bool = False  # Stereo recording with one speaker per channel
+    track_paths: Optional[List[str]] = None  # One recording per speaker, in CHANNEL_LABELS order
+    agent_id: Optional[str] = None  # Enrolled agent on the call, attributed by voiceprint
+
+
+class JobRequest(FilePathRequest):
+    callback_url: Optional[str] = None
+    priority: str = 'normal'  # One of JOB_PRIORITIES; shorter recordings run first within a priority
+    timeout_seconds: Optional[float] = None  # Cancel the job if unfinished this long after submission
+
+
+def resolve_tracks(request):
+    """
+    Local paths of a request's per-speaker tracks (None if it has none)
+    """
+    if not request.track_paths:
+        return None
+    paths = [resolve_server_path(p) for p in request.track_paths]
+    for path in paths:
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"Track not found: {path}")
+    return paths
 
 
 @app.post("/transcribe-from-path")
-async def transcribe_from_path(request: FilePathRequest):
+async def transcribe_from_path(request: FilePathRequest, http_request: Request, layout: Literal['turns', 'columns'] = 'turns',
+                               stream: Optional[Literal['ndjson', 'sse']] = None):
     """
     Transcribe audio file from server path
     
     Args:
         file_path: Full path to audio file on server
+        stream: Query parameter, `ndjson` or `sse` to stream segments as
+            they are transcribed (see stream_transcription)
     
     Returns:
         JSON with conversation and metadata
     """
-    wav_file = None
-    file_path = request.file_path
-    file_path = f"/home/ritik-maurya/Documents/Node/MCP_Call_Connect/webrtc-call-server/{file_path}"
-
+    file_path = resolve_server_path(request.file_path)
     
     try:
         # Check if file exists
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
+        tracks = resolve_tracks(request)
         
         print(f"\n{'='*60}")
         print(f"📁 Processing: {file_path}")
         print(f"{'='*60}")
         
-        # Convert to WAV if needed
-        if not file_path.endswith('.wav'):
-            wav_file = convert_to_wav(file_path)
-            if not wav_file:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Failed to convert audio file"
-                )
-        else:
-            wav_file = file_path
+        agent_id = check_agent_id(request.agent_id)
+        token = request_token(http_request)
         
-        # Transcribe
-        print("🎤 Transcribing audio...")
-        transcription = await run_in_threadpool(transcriber.transcribe_audio, wav_file)
-        
-        # Diarize
-        print("👥 Performing speaker diarization...")
-        diarization = await run_in_threadpool(transcriber.diarize_audio, wav_file)
-        
-        # Merge
-        print("🔗 Merging transcription with speakers...")
-        conversation = await run_in_threadpool(transcriber.merge_transcription_and_diarization,
-            transcription,
-            diarization
-        )
+        def transcribe_and_save(transcriber, on_segment=None, cancel=None):
+            # Decode → transcribe → diarize → merge → save
+            result = transcriber.transcribe_file(
+                file_path,
+                channels=request.channels,
+                tracks=tracks,
+                agent_id=agent_id,
+                on_segment=on_segment,
+                cancel=cancel
+            )
+            if result is not None:
+                base_name = os.path.basename(file_path).rsplit('.', 1)[0]
+                output_file = os.path.join(OUTPUT_DIR, f"{base_name}_transcript.txt")
+                os.makedirs(OUTPUT_DIR, exist_ok=True)
+                save_transcription(output_file, result['conversation'], result['metadata'])
+            return result
         
-        metadata = {
-            'filename': os.path.basename(wav_file),
-            'duration': transcription['segments'][-1]['end'] if transcription['segments'] else 0,
-            'language': transcription.get('language', 'en'),
-            'processed_at': datetime.now().isoformat()
-        }
-
-        base_name = os.path.basename(wav_file).rsplit('.', 1)[0]
-        output_file = os.path.join(OUTPUT_DIR, f"{base_name}_transcript.txt")
+        if stream:
+            return stream_transcription('/transcribe-from-path', stream, token, transcribe_and_save)
         
-        save_transcription(output_file, conversation, metadata)
-        # Prepare response
-        result = {
-            "status": "success",
-            "conversation": conversation,
-            "metadata": {
-                "filename": os.path.basename(file_path),
-                "duration": transcription['segments'][-1]['end'] if transcription['segments'] else 0,
-                "language": transcription.get('language', 'en'),
-                "speakers_detected": len(set([s['speaker'] for s in diarization])),
-                "processed_at": datetime.now().isoformat()
-            }
-        }
+        with model_pool.lease() as transcriber:
+            result = await run_cancellable(http_request, token, transcribe_and_save, transcriber)
+        if result is None:
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to decode audio file"
+            )
         
         print(f"✅ Processing complete!")
-        return JSONResponse(content=result)
+        return transcript_response({"status": "success", **result}, layout)
     
     except HTTPException as e:
         raise e
     
+    except PoolSaturatedError as e:
+        raise pool_saturated(e)
+    
+    except Cancelled as e:
+        raise cancelled_error(e)
+    
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queue a server-side recording for transcription
+    
+    Returns immediately with a job id; poll `/jobs/{job_id}` for progress
+    or pass `callback_url` to be notified when the job finishes. Jobs run
+    by `priority`, then shortest recording first.
+    """
+    file_path = resolve_server_path(request.file_path)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    tracks = resolve_tracks(request)
+    
+    try:
+        # Probing the recording's duration reads its header, so keep it off the event loop
+        job = await run_in_threadpool(
+            job_queue.submit,
+            file_path,
+            callback_url=request.callback_url,
+            priority=request.priority,
+            timeout=request.timeout_seconds or JOB_TIMEOUT_SECONDS,
+            channels=request.channels,
+            tracks=tracks,
+            agent_id=check_agent_id(request.agent_id)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    
+    return {
+        **job.to_dict(),
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result"
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status and current pipeline stage"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancel a job: a queued job never starts, a running one stops at its
+    next segment or diarization batch
+    """
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, layout: Literal['turns', 'columns'] = 'turns'):
+    """
+    Conversation and metadata of a finished job
+    
+    Returns 202 with the job status while it is still running.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == 'failed':
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status == 'cancelled':
+        raise HTTPException(status_code=410, detail=job.error)
+    if job.status != 'completed':
+        return JSONResponse(status_code=202, content=job.to_dict())
+    return transcript_response(job.result, layout)
+
+
+@app.get("/search")
+async def search_transcripts(q: str, speaker: Optional[str] = None, phrase: bool = False,
+                             sort: Literal['recent', 'relevance'] = 'recent', limit: int = 20,
+                             cursor: Optional[int] = None):
+    """
+    Find turns across all saved transcripts
+    
+    Args:
+        q: Words that must all appear; "quoted parts" as phrases, word* as a prefix
+        speaker: Only turns by this speaker (e.g. Customer)
+        phrase: Match the whole of `q` as one phrase
+        sort: `recent` (newest calls first) or `relevance` (BM25)
+        limit: Results per page (at most SEARCH_MAX_LIMIT)
+        cursor: `next_cursor` of the previous page
+    
+    Returns:
+        Matching turns with their timestamps and call, and the next page's cursor
+    """
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    try:
+        hits, next_cursor = await run_in_threadpool(
+            get_index().search, q, speaker=speaker, phrase=phrase, sort=sort, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "query": q,
+        "speaker": speaker,
+        "results": hits,
+        "next_cursor": next_cursor
+    }
+
+
+@app.post("/agents/{agent_id}/voiceprint")
+async def enroll_voiceprint(agent_id: str, file: UploadFile = File(...)):
+    """
+    Enroll (or extend) an agent's voiceprint from a recording of them alone
+
+    Calls sent with this `agent_id` then get Agent/Customer labels by
+    voiceprint instead of speaker clustering.
+    """
+    check_agent_id(agent_id)
+    audio = await run_in_threadpool(decode_audio, file.file.read(), SAMPLE_RATE)
+    if audio is None:
+        raise HTTPException(status_code=400, detail="Failed to decode audio file")
+
+    try:
+        with model_pool.lease() as transcriber:
+            return await run_in_threadpool(transcriber.enroll_agent, agent_id, audio)
+    except PoolSaturatedError as e:
+        raise pool_saturated(e)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/agents/{agent_id}/voiceprint")
+async def get_voiceprint(agent_id: str):
+    """Whether an agent is enrolled, and with how much audio"""
+    info = voiceprints.info(check_agent_id(agent_id))
+    if info is None:
+        raise HTTPException(status_code=404, detail="Agent not enrolled")
+    return info
+
+
+@app.delete("/agents/{agent_id}/voiceprint")
+async def delete_voiceprint(agent_id: str):
+    """Forget an agent's voiceprint"""
+    if not voiceprints.delete(check_agent_id(agent_id)):
+        raise HTTPException(status_code=404, detail="Agent not enrolled")
+    return {"status": "deleted", "agent_id": agent_id}
+
+
+def stream_decode(audio, prompt):
+    """
+    Decode one streaming window on whichever replica is free
+    """
+    with model_pool.lease(block=True) as transcriber:
+        segments, _ = transcriber.whisper_model.transcribe(
+            audio,
+            beam_size=STREAM_BEAM_SIZE,
+            condition_on_previous_text=False,
+            initial_prompt=prompt or None
+        )
+        return [{'start': s.start, 'end': s.end, 'text': s.text} for s in segments]
+
+
+@app.websocket("/ws/transcribe")
+async def transcribe_stream(websocket: WebSocket):
+    """
+    Live transcription while the call is in progress
     
+    Send binary messages of 16 kHz mono PCM16 audio and a text message
+    `{"event": "end"}` when the call ends. Receives JSON events:
+    `partial` (revised as more audio arrives), `final` and `done`.
+    """
+    from streaming import StreamingSession
+
+    if not model_pool.ready:
+        await websocket.close(code=1013, reason="Models are still loading")
+        return
+
+    await websocket.accept()
+    session = StreamingSession(stream_decode)
+    audio_ready = asyncio.Event()
+    ended = False
+
+    async def process():
+        # Decode on a worker thread while the receive loop keeps buffering
+        while not ended:
+            await audio_ready.wait()
+            audio_ready.clear()
+            if ended:
+                break
+            for event in await run_in_threadpool(session.step):
+                await websocket.send_json(event)
+
+    processor = asyncio.create_task(process())
+    print(f"🎙️ Streaming session started")
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes'):
+                session.append(message['bytes'])
+                if session.ready:
+                    audio_ready.set()
+            elif message.get('text') and json.loads(message['text']).get('event') == 'end':
+                ended = True
+                audio_ready.set()
+                await processor
+                for event in await run_in_threadpool(session.finish):
+                    await websocket.send_json(event)
+                await websocket.send_json({'type': 'done', 'duration': session.duration})
+                await websocket.close()
+                break
+
+    except WebSocketDisconnect:
+        pass
+
     finally:
-        # Cleanup temporary WAV file if created
-        if wav_file and wav_file != file_path and os.path.exists(wav_file):
-            os.remove(wav_file)
+        ended = True
+        audio_ready.set()
+        if not processor.done():
+            processor.cancel()
+        print(f"🎙️ Streaming session closed ({session.duration:.1f}s of audio)")
 
 
 if __name__ == "__main__":
@@ -1,4 +1,9 @@
 import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import numpy as np
 from pydub import AudioSegment
 
 def convert_to_wav(input_file, output_file=None):
@@ -35,6 +40,219 @@ def convert_to_wav(input_file, output_file=None):
         return None
 
 
+def _start_ffmpeg(source, sample_rate, channels=1):
+    """
+    Start ffmpeg decoding `source` to float32 PCM on its stdout
+
+    `source` is a path, raw file bytes or a binary file object; bytes and
+    file objects are fed through stdin from a thread so a full stdout pipe
+    can't deadlock us.
+    """
+    from_path = isinstance(source, str)
+    command = [
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-threads', '0',
+        '-i', source if from_path else 'pipe:0',
+        '-f', 'f32le', '-ac', str(channels), '-ar', str(sample_rate),
+        'pipe:1'
+    ]
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL if from_path else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    writer = None
+    if not from_path:
+        def feed():
+            try:
+                if hasattr(source, 'read'):
+                    for chunk in iter(lambda: source.read(1 << 20), b''):
+                        process.stdin.write(chunk)
+                else:
+                    process.stdin.write(source)
+            except BrokenPipeError:
+                pass
+            finally:
+                process.stdin.close()
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+
+    return process, writer
+
+
+def _finish_ffmpeg(process, writer):
+    error = process.stderr.read().decode(errors='replace').strip()
+    process.wait()
+    if writer:
+        writer.join()
+    if process.returncode != 0:
+        raise RuntimeError(error or f"ffmpeg exited with code {process.returncode}")
+
+
+def decode_audio(source, sample_rate=16000, chunk_size=1 << 20, channels=1):
+    """
+    Decode an audio file path or raw file bytes into a mono float32 array
+
+    Audio is resampled by ffmpeg and streamed from its stdout pipe, so
+    nothing is written to disk. With `channels` > 1 the result has one
+    row per channel.
+    """
+    from_bytes = isinstance(source, (bytes, bytearray, memoryview))
+
+    try:
+        process, writer = _start_ffmpeg(source, sample_rate, channels)
+
+        pcm = bytearray()
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            pcm.extend(chunk)
+
+        _finish_ffmpeg(process, writer)
+
+    except Exception as e:
+        # Some containers (e.g. m4a with the index at the end) need a
+        # seekable input, so retry those from a temporary file
+        if from_bytes:
+            with tempfile.NamedTemporaryFile() as temp:
+                temp.write(source)
+                temp.flush()
+                return decode_audio(temp.name, sample_rate, chunk_size, channels)
+        print(f"❌ Error decoding audio: {e}")
+        return None
+
+    samples = np.frombuffer(pcm, dtype=np.float32)
+    if channels > 1:
+        return np.ascontiguousarray(samples.reshape(-1, channels).T)
+    return samples
+
+
+def decode_channels(source, sample_rate=16000):
+    """
+    Decode a stereo recording into one mono array per channel
+
+    Returns None if decoding fails. Mono input comes back as a single
+    channel (ffmpeg upmixes it to two identical channels).
+    """
+    audio = decode_audio(source, sample_rate, channels=2)
+    if audio is None:
+        return None
+    if np.array_equal(audio[0], audio[1]):
+        return [audio[0]]
+    return list(audio)
+
+
+def source_size(source):
+    """
+    Size in bytes of an audio file path, raw file bytes or a seekable file object
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if hasattr(source, 'seek'):
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END)
+        source.seek(position)
+        return size
+    return os.path.getsize(source)
+
+
+def probe_duration(path, fallback_kbps=32):
+    """
+    Duration in seconds from the container header, without decoding any audio
+
+    WAV headers are read directly; other formats ask ffprobe. Recordings
+    without a duration in their header (MediaRecorder WebM) are estimated
+    from their size and bit rate. Returns None if the file is unreadable.
+    """
+    if path.lower().endswith('.wav'):
+        import wave
+        try:
+            with wave.open(path, 'rb') as f:
+                return f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError, OSError):
+            pass  # e.g. float WAV, which ffprobe still reads
+
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration,bit_rate',
+             '-of', 'default=noprint_wrappers=1', path],
+            capture_output=True, text=True, timeout=10
+        )
+        fields = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+        if fields.get('duration', 'N/A') != 'N/A':
+            return float(fields['duration'])
+        kbps = float(fields['bit_rate']) / 1000 if fields.get('bit_rate', 'N/A') != 'N/A' else fallback_kbps
+        return os.path.getsize(path) * 8 / 1000 / kbps
+    except Exception:
+        return None
+
+
+def iter_audio_windows(source, window_seconds, overlap_seconds, sample_rate=16000):
+    """
+    Decode audio as a stream of overlapping windows
+
+    Yields (start_sample, samples, is_last). Only about one window of audio
+    is held in memory at a time, whatever the length of the recording.
+    `source` is a path, raw file bytes or a binary file object.
+    """
+    from_path = isinstance(source, str)
+    position = source.tell() if hasattr(source, 'tell') else 0
+    produced = False
+    try:
+        for window in _decode_windows(source, window_seconds, overlap_seconds, sample_rate):
+            produced = True
+            yield window
+    except RuntimeError:
+        if from_path or produced:
+            raise
+        # Some containers (e.g. m4a with the index at the end) need a
+        # seekable input, so retry those from a temporary file
+        with tempfile.NamedTemporaryFile() as temp:
+            if hasattr(source, 'read'):
+                source.seek(position)
+                shutil.copyfileobj(source, temp, 1 << 20)
+            else:
+                temp.write(source)
+            temp.flush()
+            yield from _decode_windows(temp.name, window_seconds, overlap_seconds, sample_rate)
+
+
+def _decode_windows(source, window_seconds, overlap_seconds, sample_rate):
+    window = int(window_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+    step = window - overlap
+    process, writer = _start_ffmpeg(source, sample_rate)
+
+    try:
+        # Read straight into one preallocated window instead of growing a buffer
+        buffer = np.empty(window, dtype=np.float32)
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        start = 0
+        while True:
+            read = process.stdout.readinto(view[filled:])
+            if not read:
+                break
+            filled += read
+            # Only hand out a full window as non-final once we know more audio follows
+            if filled == len(view) and process.stdout.peek(1):
+                yield start, buffer.copy(), False
+                buffer[:overlap] = buffer[step:]
+                filled = overlap * 4
+                start += step
+
+        _finish_ffmpeg(process, writer)
+        yield start, buffer[:filled // 4].copy(), True
+
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
 def format_timestamp(seconds):
     """
     Convert seconds to HH:MM:SS format
@@ -45,39 +263,106 @@ def format_timestamp(seconds):
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 
-def save_transcription(output_file, conversation, metadata):
+def find_speakers_for_segments(segments, diarization):
+    """
+    Find the speaker talking during each segment with one sweep over the turns
+
+    Gives the same answers as AudioTranscriber.find_speaker_for_segment,
+    including tie-breaks, but only compares each segment with the turns
+    that can overlap it instead of the full diarization list.
+    """
+    speakers = ['UNKNOWN'] * len(segments)
+    turn_order = sorted(range(len(diarization)), key=lambda i: diarization[i]['start'])
+    segment_order = sorted(range(len(segments)), key=lambda i: segments[i]['start'])
+
+    active = []
+    next_turn = 0
+
+    for i in segment_order:
+        start = segments[i]['start']
+        end = segments[i]['end']
+
+        # Turns that started before this segment ends may overlap it
+        while next_turn < len(turn_order) and diarization[turn_order[next_turn]]['start'] < end:
+            active.append(turn_order[next_turn])
+            next_turn += 1
+
+        # Turns that ended before this segment starts can't overlap it or
+        # any later one (segments are visited in start order)
+        active = [t for t in active if diarization[t]['end'] > start]
+
+        overlaps = []
+        for t in active:
+            dia_seg = diarization[t]
+            overlap_duration = max(0, min(end, dia_seg['end']) - max(start, dia_seg['start']))
+            if overlap_duration > 0:
+                overlaps.append((t, dia_seg['speaker'], overlap_duration))
+
+        if not overlaps:
+            continue
+
+        # Accumulate in original diarization order so sums and tie-breaks
+        # match the per-segment scan exactly
+        speaker_times = {}
+        for _, speaker, overlap_duration in sorted(overlaps):
+            speaker_times[speaker] = speaker_times.get(speaker, 0) + overlap_duration
+        speakers[i] = max(speaker_times, key=speaker_times.get)
+
+    return speakers
+
+
+def save_transcription(output_file, conversation, metadata, formats=None, text=None):
     """
     Save transcription in multiple formats
+
+    `output_file` is the .txt path; machine-readable copies go next to it
+    in each of `formats` (default TRANSCRIPT_FORMATS, see writers.py).
+    The turns are also added to the search index (see search.py).
+    Returns the paths written.
     """
-    import json
-    
-    # JSON format
-    json_output = {
-        'metadata': metadata,
-        'conversation': conversation
-    }
+    import sqlite3
+    import time
+    import metrics
+    from config import SEARCH_INDEX_ENABLED, TRANSCRIPT_FORMATS, TRANSCRIPT_TEXT
+    from writers import write_transcript
     
-    json_file = output_file.replace('.txt', '.json')
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(json_output, f, indent=2, ensure_ascii=False)
+    started = time.perf_counter()
+    formats = TRANSCRIPT_FORMATS if formats is None else formats
+    text = TRANSCRIPT_TEXT if text is None else text
+    paths = []
     
-    print(f"✅ Saved JSON: {json_file}")
+    for fmt in formats:
+        path = write_transcript(output_file, conversation, metadata, fmt)
+        paths.append(path)
+        print(f"✅ Saved {fmt}: {path}")
     
     # Text format (readable)
-    txt_file = output_file
-    with open(txt_file, 'w', encoding='utf-8') as f:
-        f.write(f"Call Transcription\n")
-        f.write(f"=" * 50 + "\n\n")
-        f.write(f"File: {metadata['filename']}\n")
-        f.write(f"Duration: {format_timestamp(metadata['duration'])}\n")
-        f.write(f"Date: {metadata['processed_at']}\n\n")
-        f.write(f"Conversation:\n")
-        f.write(f"-" * 50 + "\n\n")
+    if text:
+        txt_file = output_file
+        with open(txt_file, 'w', encoding='utf-8') as f:
+            f.write(f"Call Transcription\n")
+            f.write(f"=" * 50 + "\n\n")
+            f.write(f"File: {metadata['filename']}\n")
+            f.write(f"Duration: {format_timestamp(metadata['duration'])}\n")
+            f.write(f"Date: {metadata['processed_at']}\n\n")
+            f.write(f"Conversation:\n")
+            f.write(f"-" * 50 + "\n\n")
+            
+            for turn in conversation:
+                speaker = turn['speaker']
+                timestamp = format_timestamp(turn['start'])
+                text_line = turn['text']
+                f.write(f"[{timestamp}] {speaker}: {text_line}\n\n")
         
-        for turn in conversation:
-            speaker = turn['speaker']
-            timestamp = format_timestamp(turn['start'])
-            text = turn['text']
-            f.write(f"[{timestamp}] {speaker}: {text}\n\n")
+        paths.append(txt_file)
+        print(f"✅ Saved TXT: {txt_file}")
     
-    print(f"✅ Saved TXT: {txt_file}")
\ No newline at end of file
+    if SEARCH_INDEX_ENABLED:
+        from search import get_index
+        try:
+            get_index().add(output_file, conversation, metadata)
+        except sqlite3.Error as e:
+            # The transcript is saved either way; `python search.py rebuild` catches up
+            print(f"⚠️  Could not index {output_file} for search: {e}")
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage='save')
+    return paths
@@ -0,0 +1,145 @@
+import bisect
+
+import numpy as np
+
+from config import *
+
+
+class SpeechMap:
+    """
+    Speech regions of a recording and the way back to its timeline
+
+    Both models are fed `compact(audio)`, the speech regions cut together
+    without the silence and hold music between them; `map_segments` and
+    `map_turns` turn timestamps in that speech-only audio back into
+    times in the original recording.
+    """
+    def __init__(self, regions, total_samples, sample_rate=SAMPLE_RATE):
+        self.regions = [(int(start), int(end)) for start, end in regions]
+        self.total_samples = total_samples
+        self.sample_rate = sample_rate
+
+        # Where each region starts in the speech-only audio
+        self.offsets = []
+        position = 0
+        for start, end in self.regions:
+            self.offsets.append(position)
+            position += end - start
+        self.speech_samples = position
+
+    @classmethod
+    def detect(cls, audio, sample_rate=SAMPLE_RATE):
+        """
+        Find speech with Silero VAD (as bundled with faster-whisper)
+        """
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+        options = VadOptions(
+            min_silence_duration_ms=VAD_MIN_SILENCE_MS,
+            speech_pad_ms=VAD_SPEECH_PAD_MS,
+            max_speech_duration_s=VAD_MAX_REGION_SECONDS
+        )
+        regions = [
+            (max(0, r['start']), min(len(audio), r['end']))
+            for r in get_speech_timestamps(audio, options, sampling_rate=sample_rate)
+        ]
+        return cls([r for r in regions if r[1] > r[0]], len(audio), sample_rate)
+
+    @classmethod
+    def whole(cls, audio, sample_rate=SAMPLE_RATE):
+        """
+        Treat all of `audio` as speech (e.g. for warm-up)
+        """
+        return cls([(0, len(audio))], len(audio), sample_rate)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['regions'], data['total_samples'], data['sample_rate'])
+
+    def to_dict(self):
+        return {
+            'regions': self.regions,
+            'total_samples': self.total_samples,
+            'sample_rate': self.sample_rate
+        }
+
+    @property
+    def speech_seconds(self):
+        return self.speech_samples / self.sample_rate
+
+    @property
+    def speech_ratio(self):
+        return self.speech_samples / self.total_samples if self.total_samples else 0.0
+
+    def compact(self, audio):
+        """
+        The speech regions of `audio` cut together
+        """
+        if not self.regions:
+            return audio[:0]
+        return np.concatenate([audio[start:end] for start, end in self.regions])
+
+    def compact_regions(self):
+        """
+        The regions as (start, end) samples within the speech-only audio
+        """
+        return [
+            (offset, offset + end - start)
+            for offset, (start, end) in zip(self.offsets, self.regions)
+        ]
+
+    def _region(self, sample, is_end):
+        # A time exactly on a cut belongs to the region before it when it ends a span
+        if is_end:
+            index = bisect.bisect_left(self.offsets, sample) - 1
+        else:
+            index = bisect.bisect_right(self.offsets, sample) - 1
+        return min(max(index, 0), len(self.regions) - 1)
+
+    def to_original(self, seconds, is_end=False):
+        """
+        Map a time in the speech-only audio back to the original recording
+        """
+        if not self.regions:
+            return seconds
+        sample = seconds * self.sample_rate
+        index = self._region(sample, is_end)
+        original = self.regions[index][0] + sample - self.offsets[index]
+        return min(original, self.total_samples) / self.sample_rate
+
+    def map_segments(self, segments):
+        """
+        Whisper segments with their start and end mapped back
+        """
+        return [
+            {
+                **s,
+                'start': self.to_original(s['start']),
+                'end': self.to_original(s['end'], is_end=True)
+            }
+            for s in segments
+        ]
+
+    def map_turns(self, turns):
+        """
+        Speaker turns mapped back, split where they cross removed silence
+        """
+        if not self.regions:
+            return turns
+
+        mapped = []
+        for turn in turns:
+            start = turn['start'] * self.sample_rate
+            end = turn['end'] * self.sample_rate
+            for index in range(self._region(start, False), self._region(end, True) + 1):
+                region_start, region_end = self.regions[index]
+                offset = self.offsets[index]
+                low = max(start, offset)
+                high = min(end, offset + region_end - region_start)
+                if high > low:
+                    mapped.append({
+                        **turn,
+                        'start': (region_start + low - offset) / self.sample_rate,
+                        'end': (region_start + high - offset) / self.sample_rate
+                    })
+        return mapped
@@ -0,0 +1,240 @@
+import os
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from config import *
+
+AGENT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+MIN_WINDOW_RMS = 0.005  # Windows quieter than this are silence, not a voice
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SpeakerEmbedder:
+    """
+    Speaker embeddings of short, overlapping windows, from Pyannote's embedding model
+
+    Runs only the embedding network, without the segmentation model or
+    clustering, so it is much cheaper than full diarization.
+    """
+    def __init__(self, pipeline, window=VOICEPRINT_WINDOW_SECONDS, step=VOICEPRINT_STEP_SECONDS,
+                 batch_size=VOICEPRINT_BATCH_SIZE):
+        self.pipeline = pipeline
+        self.window = int(window * SAMPLE_RATE)
+        self.step = int(step * SAMPLE_RATE)
+        self.batch_size = batch_size
+
+    def embed(self, waveforms, masks):
+        """
+        (batch, dimension) embeddings of (batch, samples) waveforms
+        """
+        import torch
+
+        return self.pipeline._embedding(
+            torch.from_numpy(waveforms[:, None]),
+            masks=torch.from_numpy(masks)
+        )
+
+    def windows(self, audio, cancel=None):
+        """
+        (starts, ends, embeddings) of the voiced windows of 16 kHz mono audio
+
+        Times are in seconds; embeddings are unit length. The last window
+        is aligned with the end of the audio, and audio shorter than one
+        window is zero-padded and masked. `cancel` is checked between batches.
+        """
+        n = len(audio)
+        embedding_batches = []
+        starts = []
+        if n >= SAMPLE_RATE // 2:
+            last = max(n - self.window, 0)
+            starts = list(range(0, last + 1, self.step))
+            if starts[-1] != last:
+                starts.append(last)
+
+        kept_starts, kept_ends = [], []
+        for first in range(0, len(starts), self.batch_size):
+            if cancel:
+                cancel.check()
+            batch_starts = starts[first:first + self.batch_size]
+            waveforms = np.zeros((len(batch_starts), self.window), dtype=np.float32)
+            masks = np.zeros((len(batch_starts), self.window), dtype=np.float32)
+            for row, start in enumerate(batch_starts):
+                clip = audio[start:start + self.window]
+                waveforms[row, :len(clip)] = clip
+                masks[row, :len(clip)] = 1
+            voiced = np.sqrt((waveforms ** 2).sum(axis=1) / masks.sum(axis=1)) >= MIN_WINDOW_RMS
+            if not voiced.any():
+                continue
+
+            embeddings = np.asarray(self.embed(waveforms[voiced], masks[voiced]))
+            valid = ~np.isnan(embeddings).any(axis=1)
+            embedding_batches.append(normalize(embeddings[valid]))
+            for start, keep in zip(np.array(batch_starts)[voiced], valid):
+                if keep:
+                    kept_starts.append(start / SAMPLE_RATE)
+                    kept_ends.append(min(start + self.window, n) / SAMPLE_RATE)
+
+        if not embedding_batches:
+            return np.array([]), np.array([]), np.empty((0, 0), dtype=np.float32)
+        return np.array(kept_starts), np.array(kept_ends), np.concatenate(embedding_batches)
+
+
+def windows_to_turns(starts, ends, is_agent, labels=VOICEPRINT_LABELS):
+    """
+    Speaker turns from per-window agent/other decisions
+
+    Overlapping windows hand over at the middle of their overlap, and
+    consecutive windows with the same speaker become one turn.
+    """
+    turns = []
+    for i in range(len(starts)):
+        start, end = starts[i], ends[i]
+        if i > 0 and starts[i] < ends[i - 1]:
+            start = (starts[i] + ends[i - 1]) / 2
+        if i + 1 < len(starts) and starts[i + 1] < end:
+            end = (starts[i + 1] + end) / 2
+        speaker = labels[0] if is_agent[i] else labels[1]
+        if turns and turns[-1]['speaker'] == speaker and start - turns[-1]['end'] < 1e-6:
+            turns[-1]['end'] = float(end)
+        else:
+            turns.append({'start': float(start), 'end': float(end), 'speaker': speaker})
+    return turns
+
+
+def agent_windows(embeddings, voiceprint, threshold=VOICEPRINT_THRESHOLD):
+    """
+    Which windows are the agent, by cosine similarity smoothed over neighbours
+    """
+    similarities = embeddings @ voiceprint
+    if len(similarities) >= 3:
+        # A 3-window moving average stops single noisy windows flipping the speaker
+        padded = np.pad(similarities, 1, mode='edge')
+        similarities = np.convolve(padded, np.ones(3) / 3, mode='valid')
+    return similarities >= threshold
+
+
+def label_clusters(embeddings, voiceprint, threshold=VOICEPRINT_THRESHOLD, labels=VOICEPRINT_LABELS):
+    """
+    Names for diarization clusters: the one closest to the voiceprint is the agent
+
+    `embeddings` maps cluster label to centroid. Returns {} when no
+    cluster is close enough (or the voiceprint came from another
+    embedding model), leaving the usual SPEAKER_LABELS mapping.
+    """
+    speakers = [s for s, e in embeddings.items() if len(e) == len(voiceprint) and not np.isnan(e).any()]
+    if not speakers:
+        return {}
+    similarities = normalize(np.stack([embeddings[s] for s in speakers])) @ voiceprint
+    best = int(np.argmax(similarities))
+    if similarities[best] < threshold:
+        return {}
+    return {s: labels[0] if i == best else labels[1] for i, s in enumerate(speakers)}
+
+
+class VoiceprintStore:
+    """
+    Enrolled agents' voiceprints, on disk and cached in memory
+
+    A voiceprint is the unit-length mean of an agent's window embeddings,
+    kept as `{agent_id}.npz` in `directory` together with the running
+    (unnormalized) sum it is computed from. Entries are reloaded when
+    their file changes, so replicas, the watcher and the API process all
+    see new enrollments.
+    """
+    def __init__(self, directory=VOICEPRINT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._cache = {}  # agent_id -> (mtime, embedding, count, total)
+
+    def _path(self, agent_id):
+        if not AGENT_ID_PATTERN.match(agent_id or ''):
+            raise ValueError(f"Invalid agent id: {agent_id!r}")
+        return os.path.join(self.directory, f"{agent_id}.npz")
+
+    def _load(self, agent_id):
+        path = self._path(agent_id)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._cache.pop(agent_id, None)
+            return None
+        cached = self._cache.get(agent_id)
+        if cached and cached[0] == mtime:
+            return cached
+        with np.load(path) as data:
+            count = int(data['count'])
+            if 'total' in data:
+                total = data['total'].astype(np.float32)
+            else:
+                # Enrolled before the sum was stored; the unit mean is the best estimate
+                total = data['embedding'].astype(np.float32) * count
+            entry = (mtime, normalize(total), count, total)
+        self._cache[agent_id] = entry
+        return entry
+
+    def get(self, agent_id):
+        """
+        The agent's voiceprint, or None if they are not enrolled
+        """
+        with self._lock:
+            entry = self._load(agent_id)
+        return entry[1] if entry else None
+
+    def info(self, agent_id):
+        with self._lock:
+            entry = self._load(agent_id)
+        if not entry:
+            return None
+        return {
+            'agent_id': agent_id,
+            'windows': entry[2],
+            'dimension': len(entry[1]),
+            'updated_at': datetime.fromtimestamp(entry[0]).isoformat()
+        }
+
+    def version(self, agent_id):
+        """
+        Changes whenever the agent's voiceprint does (for cache keys)
+        """
+        with self._lock:
+            entry = self._load(agent_id)
+        return f"{entry[2]}@{entry[0]}" if entry else None
+
+    def enroll(self, agent_id, embeddings):
+        """
+        Add window embeddings of the agent's voice to their voiceprint
+        """
+        embeddings = normalize(np.asarray(embeddings, dtype=np.float32))
+        path = self._path(agent_id)
+        with self._lock:
+            entry = self._load(agent_id)
+            total = embeddings.sum(axis=0)
+            count = len(embeddings)
+            if entry:
+                total += entry[3]
+                count += entry[2]
+            embedding = normalize(total)
+
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                np.savez(f, embedding=embedding, count=count, total=total)
+            os.replace(temp_path, path)
+        print(f"🎙️  Enrolled {len(embeddings)} windows for agent {agent_id} ({count} total)")
+        return self.info(agent_id)
+
+    def delete(self, agent_id):
+        path = self._path(agent_id)
+        with self._lock:
+            self._cache.pop(agent_id, None)
+            if not os.path.exists(path):
+                return False
+            os.remove(path)
+        return True
@@ -0,0 +1,272 @@
+"""
+Long-running daemon that transcribes recordings as they land in RECORDINGS_DIR
+
+Models stay loaded for the life of the process, and new files are noticed
+through inotify (Linux), falling back to periodic rescans elsewhere.
+Transcripts go to OUTPUT_DIR and the batch manifest, so
+process_recordings.py and the watcher never redo each other's work.
+
+Usage:
+    python watcher.py [--recordings-dir DIR] [--callback-url URL]
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from collections import deque
+
+from config import *
+from jobs import JobQueue, QueueFullError
+from process_recordings import Manifest, find_recordings
+
+# inotify(7) event masks
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_Q_OVERFLOW = 0x4000
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+class InotifyWatch:
+    """
+    Names of files written to or moved into a folder, straight from libc's inotify
+    """
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"Cannot watch {directory}")
+
+    def read(self, timeout):
+        """
+        File names changed within `timeout` seconds, or None if events were lost
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        names = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name:
+                names.append(name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatch:
+    """
+    Fallback without inotify: every read asks for a full rescan
+    """
+    def read(self, timeout):
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+class RecordingWatcher:
+    """
+    Feeds finished recordings from a folder into a JobQueue
+
+    The recorder keeps appending to a file until the call ends, so a file
+    is only picked up once its size and mtime have not changed for
+    `settle_seconds`. Events for the same file collapse into one pending
+    entry, and files the manifest already has as processed (same size and
+    mtime or content) are skipped. When the job queue is full, stable
+    files wait here in arrival order and are offered again as jobs finish,
+    so a burst of recordings is never dropped or loaded all at once.
+    """
+    def __init__(self, transcriber, recordings_dir=RECORDINGS_DIR, output_dir=OUTPUT_DIR,
+                 settle_seconds=WATCH_SETTLE_SECONDS, rescan_seconds=WATCH_RESCAN_SECONDS,
+                 queue_size=WATCH_QUEUE_SIZE, callback_url=WATCH_CALLBACK_URL,
+                 manifest_path=BATCH_MANIFEST, workers=1, use_inotify=True):
+        self.recordings_dir = recordings_dir
+        self.output_dir = output_dir
+        self.settle_seconds = settle_seconds
+        self.rescan_seconds = rescan_seconds
+        self.callback_url = callback_url
+        self.queue_size = queue_size
+        self.jobs = JobQueue(transcriber, workers=workers, max_queued=queue_size, output_dir=output_dir)
+        self.manifest = Manifest(manifest_path)
+        self.watch = self._open_watch() if use_inotify else PollingWatch()
+
+        self.pending = {}  # path -> (size, mtime, unchanged since)
+        self.waiting = deque()  # stable files the job queue had no room for
+        self.submitted = {}  # path -> Job
+        self.failed = {}  # path -> (size, mtime) of versions that failed, retried only once changed
+        self._next_rescan = 0
+        self._held_back = False
+
+    def _open_watch(self):
+        try:
+            watch = InotifyWatch(self.recordings_dir)
+            print(f"👀 Watching {self.recordings_dir} (inotify)")
+            return watch
+        except (OSError, AttributeError) as e:
+            print(f"⚠️  inotify unavailable ({e}), rescanning every {self.rescan_seconds:.0f}s")
+            return PollingWatch()
+
+    def notice(self, path):
+        """
+        Track a possibly new or growing file until it settles
+        """
+        if not path.lower().endswith(tuple(SUPPORTED_FORMATS)):
+            return
+        path = os.path.abspath(path)
+        if path in self.submitted or path in self.waiting:
+            return
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.pending.pop(path, None)
+            return
+        previous = self.pending.get(path)
+        if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+            self.pending[path] = (stat.st_size, stat.st_mtime, time.monotonic())
+
+    def settle(self):
+        """
+        Move files that stopped changing from `pending` to `waiting`
+        """
+        now = time.monotonic()
+        for path, (size, mtime, since) in list(self.pending.items()):
+            self.notice(path)
+            if path not in self.pending or self.pending[path][2] != since:
+                continue
+            if now - since < self.settle_seconds or size == 0:
+                continue
+            del self.pending[path]
+            if self.failed.get(path) == (size, mtime) or self.manifest.is_processed(path, self.output_dir):
+                continue
+            self.waiting.append(path)
+
+    def submit_waiting(self):
+        """
+        Hand waiting files to the job queue until it is full
+        """
+        while self.waiting:
+            path = self.waiting[0]
+            try:
+                self.submitted[path] = self.jobs.submit(path, callback_url=self.callback_url)
+            except QueueFullError:
+                if not self._held_back:
+                    print(f"⏸️  Queue full, holding {len(self.waiting)} recording(s) back")
+                    self._held_back = True
+                return
+            self.waiting.popleft()
+            self._held_back = False
+
+    def collect(self):
+        """
+        Record finished jobs in the manifest
+        """
+        for path, job in list(self.submitted.items()):
+            if not job.done:
+                continue
+            del self.submitted[path]
+            if not os.path.exists(path):
+                continue
+            if job.status == 'completed':
+                metadata = job.result['metadata']
+                self.manifest.record(
+                    path,
+                    status='success',
+                    output=job.outputs[0] if job.outputs else None,
+                    duration=metadata['duration'],
+                    cached=metadata.get('cached', False)
+                )
+            else:
+                self.manifest.record(path, status='failed', error=job.error)
+                stat = os.stat(path)
+                self.failed[path] = (stat.st_size, stat.st_mtime)
+
+    def poll_once(self):
+        """
+        One pass: wait for events (or a rescan), then settle, submit and collect
+        """
+        now = time.monotonic()
+        timeout = max(0.0, self._next_rescan - now)
+        if self.pending:
+            timeout = min(timeout, self.settle_seconds / 2)
+        if self.submitted:
+            timeout = min(timeout, 1.0)
+
+        names = self.watch.read(timeout)
+        if names is None or time.monotonic() >= self._next_rescan:
+            for path in find_recordings(self.recordings_dir):
+                self.notice(path)
+            self._next_rescan = time.monotonic() + self.rescan_seconds
+        else:
+            for name in names:
+                self.notice(os.path.join(self.recordings_dir, name))
+
+        self.collect()
+        self.settle()
+        self.submit_waiting()
+
+    def run(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.jobs.start()
+        print(f"✅ Watcher ready: settle {self.settle_seconds:.0f}s, queue {self.queue_size}")
+        try:
+            while True:
+                self.poll_once()
+        except KeyboardInterrupt:
+            print(f"\n🛑 Stopping, finishing {len(self.submitted)} queued recording(s)...")
+        finally:
+            self.watch.close()
+            self.jobs.stop()
+            self.collect()
+
+
+if __name__ == "__main__":
+    from transcriber import AudioTranscriber
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recordings-dir', default=RECORDINGS_DIR)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--settle', type=float, default=WATCH_SETTLE_SECONDS, help='Seconds a file must stay unchanged')
+    parser.add_argument('--rescan', type=float, default=WATCH_RESCAN_SECONDS, help='Seconds between full rescans')
+    parser.add_argument('--queue-size', type=int, default=WATCH_QUEUE_SIZE)
+    parser.add_argument('--callback-url', default=WATCH_CALLBACK_URL, help='POSTed each finished recording')
+    parser.add_argument('--manifest', default=BATCH_MANIFEST)
+    parser.add_argument('--poll', action='store_true', help='Rescan only, without inotify')
+    args = parser.parse_args()
+
+    transcriber = AudioTranscriber(whisper_model=WHISPER_MODEL, hf_token=HF_TOKEN)
+    if WARMUP_ENABLED:
+        transcriber.warm_up()
+
+    RecordingWatcher(
+        transcriber,
+        recordings_dir=args.recordings_dir,
+        output_dir=args.output_dir,
+        settle_seconds=args.settle,
+        rescan_seconds=args.rescan,
+        queue_size=args.queue_size,
+        callback_url=args.callback_url,
+        manifest_path=args.manifest,
+        use_inotify=not args.poll
+    ).run()
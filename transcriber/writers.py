@@ -0,0 +1,165 @@
+import gzip
+import json
+import mmap
+import os
+
+from config import *
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj, indent=False):
+    """
+    JSON bytes, compact unless `indent`, through orjson when it is installed
+    """
+    if orjson:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, option=option | orjson.OPT_INDENT_2 if indent else option)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def to_columns(conversation):
+    """
+    Conversation as one array per field instead of one dict per turn
+
+    Speakers are stored once in `speakers` and referenced by index, so
+    long calls don't repeat every key and label thousands of times.
+    """
+    speakers = list(dict.fromkeys(turn['speaker'] for turn in conversation))
+    index = {speaker: i for i, speaker in enumerate(speakers)}
+    keys = list(dict.fromkeys(key for turn in conversation for key in turn))
+    columns = {key: [turn.get(key) for turn in conversation] for key in keys}
+    if conversation:
+        columns['speaker'] = [index[speaker] for speaker in columns['speaker']]
+    return {'speakers': speakers, 'columns': columns}
+
+
+def from_columns(speakers, columns):
+    """
+    Turn dicts back from `to_columns` output
+    """
+    keys = list(columns)
+    turns = []
+    for values in zip(*(columns[key] for key in keys)):
+        turn = dict(zip(keys, values))
+        turn['speaker'] = speakers[turn['speaker']]
+        turns.append(turn)
+    return turns
+
+
+def write_json(path, conversation, metadata):
+    # Indented for people reading it; orjson makes that nearly free
+    with open(path, 'wb') as f:
+        f.write(dumps({'metadata': metadata, 'conversation': conversation}, indent=True))
+
+
+def write_ndjson_gz(path, conversation, metadata):
+    # Metadata first, then one turn per line, so readers can stream the turns
+    lines = [dumps({'metadata': metadata})]
+    lines.extend(dumps(turn) for turn in conversation)
+    with gzip.open(path, 'wb', compresslevel=TRANSCRIPT_GZIP_LEVEL) as f:
+        f.write(b'\n'.join(lines) + b'\n')
+
+
+def write_columnar(path, conversation, metadata):
+    with open(path, 'wb') as f:
+        f.write(dumps({'metadata': metadata, **to_columns(conversation)}))
+
+
+# Format name -> (file suffix replacing '.txt', writer)
+WRITERS = {
+    'json': ('.json', write_json),
+    'ndjson.gz': ('.ndjson.gz', write_ndjson_gz),
+    'columnar': ('.columns.json', write_columnar)
+}
+
+# Older format names still accepted in TRANSCRIPT_FORMATS
+FORMAT_ALIASES = {'orjson': 'json'}
+
+
+def transcript_path(output_file, fmt):
+    suffix, _ = WRITERS[FORMAT_ALIASES.get(fmt, fmt)]
+    base = output_file[:-4] if output_file.endswith('.txt') else output_file
+    return base + suffix
+
+
+def write_transcript(output_file, conversation, metadata, fmt):
+    """
+    Write a transcript next to `output_file` (the .txt path) in format `fmt`
+    """
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown transcript format '{fmt}', expected one of {', '.join(WRITERS)}")
+    path = transcript_path(output_file, fmt)
+    WRITERS[fmt][1](path, conversation, metadata)
+    return path
+
+
+def find_transcript(output_file):
+    """
+    The first transcript saved for `output_file` in any format, or None
+    """
+    for fmt in WRITERS:
+        path = transcript_path(output_file, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _load_mapped(path):
+    # Parse straight from the page cache; orjson reads the mapping without a copy
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty transcript: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return loads(memoryview(mapped)) if orjson else json.loads(mapped.read())
+
+
+def iter_turns(path):
+    """
+    Conversation turns of a saved transcript, one at a time
+
+    NDJSON is streamed line by line, so only one turn is decoded at a
+    time; JSON and columnar files are memory-mapped and parsed once.
+    """
+    if path.endswith('.ndjson.gz'):
+        with gzip.open(path, 'rb') as f:
+            next(f, None)  # metadata
+            for line in f:
+                if line.strip():
+                    yield loads(line)
+        return
+
+    data = _load_mapped(path)
+    if 'columns' in data:
+        yield from from_columns(data['speakers'], data['columns'])
+    else:
+        yield from data['conversation']
+
+
+def load_metadata(path):
+    if path.endswith('.ndjson.gz'):
+        with gzip.open(path, 'rb') as f:
+            return loads(f.readline())['metadata']
+    return _load_mapped(path)['metadata']
+
+
+def load_transcript(path):
+    """
+    {'metadata': ..., 'conversation': [...]} from a transcript in any format
+    """
+    if path.endswith('.ndjson.gz'):
+        return {'metadata': load_metadata(path), 'conversation': list(iter_turns(path))}
+    data = _load_mapped(path)
+    if 'columns' in data:
+        return {'metadata': data['metadata'], 'conversation': from_columns(data['speakers'], data['columns'])}
+    return data
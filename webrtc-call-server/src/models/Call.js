@@ -42,7 +42,21 @@ const callSchema = new mongoose.Schema({
     metadata: {
       duration: Number,
       language: String,
-      processedAt: Date
+      processedAt: Date,
+      // Precomputed by the transcriber, so dashboards don't have to scan conversations
+      analytics: {
+        agentTalkRatio: Number,
+        customerTalkRatio: Number,
+        speechSeconds: Number,
+        silenceSeconds: Number,
+        overlapSeconds: Number,
+        deadAirSeconds: Number,
+        deadAirCount: Number,
+        interruptions: Number,
+        longestMonologueSeconds: Number,
+        wordsPerMinute: Number,
+        speakers: mongoose.Schema.Types.Mixed // Per-speaker talk time, ratio, words per minute, interruptions
+      }
     },
     error: String
   },
@@ -58,6 +72,8 @@ const callSchema = new mongoose.Schema({
   }
 });
 
+callSchema.index({ 'transcription.metadata.analytics.agentTalkRatio': 1 });
+
 // Calculate duration before saving
 callSchema.pre('save', function (next) {
   if (this.endTime && this.startTime) {
@@ -63,6 +63,21 @@ class LLMAnalysisService {
     }).join('\n');
   }
 
+  /**
+   * Talk-time figures measured by the transcriber, for the prompt
+   */
+  formatCallAnalytics(analytics) {
+    if (!analytics || analytics.agentTalkRatio == null) {
+      return '';
+    }
+    const percent = ratio => `${Math.round((ratio || 0) * 100)}%`;
+    return `- Talk ratio: Agent ${percent(analytics.agentTalkRatio)}, Customer ${percent(analytics.customerTalkRatio)}
+- Dead air: ${analytics.deadAirCount} pauses, ${analytics.deadAirSeconds}s in total
+- Interruptions: ${analytics.interruptions}
+- Longest monologue: ${analytics.longestMonologueSeconds}s
+`;
+  }
+
   formatTime(seconds) {
     const mins = Math.floor(seconds / 60);
     const secs = Math.floor(seconds % 60);
@@ -110,7 +125,7 @@ Call Information:
 - Customer: ${callMetadata.customer?.name || 'Unknown'}
 - Duration: ${callMetadata.duration || 0} seconds
 - Date: ${callMetadata.startTime}
-
+${this.formatCallAnalytics(callMetadata.transcription?.metadata?.analytics)}
 Transcript:
 ${transcript}
 
@@ -9,6 +9,10 @@ class TranscriptionService {
     constructor() {
         // FastAPI server URL
         this.apiUrl = process.env.TRANSCRIPTION_API_URL || 'http://localhost:8000';
+        this.pollIntervalMs = parseInt(process.env.TRANSCRIPTION_POLL_INTERVAL_MS || '5000', 10);
+        this.maxWaitMs = parseInt(process.env.TRANSCRIPTION_MAX_WAIT_MS || '3600000', 10);
+        // Recordings with the agent on the left channel and the customer on the right skip diarization
+        this.dualChannel = process.env.TRANSCRIPTION_DUAL_CHANNEL === 'true';
         this.analysisService = new LLMAnalysisService();
     }
 
@@ -20,13 +24,14 @@ class TranscriptionService {
             console.log(`🎤 Starting transcription for call: ${callId}`);
 
             // Update status to processing
-            await Call.findOneAndUpdate(
+            const call = await Call.findOneAndUpdate(
                 { callId },
                 { 'transcription.status': 'processing' }
             );
 
-            // Call FastAPI endpoint
-            const result = await this.callTranscriptionAPI(audioFilePath);
+            // Call FastAPI endpoint; an enrolled agent is recognised by voiceprint
+            const agentId = call && call.agent ? String(call.agent) : null;
+            const result = await this.callTranscriptionAPI(audioFilePath, agentId);
 
             // Save transcription to database
             await this.saveTranscription(callId, result);
@@ -56,26 +61,33 @@ class TranscriptionService {
 
     /**
      * Call FastAPI transcription endpoint (using file path)
+     *
+     * Submits a background job and polls it, so long recordings are not
+     * bound by a single HTTP request timeout.
      */
-    async callTranscriptionAPI(audioFilePath) {
+    async callTranscriptionAPI(audioFilePath, agentId = null) {
         try {
-            console.log(`📡 Calling transcription API...`);
+            console.log(`📡 Submitting transcription job...`);
 
-            // Use the path-based endpoint (faster, no file upload)
-            const response = await axios.post(
-                `${this.apiUrl}/transcribe-from-path`,
-                { file_path: audioFilePath },
+            const submitResponse = await axios.post(
+                `${this.apiUrl}/jobs`,
+                {
+                    file_path: audioFilePath,
+                    channels: this.dualChannel,
+                    agent_id: agentId,
+                    // Python cancels the job itself once we would stop waiting for it
+                    timeout_seconds: Math.ceil(this.maxWaitMs / 1000)
+                },
                 {
                     headers: { 'Content-Type': 'application/json' },
-                    timeout: 300000 // 5 minutes timeout
+                    timeout: 30000
                 }
             );
 
-            if (response.data.status === 'success') {
-                return response.data;
-            } else {
-                throw new Error('Transcription failed');
-            }
+            const jobId = submitResponse.data.job_id;
+            console.log(`🧾 Transcription job queued: ${jobId}`);
+
+            return await this.waitForJob(jobId);
 
         } catch (error) {
             if (error.response) {
@@ -90,6 +102,39 @@ class TranscriptionService {
         }
     }
 
+    /**
+     * Poll a transcription job until it completes, fails or times out
+     */
+    async waitForJob(jobId) {
+        const deadline = Date.now() + this.maxWaitMs;
+
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, this.pollIntervalMs));
+
+            const response = await axios.get(
+                `${this.apiUrl}/jobs/${jobId}/result`,
+                {
+                    timeout: 30000,
+                    validateStatus: status => status === 200 || status === 202
+                }
+            );
+
+            if (response.status === 202) {
+                continue;
+            }
+
+            if (response.data.status === 'success') {
+                return response.data;
+            } else {
+                throw new Error('Transcription failed');
+            }
+        }
+
+        // Stop the work too, so it doesn't keep a model busy for nobody
+        await axios.delete(`${this.apiUrl}/jobs/${jobId}`, { timeout: 10000 }).catch(() => {});
+        throw new Error(`Transcription job ${jobId} did not finish in time`);
+    }
+
     /**
      * Alternative: Call FastAPI with file upload
      */
@@ -97,12 +142,17 @@ class TranscriptionService {
         try {
             const formData = new FormData();
             formData.append('file', fs.createReadStream(audioFilePath));
+            formData.append('channels', String(this.dualChannel));
 
             const response = await axios.post(
                 `${this.apiUrl}/transcribe`,
                 formData,
                 {
-                    headers: formData.getHeaders(),
+                    headers: {
+                        ...formData.getHeaders(),
+                        // Python stops transcribing when this request would time out
+                        'X-Request-Timeout': '300'
+                    },
                     timeout: 300000,
                     maxContentLength: Infinity,
                     maxBodyLength: Infinity
@@ -138,12 +188,47 @@ class TranscriptionService {
                 'transcription.metadata': {
                     duration: transcriptionData.metadata.duration,
                     language: transcriptionData.metadata.language,
-                    processedAt: new Date()
+                    processedAt: new Date(),
+                    analytics: this.formatAnalytics(transcriptionData.metadata.analytics)
                 }
             }
         );
     }
 
+    /**
+     * Flatten the transcriber's conversation analytics into indexable fields
+     */
+    formatAnalytics(analytics) {
+        if (!analytics) {
+            return undefined;
+        }
+
+        const speakers = {};
+        for (const [speaker, seconds] of Object.entries(analytics.talk_seconds)) {
+            speakers[speaker] = {
+                talkSeconds: seconds,
+                talkRatio: analytics.talk_ratio[speaker],
+                wordsPerMinute: analytics.words_per_minute[speaker],
+                interruptions: analytics.interruptions[speaker]
+            };
+        }
+        const total = (counts) => Object.values(counts).reduce((sum, n) => sum + n, 0);
+
+        return {
+            agentTalkRatio: analytics.talk_ratio.Agent,
+            customerTalkRatio: analytics.talk_ratio.Customer,
+            speechSeconds: analytics.speech_seconds,
+            silenceSeconds: analytics.silence_seconds,
+            overlapSeconds: analytics.overlap_seconds,
+            deadAirSeconds: analytics.dead_air.seconds,
+            deadAirCount: analytics.dead_air.count,
+            interruptions: total(analytics.interruptions),
+            longestMonologueSeconds: analytics.longest_monologue ? analytics.longest_monologue.seconds : 0,
+            wordsPerMinute: analytics.speech_seconds ? Math.round(analytics.words / analytics.speech_seconds * 600) / 10 : 0,
+            speakers
+        };
+    }
+
     /**
      * Get transcription for a call
      */